@@ -9,7 +9,7 @@ import { TextInput, Button, Text, } from 'react-native-paper';
 import { useNavigation } from '@react-navigation/native';
 import { NativeStackNavigationProp } from '@react-navigation/native-stack';
 import { inputTheme, styles, selectedColors } from './app_styles.styles';
-import { doc, setDoc } from 'firebase/firestore';
+import { doc, setDoc, serverTimestamp } from 'firebase/firestore';
 import { FIREBASE_DB } from '../../FirebaseConfig';
 import { getAuth } from 'firebase/auth';
 
@@ -207,7 +207,8 @@ const ProfileSetup = () => {
 
     try{
       const userDocRef = doc(FIREBASE_DB, 'userProfiles', user.uid);
-      await setDoc(userDocRef, {responses: finalResponses}, {merge: true});
+      // updatedAt lets export_profiles.py export only the profiles changed since its last run
+      await setDoc(userDocRef, {responses: finalResponses, updatedAt: serverTimestamp()}, {merge: true});
       alert('Success, Your Answers have been saved!');
     }
     catch (error) {
@@ -37,6 +37,12 @@ type City = {
 // Define the type for Home screen navigation prop
 type RecommendationScreenProp = NativeStackNavigationProp<RootParamList, 'Recommendations'>;
 
+const BACKEND_URL = 'https://capstone-team-generated-group30-project.onrender.com';
+
+// Cards are fetched a page at a time; the next page is requested once the queue runs low
+const PAGE_SIZE = 5;
+const PREFETCH_WHEN_LEFT = 2;
+
 // Cute spinning globe loader
 const GlobeLoader = () => {
   const spinAnim = useRef(new Animated.Value(0)).current;
@@ -83,6 +89,13 @@ const Recommendations = () => {
   const [currentCity, setCurrentCity] = useState<Recommendation | null>(null);
   const currentCityRef = useRef<Recommendation | null>(null);
 
+  // Prefetched cards, the cursor for the next page (null once every city has been handed out),
+  // the page request in flight, and the profile answers (read once per screen)
+  const queueRef = useRef<Recommendation[]>([]);
+  const cursorRef = useRef<string | null | undefined>(undefined);
+  const pageRequestRef = useRef<Promise<void> | null>(null);
+  const profileRef = useRef<Awaited<ReturnType<typeof getUserProfileAnswers>> | null>(null);
+
   useEffect(() => {
     currentCityRef.current = currentCity;
   }, [currentCity]);
@@ -184,10 +197,7 @@ const Recommendations = () => {
         const user = auth.currentUser;
         if (!user) throw new Error("No user");
 
-        const city = await fetchNextCity(user.uid);
-        const extra = await fetchCityInfo(city.city_name, city.country);
-        setCurrentCity({ ...city, ...extra });
-        console.log(currentCity)
+        await showNextCity(user.uid);
 
       } catch (err) {
         console.error(err);
@@ -210,12 +220,10 @@ const Recommendations = () => {
     }
 
     try {
-      const userDocRef = doc(FIREBASE_DB, 'userFavorites', user.uid);
-      await setDoc(userDocRef, {[`${cityId}`]: city}, {merge: true});
-      // await sendSwipe(user.uid, cityId, true); // Update backend with the swipe
-      const nextCity = await fetchNextCity(user.uid);
-      const extra = await fetchCityInfo(nextCity.city_name, nextCity.country);
-      setCurrentCity({ ...nextCity, ...extra });
+      // The next card is already prefetched; saving the swipe happens off the critical path
+      const saved = saveSwipe(user.uid, 'userFavorites', cityId, city, true);
+      await showNextCity(user.uid);
+      await saved;
     }
     catch (error) {
       console.error('Encountered an error while saving your favorites:', error);
@@ -233,12 +241,10 @@ const Recommendations = () => {
     }
 
     try{
-      const userDocRef = doc(FIREBASE_DB, 'userDislikes', user.uid);
-      await setDoc(userDocRef, {[`${cityId}`]: city}, {merge: true});
-      // await sendSwipe(user.uid, cityId, false); // Update backend with the swipe
-      const nextCity = await fetchNextCity(user.uid);
-      const extra = await fetchCityInfo(nextCity.city_name, nextCity.country);
-      setCurrentCity({ ...nextCity, ...extra });
+      // The next card is already prefetched; saving the swipe happens off the critical path
+      const saved = saveSwipe(user.uid, 'userDislikes', cityId, city, false);
+      await showNextCity(user.uid);
+      await saved;
     }
     catch (error) {
       console.error('Encountered an error while saving your dislikes:', error);
@@ -267,32 +273,81 @@ async function getUserProfileAnswers(userId: string) {
   };
 }
 
-  async function fetchNextCity(userId: string) {
-    // You need to supply the same profile answers you used to generate recs.
-    // If you stored them in Firestore, read them here; for now assume you have them.
-    const profile = await getUserProfileAnswers(userId);
+  async function fetchNextPage(userId: string) {
+    // The backend needs the same profile answers that were used to generate recs
+    if (!profileRef.current) {
+      profileRef.current = await getUserProfileAnswers(userId);
+    }
 
-    const res = await fetch('https://capstone-team-generated-group30-project.onrender.com/next_city', {
+    const res = await fetch(`${BACKEND_URL}/next_cities`, {
       method: 'POST',
       headers: {'Content-Type': 'application/json'},
       body: JSON.stringify({
         user_id: userId,
-        ...profile,
+        ...profileRef.current,
+        n: PAGE_SIZE,
+        cursor: cursorRef.current ?? undefined,
+        descriptions: true,
       }),
     });
 
-    if (!res.ok) throw new Error('Failed to fetch next city');
+    if (!res.ok) throw new Error('Failed to fetch next cities');
     const json = await res.json();
-    return json.city as Recommendation;
+
+    // Cards the backend had no description for are looked up here, all at once
+    const cities: Recommendation[] = await Promise.all(
+      json.cities.map(async (city: Recommendation) =>
+        city.description ? city : { ...city, ...(await fetchCityInfo(city.city_name, city.country)) }
+      )
+    );
+    queueRef.current.push(...cities);
+    cursorRef.current = json.cursor as string | null;
+  }
+
+  function requestPage(userId: string) {
+    // At most one page request in flight; callers share it
+    if (!pageRequestRef.current) {
+      pageRequestRef.current = fetchNextPage(userId).finally(() => {
+        pageRequestRef.current = null;
+      });
+    }
+    return pageRequestRef.current;
   }
 
-  // async function sendSwipe(userId: string, cityId: string, liked: boolean) {
-  //   await fetch('https://capstone-team-generated-group30-project.onrender.com/swipe', {
-  //     method: 'POST',
-  //     headers: {'Content-Type': 'application/json'},
-  //     body: JSON.stringify({ user_id: userId, city_id: cityId, liked }),
-  //   });
-  // }
+  async function showNextCity(userId: string) {
+    if (queueRef.current.length === 0 && cursorRef.current !== null) {
+      await requestPage(userId);
+    }
+
+    const next = queueRef.current.shift() ?? null;
+    setCurrentCity(next); // null: every city has been swiped
+
+    if (queueRef.current.length <= PREFETCH_WHEN_LEFT && cursorRef.current !== null) {
+      requestPage(userId).catch(err => console.error('Prefetch failed:', err));
+    }
+  }
+
+  async function saveSwipe(userId: string, collection: string, cityId: string, city: City, liked: boolean) {
+    // The backend updates our recommendations right away and batches the Firestore write
+    try {
+      const response = await sendSwipe(userId, cityId, liked, city);
+      if (response.ok) return;
+    }
+    catch (error) {
+      console.error('Backend swipe failed, saving directly:', error);
+    }
+
+    const userDocRef = doc(FIREBASE_DB, collection, userId);
+    await setDoc(userDocRef, {[`${cityId}`]: city}, {merge: true});
+  }
+
+  async function sendSwipe(userId: string, cityId: string, liked: boolean, city: City) {
+    return fetch(`${BACKEND_URL}/swipe`, {
+      method: 'POST',
+      headers: {'Content-Type': 'application/json'},
+      body: JSON.stringify({ user_id: userId, city_id: cityId, liked, city }),
+    });
+  }
 
   const swipeFunction = (direction: 'left' | 'right') => {
     if (!currentCityRef.current) return;
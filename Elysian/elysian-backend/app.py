@@ -1,85 +1,231 @@
-from flask import Flask, request, jsonify
+from flask import Flask, Response, g, request, jsonify
 import numpy as np
-import pandas as pd
-import tensorflow as tf
-import joblib
-from numpy.linalg import norm
-import firebase_admin
-from firebase_admin import credentials, firestore
 import os
 import json
+import time
+import base64
+import atexit
+import cProfile
+import random
+import tempfile
+import threading
+import uuid
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+
+import metrics
+from metrics import span
+
+from artifacts import ArtifactManager
+from city_content_store import CityContentStore
+from city_info import CityInfoCache
+from city_store import CityStore
+from encoding import MULTI_HOT_FEATURES, encode_user_inputs_batch, encoder_file, run_user_encoder
+from feedback import FeedbackCache, FirestoreFeedbackBackend, InMemoryFeedbackBackend
+from interpreter_pool import InterpreterPool
+from precomputed_store import PrecomputedStore, result_version
+from profile_cache import ProfileCache, profile_key
+from retrieval import INDEX_FILES, load_index
+from scoring import ScoringEngine, masked_top_k, top_k_per_row
+from swipe_writer import SwipeWriter
+from user_state import UserState, UserStateStore
 
 app = Flask(__name__)
 
+# SERVING_MODE=lite skips tensorflow/pandas/scikit-learn entirely: the encoder
+# runs on tflite_runtime and the label encoders come from label_mappings.json
+SERVING_MODE = os.environ.get("SERVING_MODE", "full")
+
 # ---------------------------------------------------------
-# Firebase init
+# Firebase init + feedback cache
 # ---------------------------------------------------------
-
-service_account_info = json.loads(os.environ["FIREBASE_SERVICE_ACCOUNT"])
-# service_account_info = "elysianproject-2b9ce-firebase-adminsdk-fbsvc-542db33246.json"
-
-cred = credentials.Certificate(service_account_info)
-firebase_admin.initialize_app(cred)
-db = firestore.client()
+# FEEDBACK_BACKEND=memory swaps Firestore for an in-process fake (local runs / tests)
+FEEDBACK_BACKEND = os.environ.get("FEEDBACK_BACKEND", "firestore")
+
+if FEEDBACK_BACKEND == "memory":
+    feedback_backend = InMemoryFeedbackBackend(latency=float(os.environ.get("FEEDBACK_FAKE_LATENCY", "0")))
+elif os.environ.get("FIRESTORE_EMULATOR_HOST"):
+    # Local Firestore emulator: the client picks up the host from the env, no credentials needed
+    from google.auth.credentials import AnonymousCredentials
+    from google.cloud import firestore as gcloud_firestore
+
+    db = gcloud_firestore.Client(
+        project=os.environ.get("FIRESTORE_PROJECT", "demo-elysian"),
+        credentials=AnonymousCredentials(),
+    )
+    feedback_backend = FirestoreFeedbackBackend(db)
+else:
+    import firebase_admin
+    from firebase_admin import credentials, firestore
+
+    service_account_info = json.loads(os.environ["FIREBASE_SERVICE_ACCOUNT"])
+    # service_account_info = "elysianproject-2b9ce-firebase-adminsdk-fbsvc-542db33246.json"
+
+    cred = credentials.Certificate(service_account_info)
+    firebase_admin.initialize_app(cred)
+    db = firestore.client()
+    feedback_backend = FirestoreFeedbackBackend(db)
+
+feedback_cache = FeedbackCache(
+    feedback_backend,
+    ttl=float(os.environ.get("FEEDBACK_CACHE_TTL", "30")),
+    max_users=int(os.environ.get("FEEDBACK_CACHE_SIZE", "10000")),
+)
+
+# Feedback reads run here so /next_city can encode the profile while Firestore answers
+feedback_executor = ThreadPoolExecutor(
+    max_workers=int(os.environ.get("FEEDBACK_IO_THREADS", "8")),
+    thread_name_prefix="feedback-io",
+)
+FEEDBACK_TIMEOUT = float(os.environ.get("FEEDBACK_TIMEOUT", "10"))
 
 
 # ---------------------------------------------------------
-# Load encoders
+# Model runtime for this serving mode
 # ---------------------------------------------------------
-le_origin = joblib.load("le_origin.pkl")
-le_fav = joblib.load("le_fav.pkl")
-mlbs = joblib.load("mlbs.pkl")   # dict of MultiLabelBinarizers
+if SERVING_MODE == "lite":
+    from lite_serving import load_interpreter_class, load_lite_encoders
 
-# ---------------------------------------------------------
-# Load city data + precomputed embeddings
-# ---------------------------------------------------------
-cities_df = pd.read_csv("../../Datasets/cities.csv")
-city_vectors = np.load("city_vectors.npy")   # shape: (num_cities, embedding_dim)
+    Interpreter = load_interpreter_class()
 
-# Map city_id -> index in cities_df / city_vectors
-city_id_to_idx = {
-    row["city_id"]: idx
-    for idx, row in cities_df.iterrows()
-}
+    def load_encoders(bundle):
+        return load_lite_encoders(bundle.file("label_mappings.json"), bundle.file("vacation_types.json"))
+else:
+    import joblib
+    import tensorflow as tf
 
+    Interpreter = tf.lite.Interpreter
 
-# ---------------------------------------------------------
-# Load user-only TFLite model
-# ---------------------------------------------------------
-interpreter = tf.lite.Interpreter(model_path="user_encoder.tflite")
-interpreter.allocate_tensors()
+    def load_encoders(bundle):
+        le_origin = joblib.load(bundle.file("le_origin.pkl"))
+        le_fav = joblib.load(bundle.file("le_fav.pkl"))
+        mlbs = joblib.load(bundle.file("mlbs.pkl"))   # dict of MultiLabelBinarizers
+        return le_origin, le_fav, mlbs
 
-input_details = interpreter.get_input_details()
-# for i, d in enumerate(input_details):
-#     print(i, d["name"], d["shape"], d["dtype"])
+# One interpreter per concurrent request; size this to gunicorn's --threads
+INTERPRETER_POOL_SIZE = int(os.environ.get("INTERPRETER_POOL_SIZE", os.environ.get("GUNICORN_THREADS", "4")))
+INTERPRETER_TIMEOUT = float(os.environ.get("INTERPRETER_TIMEOUT", "10"))
 
-output_details = interpreter.get_output_details()
+# float32 (default), dynamic, float16 or int8: which user encoder export to load
+# from the bundle; compare them with bench_encoder.py before switching
+USER_ENCODER = os.environ.get("USER_ENCODER", "float32")
 
 # Expecting:
-# input 0 → origin_enc (float32, shape [1,1])
-# input 1 → fav_enc (float32, shape [1,1])
-# input 2 → multi_hot (float32, shape [1, multi_dim])
+# input 0 → multi_hot (float32, shape [N, multi_dim])
+# input 1 → origin_enc (float32, shape [N, 1])
+# input 2 → fav_enc (float32, shape [N, 1])
 U_MULTI_IDX = 0
 U_ORIGIN_IDX = 1
 U_FAV_IDX = 2
 
+ALPHA = 1.0
+BETA = 0.7
+GAMMA = 0.7
+
+# RETRIEVAL_INDEX=exact scans every city; =ivf only scores the clusters nearest
+# the user (build the index offline with build_index.py and ship it in the bundle);
+# =int8/=float16 scan a quantized copy and re-rank the best RETRIEVAL_RERANK exactly
+RETRIEVAL_INDEX = os.environ.get("RETRIEVAL_INDEX", "exact")
+RETRIEVAL_NPROBE = int(os.environ.get("RETRIEVAL_NPROBE", "0")) or None
+RETRIEVAL_RERANK = int(os.environ.get("RETRIEVAL_RERANK", "0")) or None
+
+
+# ---------------------------------------------------------
+# Serving state: everything loaded from one artifact bundle
+# ---------------------------------------------------------
+class ModelState:
+    """
+    Encoders, city data, interpreters and indexes for one bundle version.
+    Requests grab `current_state()` once and use only that object, so a hot
+    swap to a new bundle never mixes artifacts from two versions.
+    """
+
+    def __init__(self, bundle):
+        self.version = bundle.version
+
+        self.le_origin, self.le_fav, self.mlbs = load_encoders(bundle)
+
+        # Memory-mapped: forked workers share these pages
+        self.city_vectors = bundle.load_array("city_vectors.npy")   # shape: (num_cities, embedding_dim)
+        self.cities = CityStore.from_bundle(bundle)   # row i describes city_vectors[i]
+
+        self.interpreter_pool = InterpreterPool(
+            bundle.read_bytes(encoder_file(USER_ENCODER)), INTERPRETER_POOL_SIZE, Interpreter
+        )
+        self._check_encoder()
+
+        self.scoring_engine = ScoringEngine(
+            self.city_vectors, alpha=ALPHA, beta=BETA, gamma=GAMMA,
+            unit_vectors=bundle.load_array("city_unit_vectors.npy"),
+        )
+        index_file = INDEX_FILES.get(RETRIEVAL_INDEX)
+        self.retrieval_index = load_index(
+            RETRIEVAL_INDEX, self.city_vectors,
+            path=os.environ.get("RETRIEVAL_INDEX_PATH") or (index_file and os.path.join(bundle.path, index_file)),
+            nprobe=RETRIEVAL_NPROBE, rerank=RETRIEVAL_RERANK,
+        )
+
+    def _check_encoder(self):
+        # Catch an encoder trained against different encoders or city vectors
+        multi_dim = sum(len(self.mlbs[feature].classes_) for feature in MULTI_HOT_FEATURES)
+        with self.interpreter_pool.checkout() as interpreter:
+            inputs = interpreter.get_input_details()
+            output = interpreter.get_output_details()[0]
+
+        if inputs[U_MULTI_IDX]["shape"][-1] != multi_dim:
+            raise ValueError("Encoder expects %d multi-hot columns, encoders produce %d"
+                             % (inputs[U_MULTI_IDX]["shape"][-1], multi_dim))
+        if output["shape"][-1] != self.city_vectors.shape[1]:
+            raise ValueError("Encoder outputs %d dims, city vectors have %d"
+                             % (output["shape"][-1], self.city_vectors.shape[1]))
+
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+ARTIFACT_ROOT = os.environ.get("ARTIFACT_ROOT", os.path.join(BASE_DIR, "artifacts"))
+
+artifact_manager = ArtifactManager(ARTIFACT_ROOT, ModelState)
+
+def invalidate_feedback(user_ids):
+    for user_id in user_ids:
+        feedback_cache.invalidate(user_id)
+
+
+# /swipe writes go through this buffer: committed to the feedback backend in
+# batches of SWIPE_BATCH_SIZE or every SWIPE_FLUSH_INTERVAL seconds. Whatever is
+# left at shutdown is committed, or spilled to SWIPE_SPILL_DIR and replayed on
+# the next start.
+swipe_writer = SwipeWriter(
+    feedback_backend,
+    max_batch=int(os.environ.get("SWIPE_BATCH_SIZE", "200")),
+    max_delay=float(os.environ.get("SWIPE_FLUSH_INTERVAL", "1.0")),
+    max_pending=int(os.environ.get("SWIPE_MAX_PENDING", "10000")),
+    spill_dir=os.environ.get("SWIPE_SPILL_DIR", os.path.join(BASE_DIR, "swipe_spill")),
+    on_commit=invalidate_feedback,
+)
+atexit.register(swipe_writer.close)
+
+
+def current_state():
+    return artifact_manager.current
+
 
 # ---------------------------------------------------------
 # Helper: Encode user profile into model-ready inputs
 # ---------------------------------------------------------
-def encode_user_inputs(data):
+def encode_user_inputs(data, state=None):
+    state = state or current_state()
+
     # Encode origin country
-    origin_enc = float(le_origin.transform([data["origin_country"]])[0])
+    origin_enc = float(state.le_origin.transform([data["origin_country"]])[0])
 
     # Encode favorite country visited
-    fav_enc = float(le_fav.transform([data["favorite_country_visited"]])[0])
+    fav_enc = float(state.le_fav.transform([data["favorite_country_visited"]])[0])
 
     # Encode multi-hot vector
     multi_hot_parts = []
 
-    for feature in ["vacation_types", "seasons", "budget", "place_type"]:
+    for feature in MULTI_HOT_FEATURES:
         values = data.get(feature, [])
-        mlb = mlbs[feature]
+        mlb = state.mlbs[feature]
         encoded = mlb.transform([values])[0]
         multi_hot_parts.append(encoded)
 
@@ -93,109 +239,409 @@ def encode_user_inputs(data):
 # ---------------------------------------------------------
 # Helper: Run user encoder TFLite model
 # ---------------------------------------------------------
-def get_user_embedding(origin_enc, fav_enc, multi_hot):
-    # Prepare tensors
-    origin_tensor = np.array([[origin_enc]], dtype=np.float32)
-    fav_tensor = np.array([[fav_enc]], dtype=np.float32)
-    multi_tensor = np.array([multi_hot], dtype=np.float32)
+def get_user_embedding(origin_enc, fav_enc, multi_hot, state=None):
+    state = state or current_state()
+
+    # Batch of one; see encoding.run_user_encoder for the tensor layout
+    with state.interpreter_pool.checkout(timeout=INTERPRETER_TIMEOUT) as interpreter:
+        user_vecs = run_user_encoder(
+            interpreter,
+            np.array([[origin_enc]], dtype=np.float32),
+            np.array([[fav_enc]], dtype=np.float32),
+            np.array([multi_hot], dtype=np.float32),
+            multi_idx=U_MULTI_IDX, origin_idx=U_ORIGIN_IDX, fav_idx=U_FAV_IDX,
+        )
 
-    # Correct order for user-only TFLite model
-    interpreter.set_tensor(input_details[U_MULTI_IDX]["index"], np.array([multi_hot], dtype=np.float32))
-    interpreter.set_tensor(input_details[U_ORIGIN_IDX]["index"], np.array([[origin_enc]], dtype=np.float32))
-    interpreter.set_tensor(input_details[U_FAV_IDX]["index"], np.array([[fav_enc]], dtype=np.float32))
+    # Output is the user embedding vector
+    user_vec = user_vecs[0]
+    return user_vec
 
 
-    interpreter.invoke()
+# ---------------------------------------------------------
+# Helper: profile -> embedding, memoized on the canonical profile
+# ---------------------------------------------------------
+profile_cache = ProfileCache(max_entries=int(os.environ.get("PROFILE_CACHE_SIZE", "4096")))
+
+# Cached embeddings and results belong to the bundle that produced them. Keys
+# also carry the bundle version, so a request still finishing on the old bundle
+# cannot repopulate the cache with stale entries after the clear.
+artifact_manager.listeners.append(lambda old, new: profile_cache.clear())
+
+# Embeddings + top-k written offline by precompute.py. Rows are keyed by bundle
+# version too, so after a bundle swap they simply stop matching until the job reruns.
+PRECOMPUTED_STORE = os.environ.get("PRECOMPUTED_STORE")
+precomputed = PrecomputedStore(PRECOMPUTED_STORE) if PRECOMPUTED_STORE else None
+
+
+def lookup_precomputed(key):
+    # Only rows embedded with the encoder variant we serve with (precompute.py --user-encoder)
+    return precomputed.get(result_version(key[0], USER_ENCODER), key[1]) if precomputed is not None else None
+
+
+def embed_profile(data, key=None, state=None):
+    state = state or current_state()
+    key = key or (state.version, profile_key(data))
+    user_vec = profile_cache.get_embedding(key)
+
+    if user_vec is None:
+        with span("precomputed_lookup"):
+            stored = lookup_precomputed(key)
+        if stored is not None:
+            user_vec = stored.embedding.copy()
+        else:
+            with span("encode"):
+                origin_enc, fav_enc, multi_hot = encode_user_inputs(data, state)
+            with span("invoke"):
+                user_vec = get_user_embedding(origin_enc, fav_enc, multi_hot, state)
+        profile_cache.put_embedding(key, user_vec)
 
-    # Output is the user embedding vector
-    user_vec = interpreter.get_tensor(output_details[0]["index"])[0]
     return user_vec
 
+
 # ---------------------------------------------------------
-# Firebase helpers: likes/dislikes
+# Batch scoring: many profiles, one invoke per batch
 # ---------------------------------------------------------
-def get_user_feedback(user_id):
-    fav_doc = db.collection("userFavorites").document(user_id).get()
-    dislike_doc = db.collection("userDislikes").document(user_id).get()
+RECOMMEND_BATCH_SIZE = int(os.environ.get("RECOMMEND_BATCH_SIZE", "256"))
 
-    liked = list(fav_doc.to_dict().keys()) if fav_doc.exists else []
-    disliked = list(dislike_doc.to_dict().keys()) if dislike_doc.exists else []
 
-    return liked, disliked
+def recommend_batch(profiles, k=5):
+    """Top-k cities for each profile, in the same order as `profiles`."""
+    state = current_state()
+    results = []
 
-def adjust_user_embedding(user_vec, liked_idx, disliked_idx, lr=0.1):
-    if liked_idx:
-        liked_vecs = city_vectors[liked_idx]
-        user_vec += lr * np.mean(liked_vecs, axis=0)
+    for start in range(0, len(profiles), RECOMMEND_BATCH_SIZE):
+        chunk = profiles[start:start + RECOMMEND_BATCH_SIZE]
+        keys = [(state.version, profile_key(p)) for p in chunk]
 
-    if disliked_idx:
-        disliked_vecs = city_vectors[disliked_idx]
-        user_vec -= lr * np.mean(disliked_vecs, axis=0)
+        # Only run the encoder for profiles we have not embedded before
+        cached = [profile_cache.get_embedding(key) for key in keys]
+        missing = [i for i, vec in enumerate(cached) if vec is None]
+
+        if missing:
+            with span("encode"):
+                origin, fav, multi_hot = encode_user_inputs_batch(
+                    [chunk[i] for i in missing], state.le_origin, state.le_fav, state.mlbs
+                )
+            with span("invoke"), state.interpreter_pool.checkout(timeout=INTERPRETER_TIMEOUT) as interpreter:
+                new_vecs = run_user_encoder(
+                    interpreter, origin, fav, multi_hot,
+                    multi_idx=U_MULTI_IDX, origin_idx=U_ORIGIN_IDX, fav_idx=U_FAV_IDX,
+                )
+            for i, vec in zip(missing, new_vecs):
+                cached[i] = vec
+                profile_cache.put_embedding(keys[i], vec)
+
+        user_vecs = np.stack(cached)
+
+        # One matmul for the whole chunk: (num_cities, d) @ (d, N) -> (N, num_cities)
+        with span("scoring"):
+            scores = (state.city_vectors @ user_vecs.T).T
+            top_idx = top_k_per_row(scores, k)
+
+        with span("serialize"):
+            for row_scores, row_idx in zip(scores, top_idx):
+                results.append(state.cities.to_dicts(row_idx, row_scores[row_idx]))
+
+    return results
+
+
+# ---------------------------------------------------------
+# Per-user swipe state: base embedding + running feedback sums
+# ---------------------------------------------------------
+# USER_STATE_STORE=<path> keeps states in one SQLite file shared by all workers;
+# unset, each worker keeps its own in-memory LRU
+user_states = UserStateStore(
+    path=os.environ.get("USER_STATE_STORE") or None,
+    max_users=int(os.environ.get("USER_STATE_CACHE_SIZE", "10000")),
+)
+
+# States are rebuilt from Firestore after this many seconds, to pick up swipes
+# that reached Firestore without a /swipe call (0 = only on a miss). In-memory
+# states are per worker and miss swipes handled by other workers, so they resync
+# as often as the feedback cache expires; shared SQLite states see every swipe.
+USER_STATE_RESYNC = float(os.environ.get(
+    "USER_STATE_RESYNC", "3600" if user_states.path else os.environ.get("FEEDBACK_CACHE_TTL", "30")
+))
+
+
+def to_indices(city_ids, state=None):
+    return (state or current_state()).cities.indices(city_ids)
+
+
+def build_user_state(user_id, data, key, state):
+    """Full rebuild: one read of the user's likes/dislikes, folded into a UserState."""
+    # Swipes still buffered for Firestore; taken before the read so none falls in between
+    pending_liked, pending_disliked = swipe_writer.pending(user_id)
+
+    # Kick off the feedback read first; it overlaps with encoding + inference
+    feedback_future = feedback_cache.get_async(user_id, feedback_executor)
+    user_vec = embed_profile(data, key, state)
+    with span("feedback_wait"):
+        liked_ids, disliked_ids = feedback_future.result(timeout=FEEDBACK_TIMEOUT)
+    liked_ids = list(liked_ids) + pending_liked
+    disliked_ids = list(disliked_ids) + pending_disliked
+
+    user_states.rebuilds += 1
+    with span("user_state_build"):
+        return UserState.build(
+            state.version, key[1], user_vec,
+            to_indices(liked_ids, state), to_indices(disliked_ids, state),
+            state.city_vectors, state.scoring_engine.unit_vectors,
+        )
 
-    # Normalize to keep vector stable
-    user_vec = user_vec / (np.linalg.norm(user_vec) + 1e-8)
-    return user_vec
 
+def load_user_state(user_id, data, state):
+    """The user's state for this bundle and profile. Caller holds user_states.lock(user_id)."""
+    key = (state.version, profile_key(data))
+    user_state = user_states.get(user_id)
 
-def to_indices(city_ids):
-    return [city_id_to_idx[cid] for cid in city_ids if cid in city_id_to_idx]
+    if (user_state is None or user_state.version != state.version or
+            (USER_STATE_RESYNC and time.time() - user_state.synced_at > USER_STATE_RESYNC)):
+        user_state = build_user_state(user_id, data, key, state)
+        store_user_state(user_id, user_state, state)
+    elif user_state.profile_key != key[1]:
+        # Answers changed: new base embedding, same swipe history
+        user_state.base = embed_profile(data, key, state)
+        user_state.profile_key = key[1]
+        store_user_state(user_id, user_state, state)
+
+    return user_state
+
+
+def store_user_state(user_id, user_state, state):
+    """Write a rebuilt/re-embedded state, keeping swipes another worker stored since we read it."""
+    def merge(current):
+        if current is not None and current.version == user_state.version:
+            user_state.absorb(current, state.city_vectors, state.scoring_engine.unit_vectors)
+        return user_state
+
+    user_states.update(user_id, merge)
+
+
+def record_swipe(user_id, city_id, liked, state=None):
+    """O(embedding_dim) update of an existing state; a user without one is rebuilt on the next /next_city."""
+    state = state or current_state()
+    idx = to_indices([city_id], state)
+    if not idx:
+        return False
+
+    def apply(user_state):
+        if user_state is None or user_state.version != state.version:
+            return None
+        if not user_state.record(idx[0], liked, state.city_vectors, state.scoring_engine.unit_vectors):
+            return None
+        user_states.updates += 1
+        return user_state
+
+    with user_states.lock(user_id):
+        return user_states.update(user_id, apply) is not None
 
 # ---------------------------------------------------------
 # Similarity + ranking
 # ---------------------------------------------------------
-def cosine(a, b):
-    return np.dot(a, b) / (norm(a) * norm(b) + 1e-8)
+def get_dynamic_scores(user_vec, liked_centroid, disliked_centroid, candidates=None, state=None):
+    state = state or current_state()
+    return state.scoring_engine.centroid_scores(user_vec, liked_centroid, disliked_centroid, candidates)
 
 
-def similarity_to_group(city_vec, group_idx):
-    if not group_idx:
-        return 0.0
-    sims = [cosine(city_vec, city_vectors[i]) for i in group_idx]
-    return float(np.mean(sims))
+NEXT_CITY_MAX_N = int(os.environ.get("NEXT_CITY_MAX_N", "50"))
 
 
-ALPHA = 1.0
-BETA = 0.7
-GAMMA = 0.7
+def requested_count(data, default):
+    """The request's "n", capped at NEXT_CITY_MAX_N; anything below 1 is a bad request."""
+    n = int(data.get("n", default))
+    if n < 1:
+        raise ValueError("n must be at least 1")
+    return min(n, NEXT_CITY_MAX_N)
 
 
-def get_dynamic_scores(user_vec, user_id):
-    liked_ids, disliked_ids = get_user_feedback(user_id)
-    liked_idx = to_indices(liked_ids)
-    disliked_idx = to_indices(disliked_ids)
+def next_cities(user_vec, liked_centroid, disliked_centroid, seen, n=1, state=None):
+    """The `n` best unswiped cities, best first (fewer, or none, near the end of the catalog)."""
+    state = state or current_state()
 
-    base_scores = city_vectors @ user_vec  # same as before
+    if state.retrieval_index.exact:
+        # One pass over the whole catalog, swiped rows masked out of the top-n
+        scores = get_dynamic_scores(user_vec, liked_centroid, disliked_centroid, None, state)
+        best = masked_top_k(scores, seen, n)
+        return state.cities.to_dicts(best, scores[best])
 
-    final_scores = []
-    for i, city_vec in enumerate(city_vectors):
-        sim_liked = similarity_to_group(city_vec, liked_idx)
-        sim_disliked = similarity_to_group(city_vec, disliked_idx)
+    # Approximate index: already swiped cities are dropped before scoring
+    candidates = state.retrieval_index.candidates(user_vec, exclude=seen, size=n)
+    scores = get_dynamic_scores(user_vec, liked_centroid, disliked_centroid, candidates, state)
+    best = masked_top_k(scores, None, n)
+    return state.cities.to_dicts(candidates[best], scores[best])
 
-        score = (
-            ALPHA * base_scores[i] +
-            BETA * sim_liked -
-            GAMMA * sim_disliked
-        )
-        final_scores.append(score)
 
-    return np.array(final_scores), liked_idx, disliked_idx
-def next_city(user_vec, user_id):
-    scores, liked_idx, disliked_idx = get_dynamic_scores(user_vec, user_id)
+def next_city(user_vec, liked_centroid, disliked_centroid, seen, state=None):
+    cities = next_cities(user_vec, liked_centroid, disliked_centroid, seen, 1, state)
+    return cities[0] if cities else None   # None: user has swiped through the whole catalog
 
-    # Exclude already swiped cities
-    seen = set(liked_idx + disliked_idx)
-    for idx in seen:
-        scores[idx] = -1e9  # effectively remove
 
-    next_idx = int(np.argmax(scores))
-    row = cities_df.iloc[next_idx]
+# ---------------------------------------------------------
+# City card content: description + image per city
+# ---------------------------------------------------------
+# Written offline by build_city_content.py and keyed by city_id, so it outlives bundle swaps
+CITY_CONTENT_STORE = os.environ.get("CITY_CONTENT_STORE")
+city_content = CityContentStore(CITY_CONTENT_STORE) if CITY_CONTENT_STORE else None
+
+# CITY_DESCRIPTIONS=1 lets /next_cities fetch content the store does not have
+# (from Wikivoyage/Wikipedia, then cached in-process) when a request asks for it
+city_info = CityInfoCache(
+    ttl=float(os.environ.get("CITY_INFO_TTL", "86400")),
+    max_entries=int(os.environ.get("CITY_INFO_CACHE_SIZE", "5000")),
+) if os.environ.get("CITY_DESCRIPTIONS") == "1" else None
+city_info_executor = ThreadPoolExecutor(
+    max_workers=int(os.environ.get("CITY_INFO_THREADS", "8")),
+    thread_name_prefix="city-info",
+)
+
+
+def attach_city_content(cities, fetch_missing=False):
+    """Adds "description" and "image" to the city dicts that have content, in place."""
+    missing = cities
+    if city_content is not None:
+        found = city_content.get_many(city["city_id"] for city in cities)
+        for city in cities:
+            city.update(found.get(city["city_id"], {}))
+        missing = [city for city in cities if city["city_id"] not in found]
+
+    if fetch_missing and city_info is not None and missing:
+        for city, info in zip(missing, city_info.get_many(missing, city_info_executor)):
+            if info is not None:
+                city.update(info)
+    return cities
+
+
+# ---------------------------------------------------------
+# Paging: ranked pages of unswiped cities for client prefetch
+# ---------------------------------------------------------
+NEXT_CITIES_PAGE_SIZE = int(os.environ.get("NEXT_CITIES_PAGE_SIZE", "5"))
+
+
+def encode_cursor(city_ids):
+    # Stateless: the cursor carries the ids already handed out and not swiped yet
+    return base64.urlsafe_b64encode(json.dumps({"served": city_ids}).encode("utf-8")).decode("ascii")
+
+
+def decode_cursor(cursor):
+    try:
+        served = json.loads(base64.urlsafe_b64decode(cursor.encode("ascii")))["served"]
+        if not isinstance(served, list):
+            raise TypeError("served is not a list")
+    except (ValueError, KeyError, TypeError):
+        raise ValueError("Invalid cursor")
+    return [str(city_id) for city_id in served]
+
+
+def next_cities_page(user_vec, liked_centroid, disliked_centroid, seen, served, n, state=None):
+    """
+    The next `n` cards after the ones in `served`, ranked with the current swipe
+    state, plus the cursor for the page after (None once the catalog runs out).
+    """
+    state = state or current_state()
+
+    # Served but not yet swiped: keep them out of this page and carry them forward
+    served_idx = np.asarray(to_indices(served, state), dtype=np.int64)
+    pending_idx = served_idx[~seen[served_idx]]
+
+    exclude = seen.copy()
+    exclude[pending_idx] = True
+    cities = next_cities(user_vec, liked_centroid, disliked_centroid, exclude, n, state)
+
+    # Catalog runs out once every city is swiped, already served or on this page
+    if np.count_nonzero(exclude) + len(cities) >= len(exclude):
+        return cities, None
+    pending = state.cities.city_ids[pending_idx].tolist()
+    return cities, encode_cursor(pending + [city["city_id"] for city in cities])
 
-    return {
-        "city_id": row["city_id"],
-        "city_name": row["city_name"],
-        "country": row["country"],
-        "score": float(scores[next_idx])
-    }
+
+# ---------------------------------------------------------
+# Instrumentation: stage timings, errors, opt-in profiling
+# ---------------------------------------------------------
+# Every response carries a Server-Timing header with its stage spans, and the
+# spans feed the histograms on /metrics.
+#
+# PROFILE_REQUESTS=1 allows profiling: a request sent with "X-Profile: 1" (and
+# a PROFILE_SAMPLE_RATE fraction of all requests) runs under cProfile, and the
+# .prof file is written to PROFILE_DIR and named in the X-Profile-File header.
+PROFILE_REQUESTS = os.environ.get("PROFILE_REQUESTS") == "1"
+PROFILE_SAMPLE_RATE = float(os.environ.get("PROFILE_SAMPLE_RATE", "0"))
+PROFILE_DIR = os.environ.get("PROFILE_DIR", os.path.join(tempfile.gettempdir(), "elysian-profiles"))
+
+# cProfile cannot profile two requests at once; a request that finds it busy runs unprofiled
+profile_lock = threading.Lock()
+
+
+@app.before_request
+def begin_request():
+    endpoint = request.url_rule.rule if request.url_rule is not None else "unmatched"
+    g.trace, g.trace_token = metrics.start_trace(endpoint)
+    g.profiler = None
+
+    wanted = request.headers.get("X-Profile") == "1" or random.random() < PROFILE_SAMPLE_RATE
+    if PROFILE_REQUESTS and wanted and profile_lock.acquire(blocking=False):
+        g.profiler = cProfile.Profile()
+        g.profiler.enable()
+
+
+def stop_profiler():
+    profiler = g.pop("profiler", None)
+    if profiler is None:
+        return None
+    profiler.disable()
+    profile_lock.release()
+
+    os.makedirs(PROFILE_DIR, exist_ok=True)
+    name = "%s-%s-%s.prof" % (
+        time.strftime("%Y%m%dT%H%M%S"), g.trace.endpoint.strip("/").replace("/", "_") or "root", uuid.uuid4().hex[:8]
+    )
+    path = os.path.join(PROFILE_DIR, name)
+    profiler.dump_stats(path)
+    return path
+
+
+@app.after_request
+def finish_request(response):
+    trace = g.get("trace")
+    if trace is None:
+        return response
+
+    profile_path = stop_profiler()
+    if profile_path:
+        response.headers["X-Profile-File"] = profile_path
+
+    metrics.REQUEST_SECONDS.observe(time.perf_counter() - trace.start, trace.endpoint, response.status_code)
+    if trace.spans:
+        response.headers["Server-Timing"] = trace.server_timing()
+    return response
+
+
+@app.teardown_request
+def end_request(exc):
+    if g.get("profiler") is not None:
+        stop_profiler()
+    token = g.pop("trace_token", None)
+    if token is not None:
+        metrics.end_trace(token)
+
+
+def error_response(e):
+    """
+    Bad input (missing fields, labels the encoders never saw, a malformed
+    cursor) is a 400; running out of time waiting on an interpreter or
+    Firestore is a 503; anything else is logged and returned as a 500.
+    """
+    trace = metrics.current_trace()
+    metrics.REQUEST_ERRORS.inc(trace.endpoint if trace else request.path, type(e).__name__)
+
+    if isinstance(e, (KeyError, ValueError, TypeError)):
+        status = 400
+    elif isinstance(e, (TimeoutError, FutureTimeoutError)):
+        status = 503
+    else:
+        status = 500
+        app.logger.exception("Unhandled error in %s", request.path)
+    return jsonify({"error": str(e)}), status
 
 
 # ---------------------------------------------------------
@@ -205,59 +651,186 @@ def next_city(user_vec, user_id):
 def recommend():
     try:
         data = request.get_json()
+        state = current_state()
 
-        # Encode user answers
-        origin_enc, fav_enc, multi_hot = encode_user_inputs(data)
-
-        # Get user embedding
-        user_vec = get_user_embedding(origin_enc, fav_enc, multi_hot)
+        k = data.get("k", 5)
+        key = (state.version, profile_key(data))
+
+        results = profile_cache.get_top_k(key, k)
+        if results is None:
+            with span("precomputed_lookup"):
+                stored = lookup_precomputed(key)
+            if stored is not None and len(stored.city_idx) >= k:
+                # Same profile and bundle as an offline precompute run: no encoder, no scan
+                with span("serialize"):
+                    results = state.cities.to_dicts(stored.city_idx[:k], stored.scores[:k])
+            else:
+                # Encode user answers + get user embedding
+                user_vec = embed_profile(data, key, state)
+
+                # Top K by similarity score
+                with span("retrieval"):
+                    top_idx, top_scores = state.retrieval_index.search(user_vec, k)
+
+                with span("serialize"):
+                    results = state.cities.to_dicts(top_idx, top_scores)
+            profile_cache.put_top_k(key, k, results)
+
+        with span("json"):
+            return jsonify({"recommendations": results})
 
-        # Compute similarity scores
-        scores = city_vectors @ user_vec
+    except Exception as e:
+        return error_response(e)
 
-        # Top K
+@app.route("/recommend_batch", methods=["POST"])
+def api_recommend_batch():
+    try:
+        data = request.get_json()
+        profiles = data["profiles"]
         k = data.get("k", 5)
-        top_idx = scores.argsort()[::-1][:k]
 
-        results = []
-        for idx in top_idx:
-            row = cities_df.iloc[idx]
-            results.append({
-                "city_id": row["city_id"],
-                "city_name": row["city_name"],
-                "country": row["country"],
-                "score": float(scores[idx])
-            })
-
-        return jsonify({"recommendations": results})
+        results = recommend_batch(profiles, k)
+        with span("json"):
+            return jsonify({"recommendations": results})
 
     except Exception as e:
-        return jsonify({"error": str(e)}), 500
+        return error_response(e)
 
 @app.route("/next_city", methods=["POST"])
 def api_next_city():
     try:
         data = request.get_json()
         user_id = data["user_id"]  # you must send this from frontend
+        state = current_state()
+
+        # Firestore and the encoder are only touched when the state is missing or stale
+        with span("user_state"), user_states.lock(user_id):
+            user_state = load_user_state(user_id, data, state)
+            user_vec = user_state.user_vector()
+            liked_centroid, disliked_centroid = user_state.centroids()
+            seen = user_state.seen
+
+        # Optional "n": also return the next n cards, ranked, so the app need not ask per swipe
+        n = requested_count(data, 1)
+        with span("ranking"):
+            cities = next_cities(user_vec, liked_centroid, disliked_centroid, seen, n, state)
+        with span("content"):
+            attach_city_content(cities)
+
+        result = {"city": cities[0] if cities else None}
+        if "n" in data:
+            result["cities"] = cities
+        with span("json"):
+            return jsonify(result)
+
+    except Exception as e:
+        return error_response(e)
+
+@app.route("/next_cities", methods=["POST"])
+def api_next_cities():
+    """
+    A page of ranked, unswiped cities. Send the returned "cursor" back to get
+    the page after it (cities already handed out are skipped); leave it out to
+    re-rank from scratch with the swipes so far. Cards carry their content
+    from the city content store; "descriptions": true also fetches what the
+    store is missing.
+    """
+    try:
+        data = request.get_json()
+        user_id = data["user_id"]
+        state = current_state()
+
+        n = requested_count(data, NEXT_CITIES_PAGE_SIZE)
+        served = decode_cursor(data["cursor"]) if data.get("cursor") else []
+
+        with span("user_state"), user_states.lock(user_id):
+            user_state = load_user_state(user_id, data, state)
+            user_vec = user_state.user_vector()
+            liked_centroid, disliked_centroid = user_state.centroids()
+            seen = user_state.seen
 
-        # Same encoding as /recommend
-        origin_enc, fav_enc, multi_hot = encode_user_inputs(data)
-        user_vec = get_user_embedding(origin_enc, fav_enc, multi_hot)
-        liked_ids, disliked_ids = get_user_feedback(user_id)
-        liked_idx = to_indices(liked_ids)
-        disliked_idx = to_indices(disliked_ids)
-        user_vec = adjust_user_embedding(user_vec, liked_idx, disliked_idx)
+        with span("ranking"):
+            cities, cursor = next_cities_page(user_vec, liked_centroid, disliked_centroid, seen, served, n, state)
+        with span("content"):
+            attach_city_content(cities, fetch_missing=bool(data.get("descriptions")))
+        with span("json"):
+            return jsonify({"cities": cities, "cursor": cursor})
 
-        city = next_city(user_vec, user_id)
-        return jsonify({"city": city})
+    except Exception as e:
+        return error_response(e)
+
+@app.route("/swipe", methods=["POST"])
+def api_swipe():
+    try:
+        data = request.get_json()
+        user_id = data["user_id"]
+        has_swipe = data.get("city_id") is not None and data.get("liked") is not None
+
+        queued = has_swipe and "city" in data
+        if queued:
+            # We own the write: buffer it for a batched commit (see swipe_writer.py)
+            with span("swipe_enqueue"):
+                swipe_writer.record(user_id, str(data["city_id"]), bool(data["liked"]), data["city"])
+        else:
+            # Older app builds write the like/dislike to Firestore themselves; drop our cached copy
+            feedback_cache.invalidate(user_id)
+
+        # ...and fold the swipe into the user's state so /next_city need not re-read it.
+        # After the enqueue: a rebuild holding the user's lock either sees it pending or gets it here.
+        if has_swipe:
+            with span("swipe_update"):
+                record_swipe(user_id, str(data["city_id"]), bool(data["liked"]))
+        return jsonify({"status": "ok", "queued": queued})
 
     except Exception as e:
-        return jsonify({"error": str(e)}), 500
+        return error_response(e)
+
+def component_stats(state):
+    return {
+        "interpreter_pool": state.interpreter_pool.stats(),
+        "profile_cache": profile_cache.stats(),
+        "precomputed": precomputed.stats() if precomputed is not None else None,
+        "user_states": user_states.stats(),
+        "city_content": city_content.stats() if city_content is not None else None,
+        "city_info": city_info.stats() if city_info is not None else None,
+        "feedback_cache": {
+            "size": len(feedback_cache),
+            "hits": feedback_cache.hits,
+            "misses": feedback_cache.misses,
+        },
+        "swipe_writer": swipe_writer.stats(),
+    }
+
+@app.route("/stats")
+def stats():
+    state = current_state()
+    return jsonify(dict(artifact_version=state.version, user_encoder=USER_ENCODER, **component_stats(state)))
+
+@app.route("/metrics")
+def prometheus_metrics():
+    # Prometheus text format; see metrics.py
+    return Response(metrics.render(component_stats(current_state())), mimetype="text/plain; version=0.0.4")
 
 @app.route("/")
 def home():
     return jsonify({"status": "Travel recommender backend running"})
 
 
+# ---------------------------------------------------------
+# Hot reload of artifact bundles
+# ---------------------------------------------------------
+# Each worker watches artifacts/CURRENT on its own (start gunicorn without
+# --preload, or the watch thread would only run in the master).
+ARTIFACT_WATCH_INTERVAL = float(os.environ.get("ARTIFACT_WATCH_INTERVAL", "10"))
+if ARTIFACT_WATCH_INTERVAL > 0:
+    artifact_manager.watch(ARTIFACT_WATCH_INTERVAL)
+
+if os.environ.get("ARTIFACT_RELOAD_SIGNAL") == "1":
+    try:
+        artifact_manager.install_signal_handler()
+    except ValueError:
+        pass   # not on the main thread; rely on the file watch
+
+
 if __name__ == "__main__":
     app.run(host="0.0.0.0", port=5003)
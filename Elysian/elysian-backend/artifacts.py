@@ -0,0 +1,275 @@
+"""
+Versioned model artifact bundles.
+
+A bundle is one directory holding everything the backend serves from, plus a
+manifest.json with a SHA-256 per file:
+
+    artifacts/
+        CURRENT                 <- name of the active version
+        20260118T120000Z-1a2b3c4d/
+            manifest.json
+            user_encoder.tflite
+            city_vectors.npy
+            city_unit_vectors.npy
+            cities/city_id.npy, cities/city_name.npy, ...   (one column per file)
+            le_origin.pkl, le_fav.pkl, mlbs.pkl
+            label_mappings.json, vacation_types.json
+
+City vectors and metadata columns are plain .npy files so they can be opened
+with mmap_mode="r"; every worker process then shares the same page-cache pages.
+Bundles are written to a temp directory and renamed into place, and CURRENT is
+replaced atomically, so a reader never sees a half-written bundle.
+"""
+import hashlib
+import json
+import logging
+import os
+import shutil
+import signal
+import tempfile
+import threading
+import time
+
+import numpy as np
+
+log = logging.getLogger(__name__)
+
+MANIFEST = "manifest.json"
+CURRENT = "CURRENT"
+FORMAT_VERSION = 1
+
+
+class ArtifactError(Exception):
+    pass
+
+
+def sha256_file(path, chunk_size=1 << 20):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(chunk_size), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+# ---------------------------------------------------------
+# Reading a bundle
+# ---------------------------------------------------------
+class ArtifactBundle:
+    def __init__(self, path, manifest):
+        self.path = path
+        self.manifest = manifest
+
+    @property
+    def version(self):
+        return self.manifest["version"]
+
+    @property
+    def city_columns(self):
+        return self.manifest["city_columns"]
+
+    def file(self, name):
+        if name not in self.manifest["files"]:
+            raise ArtifactError("%s is not part of bundle %s" % (name, self.version))
+        return os.path.join(self.path, name)
+
+    def has(self, name):
+        return name in self.manifest["files"]
+
+    def read_bytes(self, name):
+        with open(self.file(name), "rb") as f:
+            return f.read()
+
+    def load_json(self, name):
+        with open(self.file(name)) as f:
+            return json.load(f)
+
+    def load_array(self, name, mmap=True):
+        return np.load(self.file(name), mmap_mode="r" if mmap else None)
+
+    def load_city_column(self, column, mmap=True):
+        return self.load_array("cities/%s.npy" % column, mmap=mmap)
+
+    def verify(self):
+        for name, meta in self.manifest["files"].items():
+            path = os.path.join(self.path, name)
+            if not os.path.exists(path):
+                raise ArtifactError("Bundle %s is missing %s" % (self.version, name))
+            if sha256_file(path) != meta["sha256"]:
+                raise ArtifactError("Checksum mismatch for %s in bundle %s" % (name, self.version))
+
+
+def load_bundle(path, verify=True):
+    manifest_path = os.path.join(path, MANIFEST)
+    if not os.path.exists(manifest_path):
+        raise ArtifactError("No %s in %s" % (MANIFEST, path))
+
+    with open(manifest_path) as f:
+        manifest = json.load(f)
+    if manifest.get("format") != FORMAT_VERSION:
+        raise ArtifactError("Unsupported bundle format %r in %s" % (manifest.get("format"), path))
+
+    bundle = ArtifactBundle(path, manifest)
+    if verify:
+        bundle.verify()
+
+    # Cross-file consistency: one vector and one metadata row per city
+    num_cities = manifest["num_cities"]
+    vectors = bundle.load_array("city_vectors.npy")
+    if vectors.shape != (num_cities, manifest["embedding_dim"]):
+        raise ArtifactError("city_vectors.npy has shape %s, manifest says (%d, %d)"
+                            % (vectors.shape, num_cities, manifest["embedding_dim"]))
+    for column in bundle.city_columns:
+        if len(bundle.load_city_column(column)) != num_cities:
+            raise ArtifactError("City column %s does not have %d rows" % (column, num_cities))
+
+    return bundle
+
+
+def current_version(root):
+    try:
+        with open(os.path.join(root, CURRENT)) as f:
+            return f.read().strip() or None
+    except FileNotFoundError:
+        return None
+
+
+def load_current(root, verify=True):
+    version = current_version(root)
+    if version is None:
+        raise ArtifactError("No active bundle in %s (missing %s)" % (root, CURRENT))
+    return load_bundle(os.path.join(root, version), verify=verify)
+
+
+# ---------------------------------------------------------
+# Writing a bundle
+# ---------------------------------------------------------
+def write_bundle(root, files, city_columns, city_vectors, version=None):
+    """
+    files: {bundle_name: source_path} copied as-is.
+    city_columns: {column_name: list of values} from cities.csv.
+    Returns the new bundle's version; it is not activated.
+    """
+    os.makedirs(root, exist_ok=True)
+    tmp = tempfile.mkdtemp(prefix=".building-", dir=root)
+    os.chmod(tmp, 0o755)
+
+    try:
+        for name, src in files.items():
+            shutil.copyfile(src, os.path.join(tmp, name))
+
+        city_vectors = np.ascontiguousarray(city_vectors, dtype=np.float32)
+        np.save(os.path.join(tmp, "city_vectors.npy"), city_vectors)
+
+        norms = np.linalg.norm(city_vectors, axis=1, keepdims=True)
+        np.save(os.path.join(tmp, "city_unit_vectors.npy"), city_vectors / (norms + 1e-8))
+
+        os.makedirs(os.path.join(tmp, "cities"))
+        for column, values in city_columns.items():
+            np.save(os.path.join(tmp, "cities", "%s.npy" % column), np.array(values, dtype=str))
+
+        manifest_files = {}
+        for dirpath, _, filenames in os.walk(tmp):
+            for filename in filenames:
+                full = os.path.join(dirpath, filename)
+                name = os.path.relpath(full, tmp).replace(os.sep, "/")
+                manifest_files[name] = {"sha256": sha256_file(full), "bytes": os.path.getsize(full)}
+
+        content_hash = hashlib.sha256(
+            json.dumps(manifest_files, sort_keys=True).encode("utf-8")
+        ).hexdigest()[:8]
+        version = version or time.strftime("%Y%m%dT%H%M%SZ", time.gmtime()) + "-" + content_hash
+
+        manifest = {
+            "format": FORMAT_VERSION,
+            "version": version,
+            "created_at": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+            "num_cities": int(city_vectors.shape[0]),
+            "embedding_dim": int(city_vectors.shape[1]),
+            "city_columns": list(city_columns),
+            "files": manifest_files,
+        }
+        with open(os.path.join(tmp, MANIFEST), "w") as f:
+            json.dump(manifest, f, indent=2, sort_keys=True)
+
+        final = os.path.join(root, version)
+        if os.path.exists(final):
+            raise ArtifactError("Bundle %s already exists" % version)
+        os.rename(tmp, final)
+    except Exception:
+        shutil.rmtree(tmp, ignore_errors=True)
+        raise
+
+    return version
+
+
+def activate(root, version):
+    # Validate first so CURRENT never points at a broken bundle
+    load_bundle(os.path.join(root, version))
+
+    fd, tmp = tempfile.mkstemp(prefix=".CURRENT-", dir=root)
+    os.chmod(tmp, 0o644)
+    with os.fdopen(fd, "w") as f:
+        f.write(version + "\n")
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, os.path.join(root, CURRENT))
+
+
+# ---------------------------------------------------------
+# Hot reload
+# ---------------------------------------------------------
+class ArtifactManager:
+    """
+    Holds the serving state built from the active bundle and swaps it when
+    CURRENT changes. The new state is fully built (and validated) before the
+    swap, and the swap is a single reference assignment, so a request that
+    grabbed `manager.current` keeps a consistent view until it finishes.
+    """
+
+    def __init__(self, root, build_state, verify=True):
+        self.root = root
+        self.build_state = build_state
+        self.verify = verify
+        self.listeners = []   # called with (old_state, new_state) after a swap
+
+        self._reload_lock = threading.Lock()
+        self.current = build_state(load_current(root, verify=verify))
+
+    def reload(self, force=False):
+        with self._reload_lock:
+            version = current_version(self.root)
+            if version is None or (version == self.current.version and not force):
+                return False
+
+            state = self.build_state(load_bundle(os.path.join(self.root, version), verify=self.verify))
+            old, self.current = self.current, state
+
+        log.info("Swapped artifact bundle %s -> %s", old.version, state.version)
+        for listener in self.listeners:
+            listener(old, state)
+        return True
+
+    def _safe_reload(self):
+        try:
+            self.reload()
+        except Exception:
+            # Keep serving the old bundle; the next tick retries
+            log.exception("Artifact reload failed")
+
+    def watch(self, interval):
+        """Poll CURRENT every `interval` seconds from a daemon thread."""
+        def loop():
+            while True:
+                time.sleep(interval)
+                self._safe_reload()
+
+        thread = threading.Thread(target=loop, name="artifact-watch", daemon=True)
+        thread.start()
+        return thread
+
+    def install_signal_handler(self, signum=signal.SIGUSR2):
+        # The handler only kicks off a thread; building the new state can take a while
+        def handler(signum, frame):
+            threading.Thread(target=self._safe_reload, name="artifact-reload", daemon=True).start()
+
+        signal.signal(signum, handler)
@@ -0,0 +1,347 @@
+"""
+End-to-end latency/throughput benchmark for the backend, fully offline.
+
+For each catalog size, a synthetic bundle is written to a temp directory: the
+active bundle's encoder and label encoders plus city_vectors scaled up like
+bench_retrieval.py does. A fresh app process then serves from it with the
+in-memory feedback backend in place of Firestore, seeded with random swipe
+histories, and is driven with profiles sampled from queries.csv. The benchmark
+times the pipeline stages and the HTTP endpoints (through Flask's test client,
+so no network) and reports p50/p95/p99 latency and requests/sec for each.
+
+    python bench_backend.py                                   # 1k/10k/100k cities
+    python bench_backend.py --sizes 1000 --requests 200 --out bench.json
+    python bench_backend.py --baseline bench.json             # exit 1 on a regression
+
+Results are compared against bench_baseline.json by default (pass
+--baseline "" to skip). Options not given on the command line default to the
+ones the baseline was recorded with, so a plain `python bench_backend.py`
+repeats that run. Giving a different one, or running on a machine with another
+CPU count, platform or Python, stops with an error instead of comparing
+timings that cannot match. It was recorded with
+
+    python bench_backend.py --sizes 1000 10000 --requests 200 --users 50 --baseline "" --out bench_baseline.json
+
+Rerun that command to re-record it on the machine you compare on, and commit
+it when a change is meant to move the numbers.
+
+Embeddings are not cached between requests (PROFILE_CACHE_SIZE=0) unless
+--profile-cache is given, so /recommend measures the full encode + scan path.
+Users' swipe states are warmed up before timing, as in steady-state serving.
+"""
+import argparse
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from artifacts import activate, load_current, write_bundle
+from bench_retrieval import synthetic_catalog
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_QUERIES = os.path.join(HERE, "..", "..", "Datasets", "queries.csv")
+DEFAULT_BASELINE = os.path.join(HERE, "bench_baseline.json")
+
+PROFILE_COLUMNS = ["origin_country", "favorite_country_visited", "vacation_types", "seasons", "budget", "place_type"]
+LIST_FIELDS = {"vacation_types", "seasons", "budget", "place_type"}
+METRICS = ["p50_ms", "p95_ms", "p99_ms"]
+# Options and environment a run must share with the baseline to be compared against it
+CONFIG = ["sizes", "profiles", "requests", "users", "swipes", "concurrency", "page_size", "batch",
+          "feedback_latency", "profile_cache", "mode", "seed"]
+ENVIRONMENT = ["python", "platform", "cpu_count"]
+
+
+# ---------------------------------------------------------
+# Synthetic inputs
+# ---------------------------------------------------------
+def synthetic_bundle(root, size, seed):
+    """A bundle with the active encoder and `size` synthetic cities, activated under `root`."""
+    source = load_current(os.path.join(HERE, "artifacts"), verify=False)
+    rng = np.random.default_rng(seed)
+
+    base = np.asarray(source.load_array("city_vectors.npy"), dtype=np.float32)
+    rows = rng.integers(0, len(base), size=size)
+    columns = {column: source.load_city_column(column)[rows].tolist() for column in source.city_columns}
+    columns["city_id"] = ["c%07d" % i for i in range(size)]
+
+    files = {
+        name: source.file(name) for name in source.manifest["files"]
+        if "/" not in name and name not in ("city_vectors.npy", "city_unit_vectors.npy")
+    }
+    version = write_bundle(root, files, columns, synthetic_catalog(base, size, rng), version="bench-%d" % size)
+    activate(root, version)
+
+
+def load_profiles(path, count, seed):
+    import pandas as pd
+
+    queries = pd.read_csv(path, usecols=PROFILE_COLUMNS).dropna()
+    sample = queries.sample(n=min(count, len(queries)), random_state=seed)
+    return [
+        {field: (value.split("|") if field in LIST_FIELDS else value) for field, value in row.items()}
+        for row in sample.to_dict("records")
+    ]
+
+
+# ---------------------------------------------------------
+# Timing
+# ---------------------------------------------------------
+def summarize(name, kind, latencies, wall):
+    ms = 1000.0 * np.asarray(latencies)
+    return {
+        "name": name,
+        "kind": kind,
+        "count": len(ms),
+        "p50_ms": float(np.percentile(ms, 50)),
+        "p95_ms": float(np.percentile(ms, 95)),
+        "p99_ms": float(np.percentile(ms, 99)),
+        "mean_ms": float(ms.mean()),
+        "rps": len(ms) / wall,
+    }
+
+
+def measure(name, kind, fn, inputs, concurrency=1, warmup=10):
+    for item in inputs[:warmup]:
+        fn(item)
+
+    def timed(item):
+        start = time.perf_counter()
+        fn(item)
+        return time.perf_counter() - start
+
+    start = time.perf_counter()
+    if concurrency > 1:
+        with ThreadPoolExecutor(max_workers=concurrency) as executor:
+            latencies = list(executor.map(timed, inputs))
+    else:
+        latencies = [timed(item) for item in inputs]
+    return summarize(name, kind, latencies, time.perf_counter() - start)
+
+
+# ---------------------------------------------------------
+# Worker: one app process per catalog size
+# ---------------------------------------------------------
+def run_worker(config):
+    import app
+
+    rng = np.random.default_rng(config["seed"])
+    state = app.current_state()
+    city_ids = state.cities.city_ids
+    profiles = load_profiles(config["queries"], config["profiles"], config["seed"])
+    n = config["requests"]
+
+    # Stand-in for Firestore: random swipe histories
+    users = ["bench-%d" % i for i in range(config["users"])]
+    for user_id in users:
+        for city_id in rng.choice(city_ids, size=min(config["swipes"], len(city_ids)), replace=False):
+            app.feedback_backend.record(user_id, str(city_id), bool(rng.random() < 0.5))
+
+    def request_profile(i):
+        # Each user keeps the same answers, so /next_city serves from their swipe state
+        user = i % len(users)
+        return dict(profiles[user % len(profiles)], user_id=users[user])
+
+    requests = [request_profile(i) for i in range(n)]
+    client = app.app.test_client()
+
+    def post(path, payload):
+        res = client.post(path, json=payload)
+        if res.status_code != 200:
+            raise RuntimeError("%s returned %d: %s" % (path, res.status_code, res.get_data(as_text=True)))
+
+    # Build every user's swipe state once, as a long-running server would have
+    for i in range(len(users)):
+        post("/next_city", request_profile(i))
+
+    results = []
+
+    # Stages, one request at a time
+    results.append(measure("encode_user_inputs", "stage", lambda p: app.encode_user_inputs(p, state), requests))
+    encoded = [app.encode_user_inputs(p, state) for p in requests]
+    results.append(measure("get_user_embedding", "stage", lambda e: app.get_user_embedding(*e, state), encoded))
+
+    user_states = [app.user_states.get(user_id) for user_id in users]
+    scored = [user_states[i % len(users)] for i in range(n)]
+    results.append(measure(
+        "get_dynamic_scores", "stage",
+        lambda s: app.get_dynamic_scores(s.user_vector(), *s.centroids(), None, state), scored,
+    ))
+    results.append(measure(
+        "next_cities", "stage",
+        lambda s: app.next_cities(s.user_vector(), *s.centroids(), s.seen, config["page_size"], state), scored,
+    ))
+
+    # Endpoints, `concurrency` requests in flight
+    concurrency = config["concurrency"]
+    endpoints = [
+        ("/recommend", "/recommend", lambda p: dict(p, k=5)),
+        ("/recommend_batch", "/recommend_batch", lambda p: {"profiles": [p] * config["batch"], "k": 5}),
+        ("/next_city", "/next_city", lambda p: p),
+        ("/next_cities", "/next_cities", lambda p: dict(p, n=config["page_size"])),
+    ]
+    for name, path, payload in endpoints:
+        results.append(measure(name, "endpoint", lambda p: post(path, payload(p)), requests, concurrency))
+
+    # Current app builds send the city card along, so the swipe goes through the write-behind buffer
+    cards = state.cities.to_dicts(rng.integers(len(city_ids), size=n), np.zeros(n, dtype=np.float32))
+    swipes = [
+        {"user_id": users[i % len(users)], "city_id": card["city_id"], "liked": bool(i % 2), "city": card}
+        for i, card in enumerate(cards)
+    ]
+    results.append(measure("/swipe", "endpoint", lambda s: post("/swipe", s), swipes, concurrency))
+
+    print(json.dumps(results))
+
+
+# ---------------------------------------------------------
+# Driver
+# ---------------------------------------------------------
+def run_size(size, args):
+    root = tempfile.mkdtemp(prefix="bench-artifacts-")
+    try:
+        synthetic_bundle(root, size, args.seed)
+        env = dict(
+            os.environ,
+            ARTIFACT_ROOT=root,
+            ARTIFACT_WATCH_INTERVAL="0",
+            FEEDBACK_BACKEND="memory",
+            FEEDBACK_FAKE_LATENCY=str(args.feedback_latency),
+            SERVING_MODE=args.mode,
+            INTERPRETER_POOL_SIZE=str(max(args.concurrency, 1)),
+            USER_STATE_CACHE_SIZE=str(max(args.users, 1)),
+        )
+        env.pop("PRECOMPUTED_STORE", None)
+        env.pop("USER_STATE_STORE", None)
+        if not args.profile_cache:
+            env["PROFILE_CACHE_SIZE"] = "0"
+
+        config = {
+            "queries": args.queries, "profiles": args.profiles, "requests": args.requests,
+            "users": args.users, "swipes": args.swipes, "concurrency": args.concurrency,
+            "page_size": args.page_size, "batch": args.batch, "seed": args.seed,
+        }
+        out = subprocess.run(
+            [sys.executable, os.path.abspath(__file__), "--worker", json.dumps(config)],
+            cwd=HERE, env=env, capture_output=True, text=True,
+        )
+        if out.returncode != 0:
+            raise RuntimeError("Benchmark worker failed for %d cities:\n%s" % (size, out.stderr[-4000:]))
+        results = json.loads(out.stdout.strip().splitlines()[-1])
+    finally:
+        shutil.rmtree(root, ignore_errors=True)
+
+    for r in results:
+        r["size"] = size
+    return results
+
+
+def compare(results, baseline, tolerance):
+    """Rows that got slower than the baseline by more than `tolerance` (a fraction)."""
+    previous = {(r["size"], r["name"]): r for r in baseline["results"]}
+    regressions = []
+    for r in results:
+        before = previous.get((r["size"], r["name"]))
+        if before is None:
+            continue
+        for metric in METRICS:
+            if r[metric] > before[metric] * (1 + tolerance):
+                regressions.append((r, metric, before[metric], r[metric]))
+        if r["rps"] < before["rps"] * (1 - tolerance):
+            regressions.append((r, "rps", before["rps"], r["rps"]))
+    return regressions
+
+
+def print_table(results, baseline=None):
+    previous = {(r["size"], r["name"]): r for r in baseline["results"]} if baseline else {}
+    print(f"{'cities':>8} {'name':<20} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'req/s':>9} {'vs base p95':>12}")
+    for r in results:
+        before = previous.get((r["size"], r["name"]))
+        delta = f"{100.0 * (r['p95_ms'] / before['p95_ms'] - 1):+.0f}%" if before else ""
+        print(f"{r['size']:>8} {r['name']:<20} {r['p50_ms']:>9.3f} {r['p95_ms']:>9.3f} "
+              f"{r['p99_ms']:>9.3f} {r['rps']:>9.0f} {delta:>12}")
+
+
+def environment():
+    return {"python": sys.version.split()[0], "platform": sys.platform, "cpu_count": os.cpu_count()}
+
+
+def main():
+    if len(sys.argv) == 3 and sys.argv[1] == "--worker":
+        return run_worker(json.loads(sys.argv[2]))
+
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000, 100000])
+    parser.add_argument("--queries", default=DEFAULT_QUERIES, help="queries.csv to sample profiles from")
+    parser.add_argument("--profiles", type=int, default=2000, help="profiles sampled (one per user, in order)")
+    parser.add_argument("--requests", type=int, default=500, help="timed calls per stage/endpoint")
+    parser.add_argument("--users", type=int, default=200)
+    parser.add_argument("--swipes", type=int, default=30, help="swipe history per user")
+    parser.add_argument("--concurrency", type=int, default=1, help="endpoint requests in flight")
+    parser.add_argument("--page-size", type=int, default=5)
+    parser.add_argument("--batch", type=int, default=32, help="profiles per /recommend_batch call")
+    parser.add_argument("--feedback-latency", type=float, default=0.0, help="simulated Firestore read, seconds")
+    parser.add_argument("--profile-cache", action="store_true", help="keep the embedding cache on")
+    parser.add_argument("--mode", choices=["full", "lite"], default=os.environ.get("SERVING_MODE", "full"))
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--out", help="write results as JSON here (usable as a later --baseline)")
+    parser.add_argument("--baseline", default=DEFAULT_BASELINE, help="JSON from an earlier --out to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="allowed slowdown vs the baseline")
+    parser.add_argument("--json", action="store_true", help="print machine-readable results only")
+    args = parser.parse_args()
+
+    baseline = None
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        recorded = baseline["meta"]["args"]
+        # Re-parse so options not given fall back to the baseline's
+        parser.set_defaults(**{k: recorded[k] for k in CONFIG if k in recorded})
+        args = parser.parse_args()
+        changed = [k for k in CONFIG if recorded.get(k) != getattr(args, k)]
+        if changed:
+            parser.error("%s was recorded with %s; drop those options or pass --baseline \"\"" % (
+                args.baseline, ", ".join("%s=%s" % (k, recorded.get(k)) for k in changed)))
+        here = environment()
+        moved = [k for k in ENVIRONMENT if baseline["meta"].get(k) != here[k]]
+        if moved:
+            parser.error("%s was recorded on %s, this machine has %s; re-record it here or pass --baseline \"\"" % (
+                args.baseline, ", ".join("%s=%s" % (k, baseline["meta"].get(k)) for k in moved),
+                ", ".join("%s=%s" % (k, here[k]) for k in moved)))
+
+    results = []
+    for size in args.sizes:
+        results.extend(run_size(size, args))
+
+    report = {
+        "meta": {
+            "created_at": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+            **environment(),
+            "args": {k: v for k, v in vars(args).items() if k not in ("out", "baseline", "json", "queries")},
+        },
+        "results": results,
+    }
+    if args.out:
+        with open(args.out, "w") as f:
+            json.dump(report, f, indent=2)
+
+    if args.json:
+        print(json.dumps(report, indent=2))
+    else:
+        print_table(results, baseline)
+
+    if baseline is not None:
+        regressions = compare(results, baseline, args.tolerance)
+        for r, metric, before, after in regressions:
+            print(f"REGRESSION {r['size']} cities {r['name']}: {metric} {before:.3f} -> {after:.3f}")
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,123 @@
+"""
+Micro-benchmark for building recommendation responses: the old per-row
+pandas `cities_df.iloc[idx]` loop versus CityStore's columnar bulk
+serialization, plus the id -> index lookup used for swipe history.
+Reports mean latency and peak tracemalloc allocation per request.
+
+    python bench_city_store.py --k 5 20 100 --requests 2000
+"""
+import argparse
+import json
+import os
+import time
+import tracemalloc
+
+import numpy as np
+
+from artifacts import load_current
+from city_store import CityStore
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+
+def pandas_response(cities_df, top_idx, scores):
+    # What /recommend did before the columnar store
+    results = []
+    for idx in top_idx:
+        row = cities_df.iloc[idx]
+        results.append({
+            "city_id": row["city_id"],
+            "city_name": row["city_name"],
+            "country": row["country"],
+            "score": float(scores[idx])
+        })
+    return results
+
+
+def pandas_indices(city_id_to_idx, city_ids):
+    return [city_id_to_idx[cid] for cid in city_ids if cid in city_id_to_idx]
+
+
+def measure(fn, calls):
+    start = time.perf_counter()
+    for args in calls:
+        fn(*args)
+    latency_us = 1e6 * (time.perf_counter() - start) / len(calls)
+
+    # Peak transient allocation per call, measured separately so tracing does not skew timing
+    sample = calls[:200]
+    peaks = []
+    tracemalloc.start()
+    for args in sample:
+        base = tracemalloc.get_traced_memory()[0]
+        tracemalloc.reset_peak()
+        fn(*args)
+        peaks.append(tracemalloc.get_traced_memory()[1] - base)
+    tracemalloc.stop()
+
+    return latency_us, sum(peaks) / len(peaks)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--artifacts", default=os.path.join(HERE, "artifacts"))
+    parser.add_argument("--k", type=int, nargs="+", default=[5, 20, 100])
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--swipes", type=int, default=50, help="swiped ids per id -> index lookup")
+    parser.add_argument("--json", action="store_true")
+    args = parser.parse_args()
+
+    bundle = load_current(args.artifacts)
+    store = CityStore.from_bundle(bundle)
+    n = len(store)
+    rng = np.random.default_rng(0)
+
+    try:
+        import pandas as pd
+        cities_df = pd.DataFrame({
+            "city_id": store.city_ids.tolist(),
+            "city_name": store.city_names.tolist(),
+            "country": store.countries.tolist(),
+        })
+        city_id_to_idx = {row["city_id"]: idx for idx, row in cities_df.iterrows()}
+    except ImportError:
+        cities_df = None
+        print("pandas not installed; skipping the 'before' measurements")
+
+    report = []
+    for k in args.k:
+        k = min(k, n)
+        calls = []
+        for _ in range(args.requests):
+            scores = rng.standard_normal(n).astype(np.float32)
+            top_idx = np.argsort(-scores)[:k]
+            calls.append((top_idx, scores))
+
+        rows = []
+        if cities_df is not None:
+            rows.append(("pandas iloc", measure(lambda i, s: pandas_response(cities_df, i, s), calls)))
+        rows.append(("CityStore", measure(lambda i, s: store.to_dicts(i, s[i]), calls)))
+        for name, (latency, peak) in rows:
+            report.append({"op": "serialize", "impl": name, "k": k,
+                           "latency_us": latency, "peak_bytes_per_request": peak})
+
+    id_calls = [(store.city_ids[rng.integers(0, n, args.swipes)].tolist(),) for _ in range(args.requests)]
+    rows = []
+    if cities_df is not None:
+        rows.append(("dict lookup", measure(lambda ids: pandas_indices(city_id_to_idx, ids), id_calls)))
+    rows.append(("CityStore", measure(store.indices, id_calls)))
+    for name, (latency, peak) in rows:
+        report.append({"op": "ids->indices", "impl": name, "k": args.swipes,
+                       "latency_us": latency, "peak_bytes_per_request": peak})
+
+    if args.json:
+        print(json.dumps(report, indent=2))
+        return
+
+    print(f"{'op':<13} {'impl':<12} {'k':>4} {'latency (us)':>13} {'peak bytes/req':>15}")
+    for r in report:
+        print(f"{r['op']:<13} {r['impl']:<12} {r['k']:>4} {r['latency_us']:>13.1f} {r['peak_bytes_per_request']:>15.0f}")
+
+
+if __name__ == "__main__":
+    main()
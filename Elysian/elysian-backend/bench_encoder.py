@@ -0,0 +1,142 @@
+"""
+Compare the user encoder variants (float32, dynamic, float16, int8; see
+Model/tflite_export.py) before switching USER_ENCODER: file size, invoke()
+latency for one profile and throughput for a batch, how far the embeddings
+drift from float32 (cosine), and how much of the float32 top-k survives.
+
+    python bench_encoder.py                                  # variants in the active bundle
+    python bench_encoder.py --source ../../Model/two_tower   # a training output directory
+
+Inputs are real profiles from queries.csv encoded with the source's encoders.
+"""
+import argparse
+import json
+import os
+import time
+
+import numpy as np
+
+from artifacts import load_current
+from bench_backend import DEFAULT_QUERIES, load_profiles
+from bench_quantized import agreement
+from encoding import ENCODER_VARIANTS, encode_user_inputs_batch, encoder_file, run_user_encoder
+from scoring import top_k_per_row
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+
+def load_source(args):
+    """(path of a file by name, city vectors, encoders, interpreter class)."""
+    if args.source:
+        file = lambda name: os.path.join(args.source, name)
+        city_vectors = np.load(file("city_vectors.npy"))
+    else:
+        bundle = load_current(args.artifacts, verify=False)
+        # Variants the bundle does not ship resolve to a path that does not exist
+        file = lambda name: bundle.file(name) if name in bundle.manifest["files"] else os.path.join(bundle.path, name)
+        city_vectors = bundle.load_array("city_vectors.npy")
+
+    if args.mode == "lite":
+        from lite_serving import load_interpreter_class, load_lite_encoders
+        encoders = load_lite_encoders(file("label_mappings.json"), file("vacation_types.json"))
+        interpreter_cls = load_interpreter_class()
+    else:
+        import joblib
+        import tensorflow as tf
+        encoders = (joblib.load(file("le_origin.pkl")), joblib.load(file("le_fav.pkl")), joblib.load(file("mlbs.pkl")))
+        interpreter_cls = tf.lite.Interpreter
+    return file, np.asarray(city_vectors, dtype=np.float32), encoders, interpreter_cls
+
+
+def embed(interpreter, encoded, batch_size):
+    origin, fav, multi_hot = encoded
+    return np.concatenate([
+        run_user_encoder(interpreter, origin[i:i + batch_size], fav[i:i + batch_size], multi_hot[i:i + batch_size])
+        for i in range(0, len(origin), batch_size)
+    ])
+
+
+def time_single(interpreter, encoded, repeat):
+    origin, fav, multi_hot = encoded
+    run_user_encoder(interpreter, origin[:1], fav[:1], multi_hot[:1])   # warm up at batch size 1
+    latencies = []
+    for _ in range(repeat):
+        for i in range(len(origin)):
+            start = time.perf_counter()
+            run_user_encoder(interpreter, origin[i:i + 1], fav[i:i + 1], multi_hot[i:i + 1])
+            latencies.append(time.perf_counter() - start)
+    return 1000.0 * np.percentile(latencies, 50), 1000.0 * np.percentile(latencies, 95)
+
+
+def time_batch(interpreter, encoded, batch_size, repeat):
+    embed(interpreter, encoded, batch_size)
+    start = time.perf_counter()
+    for _ in range(repeat):
+        embed(interpreter, encoded, batch_size)
+    return repeat * len(encoded[0]) / (time.perf_counter() - start)
+
+
+def cosine(a, b):
+    return np.sum(a * b, axis=1) / (np.linalg.norm(a, axis=1) * np.linalg.norm(b, axis=1) + 1e-8)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--artifacts", default=os.path.join(HERE, "artifacts"))
+    parser.add_argument("--source", help="directory with user_encoder*.tflite and encoders instead of the bundle")
+    parser.add_argument("--queries-csv", default=DEFAULT_QUERIES)
+    parser.add_argument("--mode", choices=["full", "lite"], default="full")
+    parser.add_argument("--variants", nargs="+", choices=ENCODER_VARIANTS, default=ENCODER_VARIANTS)
+    parser.add_argument("--profiles", type=int, default=500)
+    parser.add_argument("--batch-size", type=int, default=256)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--json", action="store_true")
+    args = parser.parse_args()
+
+    file, city_vectors, (le_origin, le_fav, mlbs), interpreter_cls = load_source(args)
+    profiles = load_profiles(args.queries_csv, args.profiles, args.seed)
+    encoded = encode_user_inputs_batch(profiles, le_origin, le_fav, mlbs)
+
+    reference = None
+    report = []
+    for variant in ["float32"] + [v for v in args.variants if v != "float32"]:
+        path = file(encoder_file(variant))
+        if not os.path.exists(path):
+            print(f"Skipping {variant}: no {os.path.basename(path)}")
+            continue
+
+        interpreter = interpreter_cls(model_path=path)
+        interpreter.allocate_tensors()
+
+        vecs = embed(interpreter, encoded, args.batch_size)
+        if reference is None:
+            reference = vecs
+            exact = top_k_per_row(reference @ city_vectors.T, args.k)
+        p50, p95 = time_single(interpreter, encoded, args.repeat)
+        drift = cosine(vecs, reference)
+        recall, same = agreement(city_vectors, reference, top_k_per_row(vecs @ city_vectors.T, args.k), exact, args.k)
+
+        report.append({
+            "variant": variant, "size_kb": os.path.getsize(path) / 1024.0,
+            "p50_ms": p50, "p95_ms": p95,
+            "batch_rows_per_s": time_batch(interpreter, encoded, args.batch_size, args.repeat),
+            "cosine_mean": float(drift.mean()), "cosine_min": float(drift.min()),
+            "recall_at_k": recall, "same_top_k": same, "k": args.k,
+        })
+
+    if args.json:
+        print(json.dumps(report, indent=2))
+        return
+
+    print(f"{'variant':>8} {'size KB':>8} {'p50 ms':>8} {'p95 ms':>8} {'rows/s':>9} "
+          f"{'cos mean':>9} {'cos min':>8} {'recall@k':>9} {'same':>5}")
+    for r in report:
+        print(f"{r['variant']:>8} {r['size_kb']:>8.1f} {r['p50_ms']:>8.3f} {r['p95_ms']:>8.3f} "
+              f"{r['batch_rows_per_s']:>9.0f} {r['cosine_mean']:>9.5f} {r['cosine_min']:>8.5f} "
+              f"{r['recall_at_k']:>9.3f} {r['same_top_k']:>5.2f}")
+
+
+if __name__ == "__main__":
+    main()
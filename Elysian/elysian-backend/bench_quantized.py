@@ -0,0 +1,97 @@
+"""
+Top-k agreement, memory and latency of the quantized retrieval index
+(RETRIEVAL_INDEX=int8/float16) against the exact float32 scan /recommend runs.
+
+User vectors come from real profiles in queries.csv run through the active
+bundle's encoder, so "exact" is the same top-k /recommend returns for them.
+Size 0 is the bundle's own catalog; other sizes scale city_vectors up
+synthetically like bench_retrieval.py.
+
+    python bench_quantized.py --sizes 0 10000 100000 --rerank 20 50 200
+"""
+import argparse
+import json
+import os
+
+import numpy as np
+
+from artifacts import load_current
+from bench_backend import DEFAULT_QUERIES, load_profiles
+from bench_retrieval import synthetic_catalog, time_queries
+from precompute import embed_batch, init_worker
+from retrieval import ExactIndex, QuantizedIndex
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+
+def user_vectors(args):
+    bundle = load_current(args.artifacts, verify=False)
+    init_worker(bundle.path, args.mode, None, args.k)
+    _, _, _, vecs = embed_batch(load_profiles(args.queries_csv, args.queries, args.seed))
+    return np.asarray(bundle.load_array("city_vectors.npy"), dtype=np.float32), vecs
+
+
+def agreement(vectors, queries, approx, exact, k):
+    """
+    (mean fraction of the exact top k recovered, fraction of queries ranked
+    identically). Cities with equal scores (duplicate vectors) are
+    interchangeable; the exact scan itself returns either, so ties count as hits.
+    """
+    recovered, same = [], []
+    for q, a, e in zip(queries, approx, exact):
+        a_scores, e_scores = vectors[a] @ q, vectors[e] @ q
+        recovered.append(np.count_nonzero(a_scores >= e_scores.min()) / k)
+        same.append(len(a) == len(e) and np.array_equal(a_scores, e_scores))
+    return float(np.mean(recovered)), float(np.mean(same))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--artifacts", default=os.path.join(HERE, "artifacts"))
+    parser.add_argument("--queries-csv", default=DEFAULT_QUERIES)
+    parser.add_argument("--mode", choices=["full", "lite"], default="full")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[0, 10000, 100000])
+    parser.add_argument("--dtypes", nargs="+", choices=["int8", "float16"], default=["int8", "float16"])
+    parser.add_argument("--rerank", type=int, nargs="+", default=[20, 50, 200])
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--json", action="store_true")
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(args.seed)
+    base, queries = user_vectors(args)
+    report = []
+
+    for size in args.sizes:
+        vectors = base if size == 0 else synthetic_catalog(base, size, rng)
+        exact, exact_ms = time_queries(ExactIndex(vectors), queries, args.k, None)
+
+        for dtype in args.dtypes:
+            index = QuantizedIndex.build(vectors, dtype)
+            quantized_bytes = index.codes.nbytes + (index.scales.nbytes if index.scales is not None else 0)
+
+            for rerank in args.rerank:
+                index.rerank = rerank
+                approx, approx_ms = time_queries(index, queries, args.k, None)
+                overlap, same = agreement(vectors, queries, approx, exact, args.k)
+                report.append({
+                    "size": len(vectors), "dtype": dtype, "rerank": rerank, "k": args.k,
+                    "agreement": overlap, "identical": same,
+                    "float32_mb": vectors.nbytes / 1e6, "quantized_mb": quantized_bytes / 1e6,
+                    "exact_ms": exact_ms, "quantized_ms": approx_ms,
+                })
+
+    if args.json:
+        print(json.dumps(report, indent=2))
+        return
+
+    print(f"{'size':>8} {'dtype':>7} {'rerank':>6} {'agree@k':>8} {'same':>6} "
+          f"{'f32 MB':>8} {'quant MB':>8} {'exact ms':>9} {'quant ms':>9}")
+    for r in report:
+        print(f"{r['size']:>8} {r['dtype']:>7} {r['rerank']:>6} {r['agreement']:>8.3f} {r['identical']:>6.2f} "
+              f"{r['float32_mb']:>8.2f} {r['quantized_mb']:>8.2f} {r['exact_ms']:>9.3f} {r['quantized_ms']:>9.3f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,67 @@
+"""
+Cold-start benchmark: import time and peak RSS of app.py per SERVING_MODE.
+Each run is a fresh interpreter so nothing is already imported or cached.
+
+    python bench_startup.py                # full vs lite, 3 runs each
+    python bench_startup.py --runs 5 --modes lite
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+
+# Runs inside the child process
+CHILD = r"""
+import json, resource, sys, time
+start = time.perf_counter()
+import app
+elapsed = time.perf_counter() - start
+rss_kb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+if sys.platform == "darwin":
+    rss_kb //= 1024   # macOS reports bytes
+print(json.dumps({"import_seconds": elapsed, "peak_rss_mb": rss_kb / 1024.0}))
+"""
+
+
+def measure(mode, runs):
+    env = dict(os.environ, SERVING_MODE=mode, FEEDBACK_BACKEND="memory", INTERPRETER_POOL_SIZE="1")
+    here = os.path.dirname(os.path.abspath(__file__))
+
+    samples = []
+    for _ in range(runs):
+        out = subprocess.run(
+            [sys.executable, "-c", CHILD], cwd=here, env=env,
+            capture_output=True, text=True, check=True,
+        )
+        samples.append(json.loads(out.stdout.strip().splitlines()[-1]))
+
+    return {
+        "mode": mode,
+        "runs": runs,
+        "import_seconds_min": min(s["import_seconds"] for s in samples),
+        "import_seconds_avg": sum(s["import_seconds"] for s in samples) / runs,
+        "peak_rss_mb": max(s["peak_rss_mb"] for s in samples),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=3)
+    parser.add_argument("--modes", nargs="+", default=["full", "lite"])
+    parser.add_argument("--json", action="store_true", help="print machine-readable results only")
+    args = parser.parse_args()
+
+    results = [measure(mode, args.runs) for mode in args.modes]
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+
+    print(f"{'mode':<6} {'import min (s)':>15} {'import avg (s)':>15} {'peak RSS (MB)':>14}")
+    for r in results:
+        print(f"{r['mode']:<6} {r['import_seconds_min']:>15.2f} {r['import_seconds_avg']:>15.2f} {r['peak_rss_mb']:>14.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,73 @@
+"""
+Package the serving artifacts into a new versioned bundle (see artifacts.py).
+
+    python build_bundle.py --source ../../Model/two_tower --activate
+    python build_bundle.py --vectors new_city_vectors.npy --include city_index_ivf.npz --activate
+
+Without --source the model files are taken from the active bundle, so a new
+index or new city vectors can be shipped without retraining.
+
+Running workers pick up the new bundle on their next watch tick (or on
+SIGUSR2 when ARTIFACT_RELOAD_SIGNAL=1) without restarting.
+"""
+import argparse
+import csv
+import os
+
+import numpy as np
+
+from artifacts import activate, load_current, write_bundle
+from encoding import ENCODER_VARIANTS, encoder_file
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+BUNDLE_FILES = [
+    "user_encoder.tflite",
+    "le_origin.pkl",
+    "le_fav.pkl",
+    "mlbs.pkl",
+    "label_mappings.json",
+    "vacation_types.json",
+]
+
+# Shipped when the source directory has them (train_two_tower.py --quantize)
+OPTIONAL_FILES = [encoder_file(variant) for variant in ENCODER_VARIANTS if variant != "float32"]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--root", default=os.path.join(HERE, "artifacts"))
+    parser.add_argument("--source", default=None, help="directory holding the model files (default: the active bundle)")
+    parser.add_argument("--cities", default=os.path.join(HERE, "..", "..", "Datasets", "cities.csv"))
+    parser.add_argument("--vectors", default=None, help="city vectors (default: <source>/city_vectors.npy)")
+    parser.add_argument("--include", nargs="*", default=[], help="extra files to ship, e.g. city_index_ivf.npz")
+    parser.add_argument("--version", default=None)
+    parser.add_argument("--activate", action="store_true", help="point CURRENT at the new bundle")
+    args = parser.parse_args()
+    args.source = args.source or load_current(args.root).path
+
+    files = {name: os.path.join(args.source, name) for name in BUNDLE_FILES}
+    for name in OPTIONAL_FILES:
+        if os.path.exists(os.path.join(args.source, name)):
+            files[name] = os.path.join(args.source, name)
+    for extra in args.include:
+        files[os.path.basename(extra)] = extra
+
+    with open(args.cities, newline="") as f:
+        rows = list(csv.DictReader(f))
+    city_columns = {column: [row[column] for row in rows] for column in rows[0]}
+
+    city_vectors = np.load(args.vectors or os.path.join(args.source, "city_vectors.npy"))
+    if len(city_vectors) != len(rows):
+        parser.error("%d city vectors but %d rows in %s" % (len(city_vectors), len(rows), args.cities))
+
+    version = write_bundle(args.root, files, city_columns, city_vectors, version=args.version)
+    print("Wrote bundle", version)
+
+    if args.activate:
+        activate(args.root, version)
+        print("Activated", version)
+
+
+if __name__ == "__main__":
+    main()
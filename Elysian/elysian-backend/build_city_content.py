@@ -0,0 +1,104 @@
+"""
+Offline job: fill a CityContentStore with a description and image for every
+city in the active artifact bundle. Point the backend at the file with
+CITY_CONTENT_STORE=<store> and the cards carry their content inline.
+
+    python build_city_content.py --store city_content.sqlite
+    python build_city_content.py --fixture fixtures/city_content.json   # offline, for local runs/tests
+
+Content is fetched from Wikivoyage/Wikipedia exactly like the app used to
+(city_info.fetch_city_info), several cities at a time, and committed in
+batches. Cities that already have content are skipped unless --refresh is
+given, so re-running the job only fetches what is missing or failed.
+"""
+import argparse
+import json
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+from artifacts import load_current
+from city_content_store import CityContentStore
+from city_info import fetch_city_info
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+_local = threading.local()
+
+
+def fetch_one(city_id, city_name, country, timeout):
+    # requests.Session is not thread-safe: one per worker thread
+    session = getattr(_local, "session", None)
+    if session is None:
+        session = _local.session = requests.Session()
+    return city_id, fetch_city_info(city_name, country, session=session, timeout=timeout)
+
+
+def load_fixture(path, city_ids):
+    with open(path) as f:
+        fixture = json.load(f)
+    return [(city_id, fixture[city_id]) for city_id in city_ids if city_id in fixture]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--store", default=os.path.join(HERE, "city_content.sqlite"))
+    parser.add_argument("--artifacts", default=os.path.join(HERE, "artifacts"))
+    parser.add_argument("--fixture", help="load content from this JSON file instead of fetching it")
+    parser.add_argument("--write-fixture", help="dump the store to this JSON file and exit")
+    parser.add_argument("--refresh", action="store_true", help="refetch cities that already have content")
+    parser.add_argument("--workers", type=int, default=8)
+    parser.add_argument("--batch-size", type=int, default=50, help="cities per commit")
+    parser.add_argument("--timeout", type=float, default=5.0, help="per HTTP request")
+    args = parser.parse_args()
+
+    store = CityContentStore(args.store, readonly=False)
+
+    if args.write_fixture:
+        content = store.export()
+        with open(args.write_fixture, "w") as f:
+            json.dump(content, f, indent=2, sort_keys=True)
+        print(f"Wrote {len(content)} cities to {args.write_fixture}")
+        return
+
+    bundle = load_current(args.artifacts, verify=False)
+    cities = list(zip(
+        bundle.load_city_column("city_id").tolist(),
+        bundle.load_city_column("city_name").tolist(),
+        bundle.load_city_column("country").tolist(),
+    ))
+    if not args.refresh:
+        existing = store.existing_ids()
+        cities = [city for city in cities if city[0] not in existing]
+
+    if args.fixture:
+        written = store.put_many(load_fixture(args.fixture, [city[0] for city in cities]), source="fixture")
+        print(f"Loaded {written} cities from {args.fixture} ({len(cities) - written} not in the fixture)")
+        return
+
+    print(f"Fetching content for {len(cities)} cities with {args.workers} workers")
+    start = time.perf_counter()
+    written = failed = 0
+    batch = []
+
+    with ThreadPoolExecutor(max_workers=args.workers) as executor:
+        results = executor.map(lambda city: fetch_one(*city, args.timeout), cities)
+        for city_id, info in results:
+            if info is None:
+                failed += 1   # left out; the next run retries it
+                continue
+            batch.append((city_id, info))
+            if len(batch) >= args.batch_size:
+                written += store.put_many(batch, source="wikimedia")
+                batch = []
+                print(f"{written} written, {failed} failed ({time.perf_counter() - start:.1f}s)")
+    written += store.put_many(batch, source="wikimedia")
+
+    print(f"{written} written, {failed} failed in {time.perf_counter() - start:.1f}s")
+
+
+if __name__ == "__main__":
+    main()
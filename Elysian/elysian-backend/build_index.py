@@ -0,0 +1,72 @@
+"""
+Build a retrieval index over the active bundle's city vectors (run offline,
+then point the backend at it with RETRIEVAL_INDEX=<kind>
+RETRIEVAL_INDEX_PATH=<out>, or ship it in the bundle with build_bundle.py
+--include).
+
+    python build_index.py --lists 1000 --out city_index_ivf.npz
+    python build_index.py --kind int8          # city_vectors_int8.npy + city_vectors_int8_scales.npy
+"""
+import argparse
+import os
+import time
+
+import numpy as np
+
+from artifacts import load_current
+from retrieval import INDEX_FILES, IVFIndex, QuantizedIndex
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+
+def build_ivf(vectors, args):
+    start = time.perf_counter()
+    index = IVFIndex.build(vectors, n_lists=args.lists, iters=args.iters, seed=args.seed, nprobe=args.nprobe)
+    index.save(args.out)
+
+    sizes = np.diff(index.offsets)
+    print(f"Built {len(index.centroids)} lists over {len(vectors)} cities in {time.perf_counter() - start:.1f}s")
+    print(f"List sizes: min {sizes.min()}, median {int(np.median(sizes))}, max {sizes.max()}")
+
+
+def build_quantized(vectors, args):
+    index = QuantizedIndex.build(vectors, args.kind)
+    index.save(args.out)
+
+    restored = index.codes.astype(np.float32)
+    if index.scales is not None:
+        restored *= index.scales[:, None]
+    size = index.codes.nbytes + (index.scales.nbytes if index.scales is not None else 0)
+    print(f"Quantized {len(vectors)} cities to {args.kind}: {size / 1e6:.2f} MB vs {vectors.nbytes / 1e6:.2f} MB float32")
+    print(f"Max abs error per value: {np.abs(restored - vectors).max():.2e}")
+
+
+def load_vectors(args):
+    if args.vectors:
+        return np.load(args.vectors)
+    return load_current(args.artifacts, verify=False).load_array("city_vectors.npy", mmap=False)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--vectors", default=None, help="city vectors (default: the active bundle's)")
+    parser.add_argument("--artifacts", default=os.path.join(HERE, "artifacts"))
+    parser.add_argument("--kind", choices=sorted(INDEX_FILES), default="ivf")
+    parser.add_argument("--out", help="default: the file name the backend looks for in a bundle")
+    parser.add_argument("--lists", type=int, default=None, help="ivf: number of clusters (default: sqrt(num_cities))")
+    parser.add_argument("--nprobe", type=int, default=8, help="ivf: default clusters probed per query")
+    parser.add_argument("--iters", type=int, default=20)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    args.out = args.out or INDEX_FILES[args.kind]
+
+    vectors = load_vectors(args).astype(np.float32)
+    if args.kind == "ivf":
+        build_ivf(vectors, args)
+    else:
+        build_quantized(vectors, args)
+    print(f"Saved to {args.out}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,95 @@
+"""
+On-disk store of city card content (description + image), written by
+build_city_content.py and read by the backend.
+
+Content depends only on the city, not on the user or the model, so it is
+fetched once per city offline and keyed by city_id; bundle swaps do not
+invalidate it. /next_city and /next_cities attach it to every card, which
+saves the app its Wikivoyage/Wikipedia lookups.
+"""
+import sqlite3
+import threading
+import time
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS content (
+    city_id     TEXT PRIMARY KEY,
+    description TEXT NOT NULL,
+    image       TEXT,
+    source      TEXT NOT NULL,
+    updated_at  TEXT NOT NULL
+) WITHOUT ROWID;
+"""
+
+
+class CityContentStore:
+    def __init__(self, path, readonly=True):
+        self.path = path
+        self.readonly = readonly
+
+        self.hits = 0
+        self.misses = 0
+
+        # sqlite3 connections are per thread
+        self._local = threading.local()
+
+        if not readonly:
+            conn = self._conn()
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.executescript(SCHEMA)
+
+    def _conn(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            if self.readonly:
+                conn = sqlite3.connect("file:%s?mode=ro" % self.path, uri=True)
+            else:
+                conn = sqlite3.connect(self.path)
+            self._local.conn = conn
+        return conn
+
+    # -----------------------------------------------------
+    # Serving side
+    # -----------------------------------------------------
+    def get_many(self, city_ids):
+        """{city_id: {"description", "image"}} for the ids that have content."""
+        city_ids = list(city_ids)
+        if not city_ids:
+            return {}
+        try:
+            rows = self._conn().execute(
+                "SELECT city_id, description, image FROM content WHERE city_id IN (%s)"
+                % ",".join("?" * len(city_ids)),
+                city_ids,
+            ).fetchall()
+        except sqlite3.Error:
+            # No store yet, or it is being rebuilt: cards go out without content
+            self._local.conn = None
+            rows = []
+
+        found = {city_id: {"description": description, "image": image} for city_id, description, image in rows}
+        self.hits += len(found)
+        self.misses += len(city_ids) - len(found)
+        return found
+
+    def stats(self):
+        return {"hits": self.hits, "misses": self.misses}
+
+    # -----------------------------------------------------
+    # Job side
+    # -----------------------------------------------------
+    def existing_ids(self):
+        return {row[0] for row in self._conn().execute("SELECT city_id FROM content")}
+
+    def put_many(self, items, source):
+        """items: iterable of (city_id, {"description", "image"})."""
+        now = time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime())
+        rows = [(city_id, info["description"], info.get("image"), source, now) for city_id, info in items]
+        with self._conn() as conn:
+            conn.executemany("INSERT OR REPLACE INTO content VALUES (?, ?, ?, ?, ?)", rows)
+        return len(rows)
+
+    def export(self):
+        """{city_id: {"description", "image"}} for every stored city (for writing fixtures)."""
+        rows = self._conn().execute("SELECT city_id, description, image FROM content ORDER BY city_id")
+        return {city_id: {"description": description, "image": image} for city_id, description, image in rows}
@@ -0,0 +1,141 @@
+import re
+import threading
+import time
+from collections import OrderedDict
+
+import requests
+
+WIKIVOYAGE_API = "https://en.wikivoyage.org/w/api.php"
+WIKIPEDIA_SUMMARY = "https://en.wikipedia.org/api/rest_v1/page/summary/"
+NO_DESCRIPTION = "No description available."
+
+
+# ---------------------------------------------------------
+# Fetching: same sources and rules as fetchCityInfo in recommendations.tsx
+# ---------------------------------------------------------
+def shorten(text, sentences=3):
+    cleaned = re.sub(r"\s+", " ", text).strip()
+    if not cleaned:
+        return ""
+    sliced = ". ".join(cleaned.split(". ")[:sentences])
+    return sliced if sliced.endswith(".") else sliced + "."
+
+
+def is_flag_image(url):
+    return bool(url) and "flag" in url.lower()
+
+
+def fetch_wikivoyage_intro(session, city_name, country, timeout):
+    for title in (city_name, f"{city_name}, {country}", f"{city_name} ({country})"):
+        try:
+            res = session.get(WIKIVOYAGE_API, timeout=timeout, params={
+                "action": "query", "format": "json", "prop": "extracts",
+                "exintro": 1, "explaintext": 1, "redirects": 1, "titles": title,
+            })
+            pages = res.json().get("query", {}).get("pages")
+        except (requests.RequestException, ValueError):
+            continue
+        if not pages:
+            continue
+
+        extract = next(iter(pages.values())).get("extract")
+        if extract and "more than one place" not in extract.lower() and "may refer to" not in extract.lower():
+            return extract
+    return None
+
+
+def fetch_wikipedia_summary(session, title, timeout):
+    res = session.get(WIKIPEDIA_SUMMARY + requests.utils.quote(title, safe=""), timeout=timeout)
+    return res.json() if res.ok else None
+
+
+def fetch_city_info(city_name, country, session=None, timeout=5):
+    """{"description", "image"} for one city, or None if Wikipedia could not be reached."""
+    session = session or requests
+    try:
+        voy_text = fetch_wikivoyage_intro(session, city_name, country, timeout)
+        wiki = (fetch_wikipedia_summary(session, city_name, timeout) or
+                fetch_wikipedia_summary(session, f"{city_name}, {country}", timeout) or {})
+    except (requests.RequestException, ValueError):
+        return None
+
+    raw_image = (wiki.get("originalimage") or {}).get("source") or (wiki.get("thumbnail") or {}).get("source")
+    description = voy_text or wiki.get("extract") or ""
+    return {
+        "description": shorten(description) if description else NO_DESCRIPTION,
+        "image": None if is_flag_image(raw_image) else raw_image,
+    }
+
+
+# ---------------------------------------------------------
+# Cache: city id -> info
+# ---------------------------------------------------------
+class CityInfoCache:
+    """
+    In-process LRU of city info by city id, with a TTL. Misses for one page of
+    cards are fetched in parallel; a city whose fetch fails is left out (the
+    app falls back to fetching it itself) and retried on the next request.
+    """
+
+    def __init__(self, fetch=fetch_city_info, ttl=86400.0, max_entries=5000, timeout=5.0):
+        self.fetch = fetch
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.timeout = timeout
+
+        self.hits = 0
+        self.misses = 0
+
+        self._entries = OrderedDict()   # city_id -> (expires_at, info)
+        self._lock = threading.Lock()
+        self._local = threading.local()
+
+    def _fetch(self, city_name, country):
+        # Runs on an executor thread; requests.Session is not thread-safe, so one per thread
+        session = getattr(self._local, "session", None)
+        if session is None:
+            session = self._local.session = requests.Session()
+        return self.fetch(city_name, country, session, self.timeout)
+
+    def _lookup(self, city_id, now):
+        # Caller holds the lock
+        entry = self._entries.get(city_id)
+        if entry is None or entry[0] < now:
+            return None
+        self._entries.move_to_end(city_id)
+        return entry[1]
+
+    def get_many(self, cities, executor):
+        """Info for each city dict (city_id, city_name, country), in order; None where unavailable."""
+        now = time.monotonic()
+        with self._lock:
+            found = [self._lookup(city["city_id"], now) for city in cities]
+        missing = [i for i, info in enumerate(found) if info is None]
+        self.hits += len(cities) - len(missing)
+        self.misses += len(missing)
+
+        futures = {
+            i: executor.submit(self._fetch, cities[i]["city_name"], cities[i]["country"])
+            for i in missing
+        }
+        for i, future in futures.items():
+            try:
+                found[i] = future.result(timeout=self.timeout * 4)
+            except Exception:
+                found[i] = None
+            if found[i] is not None:
+                self.put(cities[i]["city_id"], found[i])
+        return found
+
+    def put(self, city_id, info):
+        with self._lock:
+            self._entries[city_id] = (time.monotonic() + self.ttl, info)
+            self._entries.move_to_end(city_id)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def __len__(self):
+        return len(self._entries)
+
+    def stats(self):
+        return {"size": len(self._entries), "hits": self.hits, "misses": self.misses}
@@ -0,0 +1,51 @@
+import numpy as np
+
+
+# ---------------------------------------------------------
+# Columnar city metadata
+# ---------------------------------------------------------
+class CityStore:
+    """
+    City metadata as one NumPy string array per column (memory-mapped when it
+    comes from an artifact bundle), plus an id -> index dict for lookups.
+    Responses are built column-at-a-time with tolist() instead of
+    materializing a row object per city.
+    """
+
+    def __init__(self, city_ids, city_names, countries):
+        self.city_ids = city_ids
+        self.city_names = city_names
+        self.countries = countries
+
+        # Precomputed id -> index. A dict, not a fixed-width string array: casting
+        # incoming ids to the catalog's dtype would truncate longer ids into real ones
+        self._index = {cid: i for i, cid in enumerate(np.asarray(city_ids).tolist())}
+
+    @classmethod
+    def from_bundle(cls, bundle):
+        return cls(
+            bundle.load_city_column("city_id"),
+            bundle.load_city_column("city_name"),
+            bundle.load_city_column("country"),
+        )
+
+    def __len__(self):
+        return len(self.city_ids)
+
+    def indices(self, city_ids):
+        """Catalog indices for the given ids, in order; unknown ids are skipped."""
+        index = self._index
+        return [index[cid] for cid in city_ids if cid in index]
+
+    def to_dicts(self, indices, scores):
+        """Serialize many cities at once: one fancy-index + tolist() per column."""
+        indices = np.asarray(indices, dtype=np.int64)
+        return [
+            {"city_id": cid, "city_name": name, "country": country, "score": score}
+            for cid, name, country, score in zip(
+                self.city_ids[indices].tolist(),
+                self.city_names[indices].tolist(),
+                self.countries[indices].tolist(),
+                np.asarray(scores, dtype=np.float64).tolist(),
+            )
+        ]
@@ -1,12 +1,51 @@
+"""
+Convert a saved Keras model to TFLite, optionally with the post-training
+quantized variants from Model/tflite_export.py written next to it:
+
+    python convert_model.py
+    python convert_model.py --quantize dynamic float16 --out model.tflite
+    python convert_model.py --quantize int8 --representative representative_inputs.npy
+
+int8 needs calibration inputs: final_elysian_model.py saves a sample of its
+training pairs (built from queries.csv) as representative_inputs.npy.
+"""
+import argparse
+import os
+import sys
+
+import numpy as np
 import tensorflow as tf
 
-# Load your model
-model = tf.keras.models.load_model('travel_recommender_model.h5')
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(HERE, "..", "..", "Model"))
+
+from tflite_export import QUANTIZATIONS, convert, variant_path  # noqa: E402
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--model", default="travel_recommender_model.h5")
+    parser.add_argument("--out", default="travel_recommender_model.tflite")
+    parser.add_argument("--quantize", nargs="*", default=[], choices=QUANTIZATIONS[1:])
+    parser.add_argument("--representative", help=".npy of model inputs for int8 calibration")
+    args = parser.parse_args()
+
+    if "int8" in args.quantize and not args.representative:
+        parser.error("--quantize int8 needs --representative")
+    representative = [np.load(args.representative)] if args.representative else None
+
+    # Load your model
+    model = tf.keras.models.load_model(args.model)
+
+    for quantization in ["float32"] + args.quantize:
+        converter = tf.lite.TFLiteConverter.from_keras_model(model)
+        tflite_model = convert(converter, quantization, representative)
+
+        path = variant_path(args.out, quantization)
+        with open(path, "wb") as f:
+            f.write(tflite_model)
+        print(f"Wrote {path} ({len(tflite_model) / 1024:.1f} KB)")
 
-# Convert to TFLite
-converter = tf.lite.TFLiteConverter.from_keras_model(model)
-tflite_model = converter.convert()
 
-# Save the model
-with open('travel_recommender_model.tflite', 'wb') as f:
-    f.write(tflite_model)
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,86 @@
+import numpy as np
+
+# Multi-hot blocks, in the order the user encoder expects them
+MULTI_HOT_FEATURES = ["vacation_types", "seasons", "budget", "place_type"]
+
+# Post-training quantized exports of the user encoder (Model/tflite_export.py)
+ENCODER_VARIANTS = ["float32", "dynamic", "float16", "int8"]
+
+
+def encoder_file(variant="float32"):
+    """Bundle file name of a user encoder variant."""
+    if variant not in ENCODER_VARIANTS:
+        raise ValueError("Unknown user encoder variant %r; expected one of %s" % (variant, ENCODER_VARIANTS))
+    return "user_encoder.tflite" if variant == "float32" else "user_encoder_%s.tflite" % variant
+
+
+# ---------------------------------------------------------
+# Batch encode many user profiles at once
+# ---------------------------------------------------------
+def encode_user_inputs_batch(profiles, le_origin, le_fav, mlbs):
+    """
+    Vectorized version of app.encode_user_inputs for a list of profiles.
+    Returns origin (N, 1), fav (N, 1) and multi_hot (N, multi_dim) float32 arrays.
+    """
+    origin = le_origin.transform([p["origin_country"] for p in profiles])
+    fav = le_fav.transform([p["favorite_country_visited"] for p in profiles])
+
+    multi_hot = np.concatenate([
+        mlbs[feature].transform([p.get(feature, []) for p in profiles])
+        for feature in MULTI_HOT_FEATURES
+    ], axis=1)
+
+    return (
+        np.asarray(origin, dtype=np.float32).reshape(-1, 1),
+        np.asarray(fav, dtype=np.float32).reshape(-1, 1),
+        np.asarray(multi_hot, dtype=np.float32),
+    )
+
+
+def encode_valid_batch(profiles, le_origin, le_fav, mlbs):
+    """
+    encode_user_inputs_batch, but a profile with an unknown or missing label is
+    dropped instead of failing the whole batch. Returns (positions of the
+    profiles that encoded, arrays for just those), or ([], None).
+    """
+    try:
+        return list(range(len(profiles))), encode_user_inputs_batch(profiles, le_origin, le_fav, mlbs)
+    except (ValueError, KeyError, TypeError):
+        pass
+
+    valid, rows = [], []
+    for i, profile in enumerate(profiles):
+        try:
+            rows.append(encode_user_inputs_batch([profile], le_origin, le_fav, mlbs))
+            valid.append(i)
+        except (ValueError, KeyError, TypeError):
+            continue
+    if not rows:
+        return [], None
+    return valid, tuple(np.concatenate(parts) for parts in zip(*rows))
+
+
+# ---------------------------------------------------------
+# Run the user encoder on a whole batch in one invoke()
+# ---------------------------------------------------------
+def run_user_encoder(interpreter, origin, fav, multi_hot, multi_idx=0, origin_idx=1, fav_idx=2):
+    """
+    Resizes the interpreter's inputs to the batch size (only when it changed),
+    runs a single invoke() and returns the (N, embedding_dim) user embeddings.
+    """
+    batch_size = multi_hot.shape[0]
+    inputs = interpreter.get_input_details()
+
+    if inputs[multi_idx]["shape"][0] != batch_size:
+        for i, width in ((multi_idx, multi_hot.shape[1]), (origin_idx, 1), (fav_idx, 1)):
+            interpreter.resize_tensor_input(inputs[i]["index"], [batch_size, width])
+        interpreter.allocate_tensors()
+
+    interpreter.set_tensor(inputs[multi_idx]["index"], np.ascontiguousarray(multi_hot, dtype=np.float32))
+    interpreter.set_tensor(inputs[origin_idx]["index"], np.ascontiguousarray(origin, dtype=np.float32))
+    interpreter.set_tensor(inputs[fav_idx]["index"], np.ascontiguousarray(fav, dtype=np.float32))
+
+    interpreter.invoke()
+
+    output = interpreter.get_output_details()[0]
+    return interpreter.get_tensor(output["index"]).copy()
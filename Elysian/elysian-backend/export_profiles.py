@@ -0,0 +1,409 @@
+"""
+Export userProfiles from Firestore as encoded, columnar .npy shards: the
+label indices and multi-hot block the user encoder takes, so training,
+precompute and evaluation jobs load arrays instead of re-reading every
+document and re-parsing query_firestore.py's CSV.
+
+    python export_profiles.py --out profile_export            # first run: full export
+    python export_profiles.py --out profile_export            # later runs: only profiles saved since the watermark
+    python export_profiles.py --out profile_export --full     # start over (e.g. after the encoders changed)
+
+    # Offline, against the Firestore emulator (seeded from queries.csv)
+    FIRESTORE_EMULATOR_HOST=localhost:8080 python export_profiles.py --seed-emulator 5000 --out /tmp/export
+
+Documents are read a page at a time with query cursors, by several readers at
+once: a full export splits the document-id space into ranges, an incremental
+one splits the (watermark, cutoff] window of the `updatedAt` field the app
+sets on every save. Each run appends shards to the export and moves the
+watermark; load_export() reads them back with the newest row per user winning.
+Deleted profiles are only dropped by a full export.
+
+    profile_export/
+        manifest.json               watermark, encoder fingerprint, shards
+        shard-00000/
+            user_id.npy             str
+            updated_at.npy          float64 epoch seconds (NaN: saved before updatedAt existed)
+            origin.npy, fav.npy     int32 label indices
+            multi_hot.npy           uint8 (rows, multi_dim), MULTI_HOT_FEATURES order
+            skipped.npy             str, users whose profile could not be encoded
+"""
+import argparse
+import datetime
+import hashlib
+import json
+import os
+import queue
+import shutil
+import string
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from artifacts import load_current
+from encoding import MULTI_HOT_FEATURES, encode_valid_batch
+from precompute import RESPONSE_FIELDS, profile_from_responses
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+MANIFEST = "manifest.json"
+COLUMNS = ["user_id", "updated_at", "origin", "fav", "multi_hot"]
+
+# Firebase Auth uids are 28 characters of [0-9A-Za-z]; full exports split this range
+UID_ALPHABET = string.digits + string.ascii_uppercase + string.ascii_lowercase
+
+
+# ---------------------------------------------------------
+# Firestore access
+# ---------------------------------------------------------
+def firestore_client():
+    if os.environ.get("FIRESTORE_EMULATOR_HOST"):
+        # Same as app.py: the emulator needs no credentials
+        from google.auth.credentials import AnonymousCredentials
+        from google.cloud import firestore as gcloud_firestore
+        return gcloud_firestore.Client(
+            project=os.environ.get("FIRESTORE_PROJECT", "demo-elysian"),
+            credentials=AnonymousCredentials(),
+        )
+
+    import firebase_admin
+    from firebase_admin import credentials, firestore
+    if not firebase_admin._apps:
+        firebase_admin.initialize_app(credentials.Certificate(json.loads(os.environ["FIREBASE_SERVICE_ACCOUNT"])))
+    return firestore.client()
+
+
+def id_range_queries(collection, readers):
+    """One query per slice of the document-id space, together covering the whole collection."""
+    from google.cloud.firestore import FieldFilter
+
+    cuts = [UID_ALPHABET[round(i * len(UID_ALPHABET) / readers)] for i in range(1, readers)]
+    bounds = [None] + sorted(set(cuts)) + [None]
+    queries = []
+    for low, high in zip(bounds[:-1], bounds[1:]):
+        query = collection
+        if low is not None:
+            query = query.where(filter=FieldFilter("__name__", ">=", collection.document(low)))
+        if high is not None:
+            query = query.where(filter=FieldFilter("__name__", "<", collection.document(high)))
+        queries.append(query.order_by("__name__"))
+    return queries
+
+
+def updated_range_queries(collection, since, until, readers):
+    """One query per slice of since < updatedAt <= until."""
+    from google.cloud.firestore import FieldFilter
+
+    step = (until - since) / readers
+    bounds = [since + i * step for i in range(readers)] + [until]
+    return [
+        collection.where(filter=FieldFilter("updatedAt", ">", low))
+                  .where(filter=FieldFilter("updatedAt", "<=", high))
+                  .order_by("updatedAt").order_by("__name__")
+        for low, high in zip(bounds[:-1], bounds[1:])
+    ]
+
+
+def read_pages(query, page_size):
+    """Documents of `query`, `page_size` at a time, each page starting after the last one's final document."""
+    last = None
+    while True:
+        page = query.limit(page_size)
+        if last is not None:
+            page = page.start_after(last)
+        docs = list(page.stream())
+        if docs:
+            yield docs
+        if len(docs) < page_size:
+            return
+        last = docs[-1]
+
+
+def to_row(doc):
+    data = doc.to_dict() or {}
+    updated = data.get("updatedAt")
+    return doc.id, profile_from_responses(data.get("responses", {})), updated.timestamp() if updated else np.nan
+
+
+def read_parallel(queries, page_size):
+    """Rows of every page of every query, as the readers deliver them (one thread per query)."""
+    pages = queue.Queue(maxsize=2 * len(queries))
+    stop = threading.Event()
+
+    def put(item):
+        while not stop.is_set():
+            try:
+                pages.put(item, timeout=0.1)
+                return
+            except queue.Full:
+                continue
+
+    def reader(query):
+        try:
+            for docs in read_pages(query, page_size):
+                if stop.is_set():
+                    return
+                put([to_row(doc) for doc in docs])
+        except Exception as e:
+            put(e)   # fails the whole export; the watermark stays where it was
+        finally:
+            put(None)
+
+    with ThreadPoolExecutor(max_workers=len(queries), thread_name_prefix="export-reader") as executor:
+        for query in queries:
+            executor.submit(reader, query)
+        try:
+            finished = 0
+            while finished < len(queries):
+                page = pages.get()
+                if page is None:
+                    finished += 1
+                elif isinstance(page, Exception):
+                    raise page
+                else:
+                    yield page
+        finally:
+            stop.set()   # lets the other readers exit
+
+
+# ---------------------------------------------------------
+# Shards
+# ---------------------------------------------------------
+def encoder_fingerprint(le_origin, le_fav, mlbs):
+    """Changes whenever the encoded form would (new labels or label order)."""
+    classes = [le_origin.classes_, le_fav.classes_] + [mlbs[feature].classes_ for feature in MULTI_HOT_FEATURES]
+    return hashlib.sha256(json.dumps([[str(c) for c in group] for group in classes]).encode("utf-8")).hexdigest()[:16]
+
+
+class ShardWriter:
+    """Buffers encoded rows and writes them out `shard_rows` at a time."""
+
+    def __init__(self, out_dir, first_shard, shard_rows, encoders):
+        self.out_dir = out_dir
+        self.next_shard = first_shard
+        self.shard_rows = shard_rows
+        self.encoders = encoders
+        self.shards = []
+        self.rows = self.skipped = 0
+        self._buffer = []
+
+    def add(self, rows):
+        self._buffer.extend(rows)
+        while len(self._buffer) >= self.shard_rows:
+            self._write(self._buffer[:self.shard_rows])
+            self._buffer = self._buffer[self.shard_rows:]
+
+    def close(self):
+        if self._buffer:
+            self._write(self._buffer)
+            self._buffer = []
+        return self.shards
+
+    def _write(self, rows):
+        valid, encoded = encode_valid_batch([profile for _, profile, _ in rows], *self.encoders)
+        skipped = sorted(set(range(len(rows))) - set(valid))
+        if encoded is None:
+            encoded = (np.empty((0, 1)), np.empty((0, 1)), np.empty((0, 0)))
+        origin, fav, multi_hot = encoded
+
+        columns = {
+            "user_id": np.array([rows[i][0] for i in valid], dtype=str),
+            "updated_at": np.array([rows[i][2] for i in valid], dtype=np.float64),
+            "origin": origin.reshape(-1).astype(np.int32),
+            "fav": fav.reshape(-1).astype(np.int32),
+            "multi_hot": multi_hot.astype(np.uint8),
+            "skipped": np.array([rows[i][0] for i in skipped], dtype=str),
+        }
+
+        name = "shard-%05d" % self.next_shard
+        final = os.path.join(self.out_dir, name)
+        tmp = final + ".tmp"
+        for path in (tmp, final):   # left behind by a run that did not finish
+            shutil.rmtree(path, ignore_errors=True)
+        os.makedirs(tmp)
+        for column, values in columns.items():
+            np.save(os.path.join(tmp, column + ".npy"), values)
+        os.replace(tmp, final)
+
+        self.shards.append({"name": name, "rows": len(valid), "skipped": len(skipped)})
+        self.next_shard += 1
+        self.rows += len(valid)
+        self.skipped += len(skipped)
+
+
+def read_manifest(out_dir):
+    path = os.path.join(out_dir, MANIFEST)
+    if not os.path.exists(path):
+        return None
+    with open(path) as f:
+        return json.load(f)
+
+
+def write_manifest(out_dir, manifest):
+    tmp = os.path.join(out_dir, MANIFEST + ".tmp")
+    with open(tmp, "w") as f:
+        json.dump(manifest, f, indent=2)
+    os.replace(tmp, os.path.join(out_dir, MANIFEST))
+
+
+def load_export(out_dir):
+    """
+    {column: array} over every shard, one row per user: a user's row from a
+    later shard replaces earlier ones, and a user skipped by a later run
+    (profile no longer encodes) is dropped.
+    """
+    manifest = read_manifest(out_dir)
+    if manifest is None:
+        raise FileNotFoundError("No %s in %s" % (MANIFEST, out_dir))
+
+    parts, seen = [], np.array([], dtype=str)
+    for shard in reversed(manifest["shards"]):
+        path = os.path.join(out_dir, shard["name"])
+        columns = {c: np.load(os.path.join(path, c + ".npy")) for c in COLUMNS}
+        keep = ~np.isin(columns["user_id"], seen)
+        parts.append({c: values[keep] for c, values in columns.items()})
+        seen = np.concatenate([seen, columns["user_id"], np.load(os.path.join(path, "skipped.npy"))])
+
+    parts.reverse()
+    export = {c: np.concatenate([part[c] for part in parts]) for c in COLUMNS if c != "multi_hot"}
+    export["multi_hot"] = np.concatenate([part["multi_hot"].reshape(-1, manifest["multi_hot_dim"]) for part in parts])
+    return export
+
+
+def model_inputs(export):
+    """(origin, fav, multi_hot) float32 arrays, as encoding.encode_user_inputs_batch returns them."""
+    return (
+        export["origin"].astype(np.float32).reshape(-1, 1),
+        export["fav"].astype(np.float32).reshape(-1, 1),
+        export["multi_hot"].astype(np.float32),
+    )
+
+
+# ---------------------------------------------------------
+# Emulator seeding (local runs only)
+# ---------------------------------------------------------
+def seed_emulator(db, count, queries_csv, seed):
+    from google.cloud.firestore import SERVER_TIMESTAMP
+    from bench_backend import load_profiles
+
+    fields = {field: index for index, field in RESPONSE_FIELDS.items()}
+    profiles = load_profiles(queries_csv, count, seed)
+    rng = np.random.default_rng(seed)
+    uids = ["".join(rng.choice(list(UID_ALPHABET), size=28)) for _ in profiles]
+
+    collection = db.collection("userProfiles")
+    for start in range(0, len(profiles), 500):   # Firestore batch limit
+        batch = db.batch()
+        for uid, profile in zip(uids[start:start + 500], profiles[start:start + 500]):
+            responses = {fields[field]: value for field, value in profile.items()}
+            batch.set(collection.document(uid), {"responses": responses, "updatedAt": SERVER_TIMESTAMP}, merge=True)
+        batch.commit()
+    print(f"Seeded {len(profiles)} profiles into the emulator")
+
+
+# ---------------------------------------------------------
+# Driver
+# ---------------------------------------------------------
+def load_encoders(bundle, mode):
+    if mode == "lite":
+        from lite_serving import load_lite_encoders
+        return load_lite_encoders(bundle.file("label_mappings.json"), bundle.file("vacation_types.json"))
+    import joblib
+    return (joblib.load(bundle.file("le_origin.pkl")), joblib.load(bundle.file("le_fav.pkl")),
+            joblib.load(bundle.file("mlbs.pkl")))
+
+
+def export(collection, out_dir, encoders, full=False, readers=8, page_size=500, shard_rows=100_000, lag=60.0,
+           now=None):
+    """One export run; returns the updated manifest."""
+    os.makedirs(out_dir, exist_ok=True)
+    fingerprint = encoder_fingerprint(*encoders)
+    manifest = read_manifest(out_dir)
+
+    if manifest is not None and not full and manifest["encoder"] != fingerprint:
+        raise ValueError("Encoders changed since the last export (%s -> %s); run with --full"
+                         % (manifest["encoder"], fingerprint))
+    if manifest is None:
+        full = True
+
+    # Saves newer than the cutoff may not be visible to queries yet: the next run picks them up
+    now = now or datetime.datetime.now(datetime.timezone.utc)
+    until = now - datetime.timedelta(seconds=lag)
+    if full:
+        since = None
+        queries = id_range_queries(collection, readers)
+    else:
+        since = datetime.datetime.fromisoformat(manifest["watermark"])
+        queries = updated_range_queries(collection, since, until, readers)
+
+    start = time.perf_counter()
+    first_shard = manifest["next_shard"] if manifest else 0
+    writer = ShardWriter(out_dir, first_shard, shard_rows, encoders)
+    for rows in read_parallel(queries, page_size):
+        writer.add(rows)
+    shards = writer.close()
+
+    run = {
+        "mode": "full" if full else "incremental",
+        "since": since.isoformat() if since else None,
+        "until": until.isoformat(),
+        "rows": writer.rows,
+        "skipped": writer.skipped,
+        "seconds": round(time.perf_counter() - start, 3),
+    }
+    # A full export starts a new history; an incremental one appends to it
+    runs = manifest["runs"] if manifest and not full else []
+    old_shards = manifest["shards"] if manifest and not full else []
+    new_manifest = {
+        "format": 1,
+        "encoder": fingerprint,
+        "multi_hot_dim": sum(len(encoders[2][feature].classes_) for feature in MULTI_HOT_FEATURES),
+        "watermark": until.isoformat(),
+        "next_shard": writer.next_shard,
+        "shards": old_shards + [dict(shard, run=len(runs)) for shard in shards],
+        "runs": runs + [run],
+    }
+    write_manifest(out_dir, new_manifest)
+
+    # A full export replaces everything before it
+    if full and manifest is not None:
+        for shard in manifest["shards"]:
+            shutil.rmtree(os.path.join(out_dir, shard["name"]), ignore_errors=True)
+    return new_manifest
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--out", default=os.path.join(HERE, "profile_export"))
+    parser.add_argument("--artifacts", default=os.path.join(HERE, "artifacts"))
+    parser.add_argument("--mode", choices=["full", "lite"], default=os.environ.get("SERVING_MODE", "full"),
+                        help="which encoders to load (both produce the same encoding)")
+    parser.add_argument("--full", action="store_true", help="re-export every profile and drop older shards")
+    parser.add_argument("--readers", type=int, default=8, help="parallel page readers")
+    parser.add_argument("--page-size", type=int, default=500)
+    parser.add_argument("--shard-rows", type=int, default=100_000)
+    parser.add_argument("--lag", type=float, default=60.0, help="seconds; saves newer than now - lag wait for the next run")
+    parser.add_argument("--seed-emulator", type=int, metavar="N", help="first write N profiles from queries.csv")
+    parser.add_argument("--queries-csv", default=os.path.join(HERE, "..", "..", "Datasets", "queries.csv"))
+    args = parser.parse_args()
+
+    if args.seed_emulator and not os.environ.get("FIRESTORE_EMULATOR_HOST"):
+        parser.error("--seed-emulator only writes to the emulator (set FIRESTORE_EMULATOR_HOST)")
+
+    db = firestore_client()
+    if args.seed_emulator:
+        seed_emulator(db, args.seed_emulator, args.queries_csv, seed=0)
+
+    bundle = load_current(args.artifacts, verify=False)
+    manifest = export(
+        db.collection("userProfiles"), args.out, load_encoders(bundle, args.mode), full=args.full, readers=args.readers,
+        page_size=args.page_size, shard_rows=args.shard_rows, lag=args.lag,
+    )
+    run = manifest["runs"][-1]
+    print(f"{run['mode'].capitalize()} export: {run['rows']} profiles written, {run['skipped']} skipped "
+          f"(incomplete or unknown labels) in {run['seconds']:.1f}s; watermark {manifest['watermark']}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,197 @@
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future
+
+
+# ---------------------------------------------------------
+# Feedback backends: where likes/dislikes are read from
+# ---------------------------------------------------------
+class FeedbackBackend:
+    """
+    Interface for reading a user's swipe history.
+    fetch(user_id) returns (liked_city_ids, disliked_city_ids).
+    write(swipes) stores (user_id, city_id, liked, payload) tuples; it may be
+    retried with the same swipes, so it must be idempotent.
+    """
+
+    def fetch(self, user_id):
+        raise NotImplementedError
+
+    def write(self, swipes):
+        raise NotImplementedError
+
+
+class FirestoreFeedbackBackend(FeedbackBackend):
+    def __init__(self, db, favorites_collection="userFavorites", dislikes_collection="userDislikes"):
+        self.db = db
+        self.favorites_collection = favorites_collection
+        self.dislikes_collection = dislikes_collection
+
+    def fetch(self, user_id):
+        fav_ref = self.db.collection(self.favorites_collection).document(user_id)
+        dislike_ref = self.db.collection(self.dislikes_collection).document(user_id)
+
+        # One batched read for both documents instead of two sequential get() calls.
+        # get_all does not promise ordering, so match snapshots up by collection.
+        docs = {doc.reference.parent.id: doc for doc in self.db.get_all([fav_ref, dislike_ref])}
+        fav_doc = docs.get(self.favorites_collection)
+        dislike_doc = docs.get(self.dislikes_collection)
+
+        liked = list(fav_doc.to_dict().keys()) if fav_doc is not None and fav_doc.exists else []
+        disliked = list(dislike_doc.to_dict().keys()) if dislike_doc is not None and dislike_doc.exists else []
+
+        return liked, disliked
+
+    def write(self, swipes):
+        """
+        Merge writes into the same documents the app used to write itself
+        ({city_id: city card}). Swipes for one user document fold into a single
+        write, and each commit holds at most 500 writes (Firestore's limit).
+        """
+        docs = {}
+        for user_id, city_id, liked, payload in swipes:
+            collection = self.favorites_collection if liked else self.dislikes_collection
+            docs.setdefault((collection, user_id), {})[city_id] = payload if payload is not None else True
+
+        items = list(docs.items())
+        for start in range(0, len(items), 500):
+            batch = self.db.batch()
+            for (collection, user_id), fields in items[start:start + 500]:
+                batch.set(self.db.collection(collection).document(user_id), fields, merge=True)
+            batch.commit()
+        return len(items)
+
+
+class InMemoryFeedbackBackend(FeedbackBackend):
+    """
+    In-process stand-in for Firestore, used for local runs and tests.
+    `latency` (seconds) is slept on every fetch to mimic a network round trip.
+    """
+
+    def __init__(self, latency=0.0):
+        self.liked = {}
+        self.disliked = {}
+        self.reads = 0
+        self.commits = 0
+        self.latency = latency
+        self._lock = threading.Lock()
+
+    def record(self, user_id, city_id, liked):
+        with self._lock:
+            target = self.liked if liked else self.disliked
+            target.setdefault(user_id, {})[city_id] = True
+
+    def write(self, swipes):
+        if self.latency:
+            time.sleep(self.latency)
+        for user_id, city_id, liked, _ in swipes:
+            self.record(user_id, city_id, liked)
+        with self._lock:
+            self.commits += 1
+        return len(swipes)
+
+    def fetch(self, user_id):
+        if self.latency:
+            time.sleep(self.latency)
+        with self._lock:
+            self.reads += 1
+            return list(self.liked.get(user_id, {})), list(self.disliked.get(user_id, {}))
+
+
+# ---------------------------------------------------------
+# Read-through cache in front of a backend
+# ---------------------------------------------------------
+class FeedbackCache:
+    """
+    Per-user read-through cache of (liked, disliked) city ids.
+    Entries expire after `ttl` seconds and the least recently used user is
+    evicted once `max_users` entries are held. Call invalidate() whenever a
+    swipe is recorded so the next read goes back to the backend.
+    """
+
+    def __init__(self, backend, ttl=30.0, max_users=10000, clock=time.monotonic):
+        self.backend = backend
+        self.ttl = ttl
+        self.max_users = max_users
+        self.clock = clock
+
+        self.hits = 0
+        self.misses = 0
+
+        self._entries = OrderedDict()   # user_id -> (expires_at, liked, disliked)
+        self._fetching = {}             # user_id -> [fetches in flight, generation], bumped by invalidate
+        self._lock = threading.Lock()
+
+    def _lookup(self, user_id, now):
+        # Caller holds the lock
+        entry = self._entries.get(user_id)
+        if entry is not None and entry[0] > now:
+            self._entries.move_to_end(user_id)
+            self.hits += 1
+            return list(entry[1]), list(entry[2])
+        return None
+
+    def get_async(self, user_id, executor):
+        """
+        Future for get(user_id). Cache hits complete immediately; misses run the
+        backend read on `executor` so the caller can do other work meanwhile.
+        """
+        with self._lock:
+            cached = self._lookup(user_id, self.clock())
+        if cached is None:
+            return executor.submit(self.get, user_id)
+
+        future = Future()
+        future.set_result(cached)
+        return future
+
+    def get(self, user_id):
+        now = self.clock()
+        with self._lock:
+            cached = self._lookup(user_id, now)
+            if cached is not None:
+                return cached
+            self.misses += 1
+            fetching = self._fetching.setdefault(user_id, [0, 0])
+            fetching[0] += 1
+            generation = fetching[1]
+
+        # Fetch outside the lock so one slow read does not block other users
+        try:
+            liked, disliked = self.backend.fetch(user_id)
+        except Exception:
+            with self._lock:
+                self._done_fetching(user_id, fetching)
+            raise
+
+        with self._lock:
+            self._done_fetching(user_id, fetching)
+            # A swipe by this user landed while we were reading, so this result may be stale
+            if generation != fetching[1]:
+                return list(liked), list(disliked)
+            self._entries[user_id] = (now + self.ttl, tuple(liked), tuple(disliked))
+            self._entries.move_to_end(user_id)
+            while len(self._entries) > self.max_users:
+                self._entries.popitem(last=False)
+
+        return list(liked), list(disliked)
+
+    def _done_fetching(self, user_id, fetching):
+        # Caller holds the lock
+        fetching[0] -= 1
+        if not fetching[0]:
+            del self._fetching[user_id]
+
+    def invalidate(self, user_id):
+        with self._lock:
+            self._entries.pop(user_id, None)
+            if user_id in self._fetching:
+                self._fetching[user_id][1] += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
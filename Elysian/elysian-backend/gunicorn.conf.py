@@ -0,0 +1,16 @@
+import os
+
+# Picked up automatically by `gunicorn app:app` when run from this directory.
+# Threads share one loaded model; app.py sizes its interpreter pool from
+# GUNICORN_THREADS so every thread can hold an interpreter at once.
+bind = "0.0.0.0:" + os.environ.get("PORT", "5003")
+workers = int(os.environ.get("WEB_CONCURRENCY", "1"))
+threads = int(os.environ.get("GUNICORN_THREADS", "4"))
+worker_class = "gthread"
+timeout = int(os.environ.get("GUNICORN_TIMEOUT", "60"))
+
+
+def worker_exit(server, worker):
+    # Commit (or spill) the swipes this worker still buffers before it goes away
+    from app import swipe_writer
+    swipe_writer.close()
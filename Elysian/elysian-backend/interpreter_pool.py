@@ -0,0 +1,84 @@
+import queue
+import threading
+import time
+from contextlib import contextmanager
+
+
+# ---------------------------------------------------------
+# Bounded pool of TFLite interpreters
+# ---------------------------------------------------------
+class InterpreterPool:
+    """
+    A fixed number of interpreters built from one in-memory model buffer.
+    tf.lite.Interpreter is not safe for concurrent set_tensor/invoke, so each
+    request checks one out, uses it exclusively and returns it. When every
+    interpreter is busy the caller blocks until one is free (or `timeout`).
+    """
+
+    def __init__(self, model_content, size, interpreter_cls, num_threads=None):
+        if size < 1:
+            raise ValueError("Interpreter pool size must be at least 1")
+
+        self.size = size
+        self._free = queue.LifoQueue(maxsize=size)
+
+        for _ in range(size):
+            interp = interpreter_cls(model_content=model_content, num_threads=num_threads)
+            interp.allocate_tensors()
+            self._free.put(interp)
+
+        # Metrics
+        self._lock = threading.Lock()
+        self.in_use = 0
+        self.peak_in_use = 0
+        self.checkouts = 0
+        self.saturated_checkouts = 0   # checkouts that found no free interpreter
+        self.timeouts = 0
+        self.wait_seconds_total = 0.0
+        self.wait_seconds_max = 0.0
+
+    @contextmanager
+    def checkout(self, timeout=None):
+        start = time.perf_counter()
+        try:
+            interp = self._free.get_nowait()
+            saturated = False
+        except queue.Empty:
+            saturated = True
+            try:
+                interp = self._free.get(timeout=timeout)
+            except queue.Empty:
+                with self._lock:
+                    self.saturated_checkouts += 1
+                    self.timeouts += 1
+                raise TimeoutError("No TFLite interpreter free after %.2fs" % timeout)
+        waited = time.perf_counter() - start
+
+        with self._lock:
+            self.checkouts += 1
+            self.saturated_checkouts += int(saturated)
+            self.wait_seconds_total += waited
+            self.wait_seconds_max = max(self.wait_seconds_max, waited)
+            self.in_use += 1
+            self.peak_in_use = max(self.peak_in_use, self.in_use)
+
+        try:
+            yield interp
+        finally:
+            with self._lock:
+                self.in_use -= 1
+            self._free.put(interp)
+
+    def stats(self):
+        with self._lock:
+            return {
+                "size": self.size,
+                "in_use": self.in_use,
+                "peak_in_use": self.peak_in_use,
+                "checkouts": self.checkouts,
+                "saturated_checkouts": self.saturated_checkouts,
+                "timeouts": self.timeouts,
+                "wait_seconds_total": self.wait_seconds_total,
+                "wait_seconds_max": self.wait_seconds_max,
+                "wait_seconds_avg": self.wait_seconds_total / self.checkouts if self.checkouts else 0.0,
+            }
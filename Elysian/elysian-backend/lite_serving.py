@@ -0,0 +1,79 @@
+"""
+Pieces for SERVING_MODE=lite: a TFLite interpreter without the full
+tensorflow package, and label encoders rebuilt from label_mappings.json /
+vacation_types.json as plain dict lookups instead of unpickling scikit-learn.
+"""
+import json
+
+import numpy as np
+
+
+# ---------------------------------------------------------
+# Interpreter from tflite_runtime (or its successor ai_edge_litert)
+# ---------------------------------------------------------
+def load_interpreter_class():
+    try:
+        from tflite_runtime.interpreter import Interpreter
+    except ImportError:
+        from ai_edge_litert.interpreter import Interpreter
+    return Interpreter
+
+
+# ---------------------------------------------------------
+# Drop-in replacements for LabelEncoder / MultiLabelBinarizer.transform
+# ---------------------------------------------------------
+class DictLabelEncoder:
+    def __init__(self, classes):
+        self.classes_ = list(classes)
+        self._index = {label: i for i, label in enumerate(self.classes_)}
+        # The JSON export wrote the encoder's NaN class as the string "nan"
+        self._nan_index = self._index.pop("nan", None)
+
+    def _lookup(self, value):
+        if isinstance(value, float) and value != value and self._nan_index is not None:
+            return self._nan_index
+        try:
+            return self._index[value]
+        except (KeyError, TypeError):
+            raise ValueError("y contains previously unseen labels: %r" % (value,))
+
+    def transform(self, values):
+        return np.array([self._lookup(v) for v in values], dtype=np.int64)
+
+
+class DictMultiLabelBinarizer:
+    def __init__(self, classes):
+        self.classes_ = list(classes)
+        self._index = {label: i for i, label in enumerate(self.classes_)}
+
+    def transform(self, rows):
+        # Unknown labels are ignored, matching MultiLabelBinarizer
+        out = np.zeros((len(rows), len(self.classes_)), dtype=np.int64)
+        for r, values in enumerate(rows):
+            for v in values:
+                i = self._index.get(v)
+                if i is not None:
+                    out[r, i] = 1
+        return out
+
+
+def _split_labels(combos):
+    # label_mappings.json stores the raw "Fall|Spring" combos; the binarizers use single labels
+    return sorted({label for combo in combos for label in combo.split("|")})
+
+
+def load_lite_encoders(mappings_path="label_mappings.json", vacation_types_path="vacation_types.json"):
+    with open(mappings_path) as f:
+        mappings = json.load(f)
+    with open(vacation_types_path) as f:
+        vacation_types = json.load(f)
+
+    le_origin = DictLabelEncoder(mappings["origin_country"])
+    le_fav = DictLabelEncoder(mappings["favorite_country_visited"])
+    mlbs = {
+        "vacation_types": DictMultiLabelBinarizer(sorted(vacation_types)),
+        "seasons": DictMultiLabelBinarizer(_split_labels(mappings["seasons"])),
+        "budget": DictMultiLabelBinarizer(_split_labels(mappings["budget"])),
+        "place_type": DictMultiLabelBinarizer(_split_labels(mappings["place_type"])),
+    }
+    return le_origin, le_fav, mlbs
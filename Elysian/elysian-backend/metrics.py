@@ -0,0 +1,165 @@
+"""
+Request instrumentation: per-stage timing spans, latency histograms and a
+Prometheus text-format renderer for /metrics.
+
+Code wraps each stage of a request in `with span("encode"):`. The duration is
+recorded into the elysian_stage_seconds histogram, labelled with the endpoint
+of the request being served, and kept on the request's Trace so the response
+can report it in a Server-Timing header.
+
+Metrics live in the worker process; with several gunicorn workers each one
+exposes its own, so scrape every worker (or run one worker per container).
+"""
+import bisect
+import contextvars
+import threading
+import time
+from contextlib import contextmanager
+
+# Seconds; request stages range from tens of microseconds to a slow Firestore read
+DEFAULT_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025,
+                   0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+def _labels(names, values):
+    if not names:
+        return ""
+    pairs = ",".join('%s="%s"' % (name, str(value).replace("\\", "\\\\").replace('"', '\\"'))
+                     for name, value in zip(names, values))
+    return "{%s}" % pairs
+
+
+class Counter:
+    def __init__(self, name, help, label_names=()):
+        self.name = name
+        self.help = help
+        self.label_names = tuple(label_names)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, *label_values, amount=1):
+        with self._lock:
+            self._values[label_values] = self._values.get(label_values, 0) + amount
+
+    def render(self):
+        lines = ["# HELP %s %s" % (self.name, self.help), "# TYPE %s counter" % self.name]
+        with self._lock:
+            for label_values, value in sorted(self._values.items()):
+                lines.append("%s%s %s" % (self.name, _labels(self.label_names, label_values), value))
+        return lines
+
+
+class Histogram:
+    def __init__(self, name, help, label_names=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.help = help
+        self.label_names = tuple(label_names)
+        self.buckets = tuple(buckets)
+        self._series = {}   # label values -> [bucket counts..., +Inf count, sum]
+        self._lock = threading.Lock()
+
+    def observe(self, value, *label_values):
+        slot = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(label_values)
+            if series is None:
+                series = self._series[label_values] = [0] * (len(self.buckets) + 1) + [0.0]
+            series[slot] += 1
+            series[-1] += value
+
+    def render(self):
+        lines = ["# HELP %s %s" % (self.name, self.help), "# TYPE %s histogram" % self.name]
+        names = self.label_names + ("le",)
+        with self._lock:
+            for label_values, series in sorted(self._series.items()):
+                cumulative = 0
+                for bound, count in zip(self.buckets + ("+Inf",), series[:-1]):
+                    cumulative += count
+                    lines.append("%s_bucket%s %d" % (self.name, _labels(names, label_values + (bound,)), cumulative))
+                labels = _labels(self.label_names, label_values)
+                lines.append("%s_sum%s %r" % (self.name, labels, series[-1]))
+                lines.append("%s_count%s %d" % (self.name, labels, cumulative))
+        return lines
+
+
+REQUEST_SECONDS = Histogram(
+    "elysian_request_seconds", "Request latency by endpoint and status", ["endpoint", "status"]
+)
+STAGE_SECONDS = Histogram(
+    "elysian_stage_seconds", "Time spent in each stage of a request", ["endpoint", "stage"]
+)
+REQUEST_ERRORS = Counter(
+    "elysian_request_errors_total", "Requests that failed, by exception type", ["endpoint", "error"]
+)
+
+
+# ---------------------------------------------------------
+# Per-request trace
+# ---------------------------------------------------------
+class Trace:
+    def __init__(self, endpoint):
+        self.endpoint = endpoint
+        self.start = time.perf_counter()
+        self.spans = []   # (stage, seconds), in completion order
+
+    def server_timing(self):
+        """Value for a Server-Timing response header (durations in ms)."""
+        return ", ".join("%s;dur=%.3f" % (stage, 1000.0 * seconds) for stage, seconds in self.spans)
+
+
+_current = contextvars.ContextVar("elysian_trace", default=None)
+
+
+def start_trace(endpoint):
+    trace = Trace(endpoint)
+    return trace, _current.set(trace)
+
+
+def end_trace(token):
+    _current.reset(token)
+
+
+def current_trace():
+    return _current.get()
+
+
+@contextmanager
+def span(stage):
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - start
+        trace = _current.get()
+        STAGE_SECONDS.observe(elapsed, trace.endpoint if trace else "none", stage)
+        if trace is not None:
+            trace.spans.append((stage, elapsed))
+
+
+# ---------------------------------------------------------
+# Exposition
+# ---------------------------------------------------------
+def render_stats(prefix, stats):
+    """
+    Flatten a component's stats() dict into untyped samples, e.g.
+    {"hits": 3} -> elysian_profile_cache_hits 3. Non-numeric values are skipped.
+    """
+    lines = []
+    for key, value in sorted(stats.items()):
+        if isinstance(value, bool):
+            value = int(value)
+        if not isinstance(value, (int, float)):
+            continue
+        name = "%s_%s" % (prefix, key)
+        lines.append("# TYPE %s untyped" % name)
+        lines.append("%s %r" % (name, value))
+    return lines
+
+
+def render(components):
+    """Prometheus text format: request metrics plus {component: stats dict or None}."""
+    lines = REQUEST_SECONDS.render() + STAGE_SECONDS.render() + REQUEST_ERRORS.render()
+    for component, stats in components.items():
+        if stats:
+            lines.extend(render_stats("elysian_" + component, stats))
+    return "\n".join(lines) + "\n"
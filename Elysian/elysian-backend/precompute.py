@@ -0,0 +1,295 @@
+"""
+Offline batch job: precompute every user's embedding and top-k cities for the
+active artifact bundle and write them to a PrecomputedStore. With
+PRECOMPUTED_STORE pointing at the file, /recommend and /next_city skip the
+encoder for any profile that has not changed since the job ran.
+
+    python precompute.py --source firestore --store precomputed.sqlite
+    python precompute.py --source ../recommendation_engine/user_preferences.csv --workers 8
+    python precompute.py --source firestore --user-encoder int8   # for a backend run with USER_ENCODER=int8
+
+Profiles are streamed (never all in memory), encoded and embedded in large
+batches across worker processes, and each batch is committed together with a
+checkpoint. Re-running the same command after a crash resumes after the
+last committed batch. A job that reaches the end of its input clears its
+checkpoint, so the next run is a fresh pass that picks up changed profiles;
+profiles whose results already exist for this bundle are skipped.
+"""
+import argparse
+import csv
+import hashlib
+import json
+import multiprocessing
+import os
+import time
+
+import numpy as np
+
+from artifacts import load_bundle, load_current
+from encoding import ENCODER_VARIANTS, encode_valid_batch, encoder_file, run_user_encoder
+from precomputed_store import PrecomputedStore, result_version
+from profile_cache import profile_key
+from scoring import top_k_per_row
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+# userProfiles.responses index -> request field, as the app sends them (recommendations.tsx)
+RESPONSE_FIELDS = {
+    "0": "origin_country",
+    "1": "vacation_types",
+    "2": "seasons",
+    "3": "budget",
+    "4": "favorite_country_visited",
+    "5": "place_type",
+}
+LIST_FIELDS = {"vacation_types", "seasons", "budget", "place_type"}
+
+# user_preferences.csv (query_firestore.py) column -> request field
+CSV_FIELDS = {
+    "current_country": "origin_country",
+    "vacation_type": "vacation_types",
+    "seasons": "seasons",
+    "budget": "budget",
+    "country_pref": "favorite_country_visited",
+    "place_type": "place_type",
+}
+
+
+# ---------------------------------------------------------
+# Profile sources: yield (cursor, user_id, profile) in a stable order
+# ---------------------------------------------------------
+def profile_from_responses(responses):
+    profile = {}
+    for index, field in RESPONSE_FIELDS.items():
+        value = responses.get(index)
+        profile[field] = (value or []) if field in LIST_FIELDS else value
+    return profile
+
+
+def iter_firestore_profiles(after=None):
+    import firebase_admin
+    from firebase_admin import credentials, firestore
+
+    if not firebase_admin._apps:
+        cred = credentials.Certificate(json.loads(os.environ["FIREBASE_SERVICE_ACCOUNT"]))
+        firebase_admin.initialize_app(cred)
+    collection = firestore.client().collection("userProfiles")
+
+    # Document-id order makes the last processed id a valid resume cursor
+    query = collection.order_by("__name__")
+    if after is not None:
+        last = collection.document(after).get()
+        if last.exists:
+            query = query.start_after(last)
+
+    for doc in query.stream():
+        if after is not None and doc.id <= after:
+            continue
+        yield doc.id, doc.id, profile_from_responses(doc.to_dict().get("responses", {}))
+
+
+def iter_csv_profiles(path, after=None):
+    # Cursor is the data row number; lists were comma-joined by query_firestore.py
+    skip = int(after) if after is not None else 0
+    with open(path, newline="") as f:
+        for row_no, row in enumerate(csv.DictReader(f), start=1):
+            if row_no <= skip:
+                continue
+            profile = {}
+            for column, field in CSV_FIELDS.items():
+                value = row.get(column) or ""
+                profile[field] = [v for v in value.split(",") if v] if field in LIST_FIELDS else value
+            yield str(row_no), row["uid"], profile
+
+
+def iter_jsonl_profiles(path, after=None):
+    # One {"user_id": ..., <request fields>} object per line
+    skip = int(after) if after is not None else 0
+    with open(path) as f:
+        for line_no, line in enumerate(f, start=1):
+            if line_no <= skip or not line.strip():
+                continue
+            profile = json.loads(line)
+            yield str(line_no), profile.pop("user_id", None), profile
+
+
+def iter_profiles(source, after=None):
+    if source == "firestore":
+        return iter_firestore_profiles(after)
+    if source.endswith(".jsonl"):
+        return iter_jsonl_profiles(source, after)
+    return iter_csv_profiles(source, after)
+
+
+def batched(items, size):
+    batch = []
+    for item in items:
+        batch.append(item)
+        if len(batch) == size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+# ---------------------------------------------------------
+# Worker processes: each loads the bundle once and embeds whole batches
+# ---------------------------------------------------------
+_worker = {}
+
+
+def init_worker(bundle_path, mode, num_threads, k, encoder="float32"):
+    bundle = load_bundle(bundle_path, verify=False)
+
+    if mode == "lite":
+        from lite_serving import load_interpreter_class, load_lite_encoders
+        interpreter_cls = load_interpreter_class()
+        encoders = load_lite_encoders(bundle.file("label_mappings.json"), bundle.file("vacation_types.json"))
+    else:
+        import joblib
+        import tensorflow as tf
+        interpreter_cls = tf.lite.Interpreter
+        encoders = (joblib.load(bundle.file("le_origin.pkl")), joblib.load(bundle.file("le_fav.pkl")),
+                    joblib.load(bundle.file("mlbs.pkl")))
+
+    interpreter = interpreter_cls(model_content=bundle.read_bytes(encoder_file(encoder)), num_threads=num_threads)
+    interpreter.allocate_tensors()
+
+    _worker.update(
+        encoders=encoders,
+        interpreter=interpreter,
+        city_vectors=np.asarray(bundle.load_array("city_vectors.npy"), dtype=np.float32),
+        k=k,
+    )
+
+
+def embed_batch(profiles):
+    """(valid positions, top-k indices, top-k scores, embeddings) for one batch."""
+    valid, encoded = encode_valid_batch(profiles, *_worker["encoders"])
+    if not valid:
+        return [], None, None, None
+
+    origin, fav, multi_hot = encoded
+    user_vecs = run_user_encoder(_worker["interpreter"], origin, fav, multi_hot)
+
+    scores = user_vecs @ _worker["city_vectors"].T
+    top_idx = top_k_per_row(scores, _worker["k"])
+    top_scores = np.take_along_axis(scores, top_idx, axis=1)
+    return valid, top_idx, top_scores, user_vecs
+
+
+# ---------------------------------------------------------
+# Driver
+# ---------------------------------------------------------
+def job_name(source, version, k):
+    # `version` is the result version, so each encoder variant has its own checkpoint
+    source_id = source if source == "firestore" else os.path.abspath(source)
+    return hashlib.sha1(("%s|%s|%d" % (source_id, version, k)).encode("utf-8")).hexdigest()[:16]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--source", default="firestore", help="'firestore', a user_preferences.csv, or a .jsonl file")
+    parser.add_argument("--store", default=os.path.join(HERE, "precomputed.sqlite"))
+    parser.add_argument("--artifacts", default=os.path.join(HERE, "artifacts"))
+    parser.add_argument("--k", type=int, default=20, help="cities kept per profile")
+    parser.add_argument("--batch-size", type=int, default=4096)
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--mode", choices=["full", "lite"], default=os.environ.get("SERVING_MODE", "full"))
+    parser.add_argument("--user-encoder", choices=ENCODER_VARIANTS, default=os.environ.get("USER_ENCODER", "float32"),
+                        help="encoder variant the backend serves with (its USER_ENCODER)")
+    parser.add_argument("--restart", action="store_true", help="ignore the checkpoint and start over")
+    parser.add_argument("--prune", action="store_true", help="drop results from other bundle versions")
+    args = parser.parse_args()
+
+    bundle = load_current(args.artifacts)
+    store = PrecomputedStore(args.store, readonly=False)
+    version = result_version(bundle.version, args.user_encoder)
+    job = job_name(args.source, version, args.k)
+
+    if args.restart:
+        store.reset(job)
+    checkpoint = store.checkpoint(job)
+    after, processed, written = checkpoint if checkpoint else (None, 0, 0)
+    if after is not None:
+        print(f"Resuming job {job} after {after} ({processed} profiles processed, {written} written)")
+
+    # One interpreter thread per worker when there are several workers
+    num_threads = 1 if args.workers > 1 else None
+    pool = multiprocessing.Pool(
+        args.workers, initializer=init_worker,
+        initargs=(bundle.path, args.mode, num_threads, args.k, args.user_encoder),
+    )
+
+    def pending():
+        # Only profiles without results for this bundle go to the workers
+        for batch in batched(iter_profiles(args.source, after), args.batch_size):
+            keys = [profile_key(profile) if _has_key_fields(profile) else None for _, _, profile in batch]
+            known = store.existing_keys(version, {key for key in keys if key})
+
+            todo, todo_keys, seen = [], [], set()
+            for (_, _, profile), key in zip(batch, keys):
+                if key and key not in known and key not in seen:
+                    seen.add(key)
+                    todo.append(profile)
+                    todo_keys.append(key)
+            yield batch[-1][0], len(batch), todo_keys, todo
+
+    start = time.perf_counter()
+    skipped = 0
+    batches = pending()
+
+    def submit(item):
+        cursor, size, keys, todo = item
+        return cursor, size, keys, (pool.apply_async(embed_batch, (todo,)) if todo else None)
+
+    # Keep a few batches in flight per worker; commit them strictly in source order
+    in_flight = []
+    try:
+        for item in batches:
+            in_flight.append(submit(item))
+            if len(in_flight) < 2 * args.workers:
+                continue
+            processed, written, skipped = _commit(store, version, job, in_flight.pop(0), processed, written, skipped)
+            _report(processed, written, skipped, start)
+        while in_flight:
+            processed, written, skipped = _commit(store, version, job, in_flight.pop(0), processed, written, skipped)
+        pool.close()
+    finally:
+        pool.terminate()
+        pool.join()
+
+    _report(processed, written, skipped, start)
+    # End of input: the next run starts over instead of resuming past every profile
+    store.reset(job)
+    if args.prune:
+        print(f"Pruned {store.prune(bundle.version)} rows from older bundles")
+
+
+def _has_key_fields(profile):
+    return profile.get("origin_country") is not None and "favorite_country_visited" in profile
+
+
+def _commit(store, version, job, item, processed, written, skipped):
+    cursor, size, keys, result = item
+    rows = 0
+    if result is not None:
+        valid, top_idx, top_scores, user_vecs = result.get()
+        skipped += len(keys) - len(valid)
+        keys = [keys[i] for i in valid]
+        rows = len(keys)
+    else:
+        keys, top_idx, top_scores, user_vecs = [], None, None, None
+
+    store.write_batch(version, keys, top_idx, top_scores, user_vecs, job, cursor, processed + size)
+    return processed + size, written + rows, skipped
+
+
+def _report(processed, written, skipped, start):
+    elapsed = time.perf_counter() - start
+    print(f"{processed} profiles processed, {written} written, {skipped} skipped "
+          f"(unknown labels) in {elapsed:.1f}s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,156 @@
+"""
+On-disk store of precomputed recommendations, written by precompute.py and
+read by the backend.
+
+One SQLite file, one row per (bundle version, profile key) holding the user
+embedding and the top-k city indices/scores as packed little-endian arrays
+(about 250 bytes per profile at k=20). Rows are keyed by profile content, so
+a user whose answers have not changed hits the same row, and users with
+identical answers share one. Results embedded with a quantized user encoder
+(USER_ENCODER) are stored under result_version(), so the backend only serves
+rows made by the encoder it runs itself. A checkpoints table records how far each
+precompute job got so an interrupted run resumes where it stopped.
+"""
+import sqlite3
+import threading
+import time
+from collections import namedtuple
+
+import numpy as np
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS results (
+    version     TEXT NOT NULL,
+    profile_key TEXT NOT NULL,
+    city_idx    BLOB NOT NULL,
+    scores      BLOB NOT NULL,
+    embedding   BLOB NOT NULL,
+    PRIMARY KEY (version, profile_key)
+) WITHOUT ROWID;
+
+CREATE TABLE IF NOT EXISTS checkpoints (
+    job        TEXT PRIMARY KEY,
+    cursor     TEXT,
+    processed  INTEGER NOT NULL,
+    written    INTEGER NOT NULL,
+    updated_at TEXT NOT NULL
+);
+"""
+
+Precomputed = namedtuple("Precomputed", ["city_idx", "scores", "embedding"])
+
+
+def result_version(bundle_version, encoder="float32"):
+    """Version column for results of one bundle embedded with one user encoder variant."""
+    return bundle_version if encoder == "float32" else "%s/%s" % (bundle_version, encoder)
+
+
+class PrecomputedStore:
+    def __init__(self, path, readonly=True):
+        self.path = path
+        self.readonly = readonly
+
+        self.hits = 0
+        self.misses = 0
+
+        # sqlite3 connections are per thread
+        self._local = threading.local()
+
+        if not readonly:
+            conn = self._conn()
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.executescript(SCHEMA)
+
+    def _conn(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            if self.readonly:
+                conn = sqlite3.connect("file:%s?mode=ro" % self.path, uri=True)
+            else:
+                conn = sqlite3.connect(self.path)
+            self._local.conn = conn
+        return conn
+
+    # -----------------------------------------------------
+    # Serving side
+    # -----------------------------------------------------
+    def get(self, version, profile_key):
+        try:
+            row = self._conn().execute(
+                "SELECT city_idx, scores, embedding FROM results WHERE version = ? AND profile_key = ?",
+                (version, profile_key),
+            ).fetchone()
+        except sqlite3.Error:
+            # No store yet, or it is mid-rebuild: the caller computes live
+            self._local.conn = None
+            row = None
+
+        if row is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return Precomputed(
+            np.frombuffer(row[0], dtype="<i4"),
+            np.frombuffer(row[1], dtype="<f4"),
+            np.frombuffer(row[2], dtype="<f4"),
+        )
+
+    def stats(self):
+        return {"hits": self.hits, "misses": self.misses}
+
+    # -----------------------------------------------------
+    # Job side
+    # -----------------------------------------------------
+    def existing_keys(self, version, profile_keys):
+        found = set()
+        keys = list(profile_keys)
+        for start in range(0, len(keys), 900):   # stay under SQLite's bound-parameter limit
+            chunk = keys[start:start + 900]
+            rows = self._conn().execute(
+                "SELECT profile_key FROM results WHERE version = ? AND profile_key IN (%s)"
+                % ",".join("?" * len(chunk)),
+                [version] + chunk,
+            )
+            found.update(r[0] for r in rows)
+        return found
+
+    def write_batch(self, version, profile_keys, city_idx, scores, embeddings, job, cursor, processed):
+        """Results and the job's new checkpoint commit together, so a crash never loses or skips a batch."""
+        rows = [
+            (
+                version, key,
+                np.ascontiguousarray(city_idx[i], dtype="<i4").tobytes(),
+                np.ascontiguousarray(scores[i], dtype="<f4").tobytes(),
+                np.ascontiguousarray(embeddings[i], dtype="<f4").tobytes(),
+            )
+            for i, key in enumerate(profile_keys)
+        ]
+        conn = self._conn()
+        with conn:
+            conn.executemany("INSERT OR REPLACE INTO results VALUES (?, ?, ?, ?, ?)", rows)
+            conn.execute(
+                "INSERT INTO checkpoints VALUES (?, ?, ?, ?, ?) "
+                "ON CONFLICT(job) DO UPDATE SET cursor = excluded.cursor, processed = excluded.processed, "
+                "written = checkpoints.written + ?, updated_at = excluded.updated_at",
+                (job, cursor, processed, len(rows), time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()), len(rows)),
+            )
+
+    def checkpoint(self, job):
+        """(cursor, processed, written) for a job, or None if it never ran."""
+        return self._conn().execute(
+            "SELECT cursor, processed, written FROM checkpoints WHERE job = ?", (job,)
+        ).fetchone()
+
+    def reset(self, job):
+        with self._conn() as conn:
+            conn.execute("DELETE FROM checkpoints WHERE job = ?", (job,))
+
+    def prune(self, keep_version):
+        """Drop rows for every bundle version except `keep_version` (any encoder variant)."""
+        with self._conn() as conn:
+            deleted = conn.execute(
+                "DELETE FROM results WHERE version != ? AND substr(version, 1, ?) != ?",
+                (keep_version, len(keep_version) + 1, keep_version + "/"),
+            ).rowcount
+        self._conn().execute("VACUUM")
+        return deleted
@@ -0,0 +1,103 @@
+import hashlib
+import json
+import threading
+from collections import OrderedDict
+
+from encoding import MULTI_HOT_FEATURES
+
+
+# ---------------------------------------------------------
+# Canonical profile key
+# ---------------------------------------------------------
+def profile_key(data):
+    """
+    Hash of the questionnaire answers that feed the user encoder.
+    Multi-hot answers are order- and duplicate-insensitive (that is how the
+    MultiLabelBinarizers treat them), so they are sorted and de-duplicated first.
+    """
+    canonical = {
+        "origin_country": data["origin_country"],
+        "favorite_country_visited": data["favorite_country_visited"],
+    }
+    for feature in MULTI_HOT_FEATURES:
+        canonical[feature] = sorted(set(data.get(feature, [])))
+
+    blob = json.dumps(canonical, sort_keys=True, separators=(",", ":"))
+    return hashlib.sha1(blob.encode("utf-8")).hexdigest()
+
+
+# ---------------------------------------------------------
+# LRU memo for user embeddings and /recommend results
+# ---------------------------------------------------------
+class ProfileCache:
+    """
+    Remembers the user embedding (and /recommend top-k lists) per profile key.
+    Embeddings are returned as copies because callers adjust them in place.
+    clear() must be called whenever the encoder or city vectors change.
+    """
+
+    def __init__(self, max_entries=4096):
+        self.max_entries = max_entries
+
+        self.hits = 0
+        self.misses = 0
+        self.top_k_hits = 0
+        self.top_k_misses = 0
+
+        self._embeddings = OrderedDict()   # key -> np.ndarray
+        self._top_k = OrderedDict()        # (key, k) -> list of result dicts
+        self._lock = threading.Lock()
+
+    def _get(self, entries, key):
+        value = entries.get(key)
+        if value is not None:
+            entries.move_to_end(key)
+        return value
+
+    def _put(self, entries, key, value):
+        entries[key] = value
+        entries.move_to_end(key)
+        while len(entries) > self.max_entries:
+            entries.popitem(last=False)
+
+    def get_embedding(self, key):
+        with self._lock:
+            user_vec = self._get(self._embeddings, key)
+            if user_vec is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            return user_vec.copy()
+
+    def put_embedding(self, key, user_vec):
+        with self._lock:
+            self._put(self._embeddings, key, user_vec.copy())
+
+    def get_top_k(self, key, k):
+        with self._lock:
+            results = self._get(self._top_k, (key, k))
+            if results is None:
+                self.top_k_misses += 1
+                return None
+            self.top_k_hits += 1
+            return results
+
+    def put_top_k(self, key, k, results):
+        with self._lock:
+            self._put(self._top_k, (key, k), results)
+
+    def clear(self):
+        with self._lock:
+            self._embeddings.clear()
+            self._top_k.clear()
+
+    def stats(self):
+        with self._lock:
+            return {
+                "embeddings": len(self._embeddings),
+                "top_k_results": len(self._top_k),
+                "hits": self.hits,
+                "misses": self.misses,
+                "top_k_hits": self.top_k_hits,
+                "top_k_misses": self.top_k_misses,
+            }
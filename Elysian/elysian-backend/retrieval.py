@@ -0,0 +1,234 @@
+import os
+
+import numpy as np
+
+from scoring import masked_top_k, top_k
+
+# Files build_index.py writes into a bundle, by RETRIEVAL_INDEX kind
+INDEX_FILES = {
+    "ivf": "city_index_ivf.npz",
+    "int8": "city_vectors_int8.npy",
+    "float16": "city_vectors_float16.npy",
+}
+
+
+# ---------------------------------------------------------
+# Retrieval indexes over city_vectors
+# ---------------------------------------------------------
+class RetrievalIndex:
+    """
+    Finds candidate cities for a user vector. Subclasses decide which rows are
+    candidates; search() then scores only those rows by dot product.
+    `exclude` is an optional bool array over the catalog (True = already swiped);
+    excluded rows are dropped before any scoring happens. An approximate index
+    returns at least `size` candidates whenever that many cities are not excluded.
+    """
+
+    exact = False
+
+    def __init__(self, vectors):
+        self.vectors = vectors
+
+    def candidates(self, query, exclude=None, nprobe=None, size=None):
+        raise NotImplementedError
+
+    def search(self, query, k, exclude=None, nprobe=None):
+        idx = self.candidates(query, exclude, nprobe, size=k)
+        scores = self.vectors[idx] @ query
+        best = top_k(scores, k)
+        return idx[best], scores[best]
+
+
+class ExactIndex(RetrievalIndex):
+    """Brute force: every non-excluded city is a candidate."""
+
+    exact = True
+
+    def candidates(self, query, exclude=None, nprobe=None, size=None):
+        if exclude is None:
+            return np.arange(len(self.vectors))
+        return np.flatnonzero(~exclude)
+
+
+class IVFIndex(RetrievalIndex):
+    """
+    Inverted-file index: cities are clustered with k-means offline, and a query
+    only looks at the members of the `nprobe` clusters whose centroids score
+    highest against it. Members are stored grouped by cluster, so a probe is a
+    contiguous slice of `order`.
+    """
+
+    def __init__(self, vectors, centroids, order, offsets, nprobe=8):
+        super().__init__(vectors)
+        self.centroids = centroids
+        self.order = order          # city indices grouped by cluster
+        self.offsets = offsets      # cluster c owns order[offsets[c]:offsets[c + 1]]
+        self.nprobe = nprobe
+
+    @classmethod
+    def build(cls, vectors, n_lists=None, iters=20, sample_size=100_000, seed=0, nprobe=8):
+        rng = np.random.default_rng(seed)
+        n = len(vectors)
+        n_lists = n_lists or max(1, int(np.sqrt(n)))
+        n_lists = min(n_lists, n)
+
+        # Train on a sample, then assign the full catalog
+        train = vectors[rng.choice(n, size=min(n, sample_size), replace=False)]
+        centroids = train[rng.choice(len(train), size=n_lists, replace=False)].copy()
+
+        for _ in range(iters):
+            assign = cls._assign(train, centroids)
+            counts = np.bincount(assign, minlength=n_lists)
+            sums = np.zeros_like(centroids)
+            np.add.at(sums, assign, train)
+
+            empty = counts == 0
+            centroids[~empty] = sums[~empty] / counts[~empty, None]
+            # Re-seed empty clusters from random training points
+            if empty.any():
+                centroids[empty] = train[rng.choice(len(train), size=int(empty.sum()))]
+
+        assign = cls._assign(vectors, centroids)
+        order = np.argsort(assign, kind="stable")
+        offsets = np.searchsorted(assign[order], np.arange(n_lists + 1))
+
+        return cls(vectors, centroids.astype(np.float32), order, offsets, nprobe=nprobe)
+
+    @staticmethod
+    def _assign(points, centroids, chunk=65536):
+        # Nearest centroid by squared L2, in chunks to bound the distance matrix
+        c_sq = (centroids ** 2).sum(axis=1)
+        out = np.empty(len(points), dtype=np.int64)
+        for start in range(0, len(points), chunk):
+            block = points[start:start + chunk]
+            out[start:start + chunk] = np.argmin(c_sq - 2.0 * block @ centroids.T, axis=1)
+        return out
+
+    def candidates(self, query, exclude=None, nprobe=None, size=None):
+        # Lists best first; probe `nprobe`, then keep adding the next best until
+        # `size` cities survive the exclusion (or every list has been probed)
+        lists = np.argsort(-(self.centroids @ query), kind="stable")
+        nprobe = min(nprobe or self.nprobe, len(lists))
+        size = size or 1
+
+        parts, found = [], 0
+        for i, c in enumerate(lists):
+            if i >= nprobe and found >= size:
+                break
+            members = self.order[self.offsets[c]:self.offsets[c + 1]]
+            if exclude is not None:
+                members = members[~exclude[members]]
+            parts.append(members)
+            found += len(members)
+        return np.concatenate(parts) if parts else np.empty(0, dtype=np.int64)
+
+    def save(self, path):
+        np.savez(path, centroids=self.centroids, order=self.order, offsets=self.offsets, nprobe=self.nprobe)
+
+    @classmethod
+    def load(cls, path, vectors, nprobe=None):
+        data = np.load(path)
+        return cls(
+            vectors, data["centroids"], data["order"], data["offsets"],
+            nprobe=int(nprobe or data["nprobe"]),
+        )
+
+
+def quantize(vectors, dtype):
+    """
+    (codes, scales) for a low-precision copy of `vectors`. int8 rows are scaled
+    by their own max |value| / 127, so codes[i] * scales[i] ~ vectors[i];
+    float16 keeps the values as they are and needs no scales.
+    """
+    vectors = np.asarray(vectors, dtype=np.float32)
+    if dtype == "float16":
+        return vectors.astype(np.float16), None
+    if dtype == "int8":
+        scales = np.abs(vectors).max(axis=1) / 127.0
+        scales[scales == 0] = 1.0
+        codes = np.clip(np.rint(vectors / scales[:, None]), -127, 127).astype(np.int8)
+        return codes, scales.astype(np.float32)
+    raise ValueError("Unknown quantization: %r" % dtype)
+
+
+class QuantizedIndex(RetrievalIndex):
+    """
+    Two-pass search: every city is scored against a float16 or int8 copy of
+    city_vectors (a quarter of the bytes for int8), and only the best `rerank`
+    are re-scored with the float32 vectors. Results are exact whenever the true
+    top k make it into that shortlist; bench_quantized.py measures how often.
+    """
+
+    def __init__(self, vectors, codes, scales=None, rerank=200, chunk=4096):
+        super().__init__(vectors)
+        self.codes = codes
+        self.scales = scales
+        self.rerank = rerank
+        self.chunk = chunk   # rows converted to float32 at a time, small enough to stay in cache
+
+    @classmethod
+    def build(cls, vectors, dtype="int8", rerank=200):
+        codes, scales = quantize(vectors, dtype)
+        return cls(vectors, codes, scales, rerank=rerank)
+
+    def approximate_scores(self, query):
+        query = np.asarray(query, dtype=np.float32)
+        out = np.empty(len(self.codes), dtype=np.float32)
+        for start in range(0, len(self.codes), self.chunk):
+            block = self.codes[start:start + self.chunk].astype(np.float32)
+            np.matmul(block, query, out=out[start:start + self.chunk])
+        if self.scales is not None:
+            out *= self.scales
+        return out
+
+    def candidates(self, query, exclude=None, nprobe=None, size=None):
+        scores = self.approximate_scores(query)
+        shortlist = masked_top_k(scores, exclude, max(self.rerank, size or 0))
+        if len(shortlist) == 0:
+            return shortlist
+
+        # Everything at or above the cutoff, in catalog order: rows tied at the
+        # boundary (duplicate cities) all go through, and next_cities() picks
+        # the first of equal scores just like it does over the whole catalog
+        keep = scores >= scores[shortlist].min()
+        if exclude is not None:
+            keep &= ~exclude
+        return np.flatnonzero(keep)
+
+    def search(self, query, k, exclude=None, nprobe=None):
+        idx = self.candidates(query, exclude, size=k)
+        scores = self.vectors[idx] @ query
+        best = top_k(scores, k)
+        return idx[best], scores[best]
+
+    @staticmethod
+    def scales_path(path):
+        return os.path.splitext(path)[0] + "_scales.npy"
+
+    def save(self, path):
+        np.save(path, self.codes)
+        if self.scales is not None:
+            np.save(self.scales_path(path), self.scales)
+
+    @classmethod
+    def load(cls, path, vectors, rerank=200):
+        # Memory-mapped like city_vectors, so forked workers share one copy
+        codes = np.load(path, mmap_mode="r")
+        if codes.shape != vectors.shape:
+            raise ValueError("%s has shape %s, city vectors are %s" % (path, codes.shape, vectors.shape))
+        scales = np.load(cls.scales_path(path)) if codes.dtype == np.int8 else None
+        return cls(vectors, codes, scales, rerank=rerank)
+
+
+def load_index(kind, vectors, path=None, nprobe=None, rerank=None):
+    if kind == "exact":
+        return ExactIndex(vectors)
+    if kind == "ivf":
+        return IVFIndex.load(path, vectors, nprobe=nprobe)
+    if kind in ("int8", "float16"):
+        rerank = rerank or 200
+        if path and os.path.exists(path):
+            return QuantizedIndex.load(path, vectors, rerank=rerank)
+        # Not in the bundle: quantize at startup (a private copy per worker)
+        return QuantizedIndex.build(vectors, kind, rerank=rerank)
+    raise ValueError("Unknown retrieval index: %r" % kind)
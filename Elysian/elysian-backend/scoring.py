@@ -0,0 +1,98 @@
+import numpy as np
+
+
+# ---------------------------------------------------------
+# Top-k helpers
+# ---------------------------------------------------------
+def top_k_per_row(scores, k):
+    """
+    Indices of the k highest scores in each row of a (num_users, num_cities)
+    matrix, best first. argpartition keeps this O(num_cities) per row.
+    """
+    k = min(k, scores.shape[1])
+    if k <= 0:
+        return np.empty((scores.shape[0], 0), dtype=np.int64)
+
+    part = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+    part_scores = np.take_along_axis(scores, part, axis=1)
+    order = np.argsort(-part_scores, axis=1, kind="stable")
+    return np.take_along_axis(part, order, axis=1)
+
+
+def top_k(scores, k):
+    return top_k_per_row(scores[None, :], k)[0]
+
+
+def masked_top_k(scores, exclude, k):
+    """
+    top_k over the entries where `exclude` (a bool array, or None) is False;
+    fewer than k indices come back when not enough entries are left.
+    """
+    if exclude is None:
+        masked = scores
+    else:
+        k = min(k, len(scores) - int(np.count_nonzero(exclude)))
+        masked = np.where(exclude, -np.inf, scores)
+
+    k = min(k, len(scores))
+    if k <= 0:
+        return np.empty(0, dtype=np.int64)
+    if k == 1:
+        return np.array([np.argmax(masked)])   # first of equal scores, like a plain argmax
+    return top_k(masked, k)
+
+
+# ---------------------------------------------------------
+# Feedback-aware scoring engine
+# ---------------------------------------------------------
+class ScoringEngine:
+    """
+    Scores every city against a user vector plus the user's liked/disliked cities.
+
+    The mean cosine similarity between a city and a group of cities is the same as
+    the dot product between the city's unit vector and the mean of the group's unit
+    vectors, so city vectors are normalized once up front and both group
+    similarities come out of a single (num_cities, dim) @ (dim, 2) product.
+    """
+
+    def __init__(self, city_vectors, alpha=1.0, beta=0.7, gamma=0.7, unit_vectors=None):
+        self.city_vectors = np.asarray(city_vectors, dtype=np.float32)
+
+        # Artifact bundles ship the normalized copy so workers can mmap it
+        if unit_vectors is None:
+            norms = np.linalg.norm(self.city_vectors, axis=1, keepdims=True)
+            unit_vectors = self.city_vectors / (norms + 1e-8)
+        self.unit_vectors = np.asarray(unit_vectors, dtype=np.float32)
+
+        self.alpha = alpha
+        self.beta = beta
+        self.gamma = gamma
+
+    def centroid(self, group_idx):
+        # Mean of the group's unit vectors (zeros when the group is empty)
+        if len(group_idx) == 0:
+            return np.zeros(self.unit_vectors.shape[1], dtype=np.float32)
+        return self.unit_vectors[group_idx].mean(axis=0)
+
+    def base_scores(self, user_vec, candidates=None):
+        vectors = self.city_vectors if candidates is None else self.city_vectors[candidates]
+        return vectors @ user_vec
+
+    def dynamic_scores(self, user_vec, liked_idx, disliked_idx, candidates=None):
+        return self.centroid_scores(
+            user_vec, self.centroid(liked_idx), self.centroid(disliked_idx), candidates
+        )
+
+    def centroid_scores(self, user_vec, liked_centroid, disliked_centroid, candidates=None):
+        # Same as dynamic_scores, for callers that already keep the group centroids
+        # (user_state.UserState). With `candidates` only those rows are scored, in that order
+        unit_vectors = self.unit_vectors if candidates is None else self.unit_vectors[candidates]
+
+        centroids = np.stack([liked_centroid, disliked_centroid], axis=1)
+        group_sims = unit_vectors @ centroids   # shape: (num_candidates, 2)
+
+        return (
+            self.alpha * self.base_scores(user_vec, candidates) +
+            self.beta * group_sims[:, 0] -
+            self.gamma * group_sims[:, 1]
+        )
@@ -0,0 +1,250 @@
+"""
+Write-behind buffer for swipes.
+
+/swipe folds a swipe into the user's in-process state right away and hands
+the Firestore write to a SwipeWriter. A background thread commits buffered
+swipes to the feedback backend in batches, as soon as `max_batch` are waiting
+or the oldest has waited `max_delay` seconds, so a burst of swipes costs a few
+commits instead of one round trip each.
+
+Delivery is at least once. A swipe leaves the buffer only after the commit
+holding it succeeds; failed commits are retried with backoff, which is safe
+because backend writes are idempotent merges. close(), called on graceful
+shutdown, commits whatever is left, and if the backend cannot be reached the
+swipes are spilled to a JSONL file in `spill_dir` that the next process to
+start replays.
+
+A replaying process renames the spill file to <file>.replaying-<pid> to claim
+it, and deletes the claim once every swipe in it is committed (or spilled
+again). Claims left by a process that died are taken over on the next start.
+"""
+import glob
+import itertools
+import json
+import logging
+import os
+import threading
+import time
+from collections import deque
+
+log = logging.getLogger(__name__)
+
+
+class SwipeWriter:
+    def __init__(self, backend, max_batch=200, max_delay=1.0, max_pending=10000, spill_dir=None,
+                 on_commit=None, retry_delay=0.5, max_retry_delay=30.0):
+        self.backend = backend
+        self.max_batch = max_batch
+        self.max_delay = max_delay
+        self.max_pending = max_pending
+        self.spill_dir = spill_dir
+        self.on_commit = on_commit   # called with the user ids of every committed batch
+        self.retry_delay = retry_delay
+        self.max_retry_delay = max_retry_delay
+
+        self.queued = 0
+        self.committed = 0
+        self.commits = 0
+        self.failures = 0
+        self.replayed = 0
+        self.spilled = 0
+
+        # Entries are (queued_at, (user_id, city_id, liked, payload), claim file or None), oldest first
+        self._pending = deque()
+        self._in_flight = []      # entries of the commit under way
+        self._flush_requested = False
+        self._closed = False
+        self._claims = {}         # claim file -> its swipes not committed yet
+        self._cond = threading.Condition()
+
+        if spill_dir:
+            self._replay_spills()
+
+        self._thread = threading.Thread(target=self._run, name="swipe-writer", daemon=True)
+        self._thread.start()
+
+    # -----------------------------------------------------
+    # Request side
+    # -----------------------------------------------------
+    def record(self, user_id, city_id, liked, payload=None, timeout=5.0):
+        """Buffer one swipe. Waits up to `timeout` for room when the buffer is full, then raises TimeoutError."""
+        deadline = time.monotonic() + timeout
+        with self._cond:
+            if self._closed:
+                raise RuntimeError("Swipe writer is closed")
+            while len(self._pending) >= self.max_pending:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    raise TimeoutError("Swipe buffer is full")
+                self._cond.wait(remaining)
+
+            self._pending.append((time.monotonic(), (user_id, city_id, liked, payload), None))
+            self.queued += 1
+            if len(self._pending) == 1 or len(self._pending) >= self.max_batch:
+                self._cond.notify_all()
+
+    def pending(self, user_id):
+        """(liked, disliked) city ids of the user's swipes that are not committed yet."""
+        with self._cond:
+            swipes = [e[1] for e in itertools.chain(self._in_flight, self._pending) if e[1][0] == user_id]
+        return [s[1] for s in swipes if s[2]], [s[1] for s in swipes if not s[2]]
+
+    def flush(self, timeout=10.0):
+        """Commit everything buffered now; True if the buffer drained within `timeout`."""
+        with self._cond:
+            self._flush_requested = True
+            self._cond.notify_all()
+            drained = self._cond.wait_for(lambda: not self._pending and not self._in_flight, timeout)
+            self._flush_requested = False
+            return drained
+
+    def close(self, timeout=10.0):
+        """Stop the flusher and commit what is left; spill it to disk if that fails. Safe to call twice."""
+        with self._cond:
+            if self._closed:
+                return
+            self._closed = True
+            self._cond.notify_all()
+        self._thread.join(timeout)
+
+        with self._cond:
+            # A commit still hanging in the flusher may or may not land: deliver it again
+            left = (self._in_flight if self._thread.is_alive() else []) + list(self._pending)
+            self._pending.clear()
+        if left and not self._commit(left):
+            self._spill([entry[1] for entry in left])
+            # Every swipe still owed to a claim is in the new spill file now
+            with self._cond:
+                claims, self._claims = list(self._claims), {}
+            self._remove(claims)
+
+    def stats(self):
+        with self._cond:
+            return {
+                "pending": len(self._pending) + len(self._in_flight), "queued": self.queued,
+                "committed": self.committed, "commits": self.commits, "failures": self.failures,
+                "replayed": self.replayed, "spilled": self.spilled,
+            }
+
+    # -----------------------------------------------------
+    # Flusher thread
+    # -----------------------------------------------------
+    def _due(self, now):
+        return bool(self._pending) and (
+            self._flush_requested or len(self._pending) >= self.max_batch
+            or now - self._pending[0][0] >= self.max_delay
+        )
+
+    def _run(self):
+        delay = self.retry_delay
+        while True:
+            with self._cond:
+                while not self._closed and not self._due(time.monotonic()):
+                    wait = self.max_delay - (time.monotonic() - self._pending[0][0]) if self._pending else None
+                    self._cond.wait(wait)
+                if self._closed:
+                    return   # close() commits the rest
+                batch = [self._pending.popleft() for _ in range(min(self.max_batch, len(self._pending)))]
+                self._in_flight = batch
+
+            ok = self._commit(batch)
+
+            with self._cond:
+                self._in_flight = []
+                if not ok:
+                    # Back to the front, in order, for the retry
+                    now = time.monotonic()
+                    self._pending.extendleft((now, swipe, claim) for _, swipe, claim in reversed(batch))
+                self._cond.notify_all()
+                if not ok:
+                    self._cond.wait_for(lambda: self._closed, delay)
+            delay = self.retry_delay if ok else min(2 * delay, self.max_retry_delay)
+
+    def _commit(self, entries):
+        swipes = [entry[1] for entry in entries]
+        try:
+            self.backend.write(swipes)
+        except Exception:
+            with self._cond:
+                self.failures += 1
+            log.exception("Committing %d swipes failed", len(swipes))
+            return False
+
+        done = []
+        with self._cond:
+            self.commits += 1
+            self.committed += len(swipes)
+            for _, _, claim in entries:
+                if claim in self._claims:
+                    self._claims[claim] -= 1
+                    if not self._claims[claim]:
+                        del self._claims[claim]
+                        done.append(claim)
+        self._remove(done)
+        if self.on_commit is not None:
+            self.on_commit({swipe[0] for swipe in swipes})
+        return True
+
+    # -----------------------------------------------------
+    # Spill files
+    # -----------------------------------------------------
+    def _spill(self, swipes):
+        if not self.spill_dir:
+            log.error("Dropping %d uncommitted swipes (no spill directory)", len(swipes))
+            return
+        os.makedirs(self.spill_dir, exist_ok=True)
+        path = os.path.join(self.spill_dir, "swipes-%d-%d.jsonl" % (os.getpid(), time.time_ns()))
+        with open(path + ".tmp", "w") as f:
+            for swipe in swipes:
+                f.write(json.dumps(swipe) + "\n")
+        os.replace(path + ".tmp", path)
+        with self._cond:
+            self.spilled += len(swipes)
+        log.warning("Spilled %d uncommitted swipes to %s", len(swipes), path)
+
+    def _remove(self, paths):
+        for path in paths:
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+
+    def _replay_spills(self):
+        pattern = os.path.join(self.spill_dir, "swipes-*.jsonl")
+        stale = [path for path in glob.glob(pattern + ".replaying-*") if not _owner_alive(path)]
+
+        for path in sorted(glob.glob(pattern)) + sorted(stale):
+            # Several workers start at once: renaming claims a file for exactly one of them
+            claim = "%s.replaying-%d" % (path.split(".replaying-")[0], os.getpid())
+            try:
+                os.rename(path, claim)
+            except FileNotFoundError:
+                continue
+            with open(claim) as f:
+                swipes = [tuple(json.loads(line)) for line in f if line.strip()]
+            if not swipes:
+                self._remove([claim])
+                continue
+
+            now = time.monotonic()
+            self._pending.extend((now, swipe, claim) for swipe in swipes)
+            self._claims[claim] = self._claims.get(claim, 0) + len(swipes)
+            self.replayed += len(swipes)
+            log.info("Replaying %d swipes from %s", len(swipes), path)
+
+
+def _owner_alive(claim):
+    """Whether the process that claimed a spill file (pid in its name) is still running."""
+    try:
+        pid = int(claim.rsplit(".replaying-", 1)[1])
+    except ValueError:
+        return False
+    if pid == os.getpid():
+        return False   # a previous process that had our pid; this one has not claimed anything yet
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
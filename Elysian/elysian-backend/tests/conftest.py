@@ -0,0 +1,33 @@
+import os
+import sys
+
+import pytest
+
+# app.py reads its configuration at import time: in-process feedback, no artifact watcher
+os.environ.setdefault("FEEDBACK_BACKEND", "memory")
+os.environ.setdefault("ARTIFACT_WATCH_INTERVAL", "0")
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+@pytest.fixture(scope="session")
+def app_module():
+    import app
+    return app
+
+
+@pytest.fixture
+def client(app_module):
+    return app_module.app.test_client()
+
+
+@pytest.fixture
+def profile():
+    return {
+        "origin_country": "Brazil",
+        "favorite_country_visited": "Philippines",
+        "vacation_types": ["Beach", "Nature"],
+        "seasons": ["Winter"],
+        "budget": ["Mid-Range"],
+        "place_type": ["Quiet"],
+    }
@@ -0,0 +1,103 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from feedback import FeedbackCache, InMemoryFeedbackBackend
+
+
+class Clock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+class BlockingBackend(InMemoryFeedbackBackend):
+    """Holds every fetch until `release` is set, so a test can act mid-read."""
+
+    def __init__(self):
+        super().__init__()
+        self.started = threading.Event()
+        self.release = threading.Event()
+
+    def fetch(self, user_id):
+        result = super().fetch(user_id)
+        self.started.set()
+        self.release.wait(5)
+        return result
+
+
+def test_cache_hit_until_ttl_expires():
+    backend, clock = InMemoryFeedbackBackend(), Clock()
+    backend.record("u", "c1", True)
+    cache = FeedbackCache(backend, ttl=10, clock=clock)
+
+    assert cache.get("u") == (["c1"], [])
+    backend.record("u", "c2", False)
+    clock.now = 9.9
+    assert cache.get("u") == (["c1"], [])
+    assert backend.reads == 1
+
+    clock.now = 10.0
+    assert cache.get("u") == (["c1"], ["c2"])
+    assert backend.reads == 2
+    assert (cache.hits, cache.misses) == (1, 2)
+
+
+def test_least_recently_used_user_is_evicted():
+    backend = InMemoryFeedbackBackend()
+    cache = FeedbackCache(backend, max_users=2, clock=Clock())
+
+    cache.get("a")
+    cache.get("b")
+    cache.get("a")   # b is now the least recently used
+    cache.get("c")
+    assert len(cache) == 2
+    assert backend.reads == 3
+
+    cache.get("a")
+    assert backend.reads == 3
+    cache.get("b")
+    assert backend.reads == 4
+
+
+def test_invalidate_during_fetch_does_not_cache_stale_result():
+    backend = BlockingBackend()
+    backend.record("u", "c1", True)
+    cache = FeedbackCache(backend, clock=Clock())
+
+    with ThreadPoolExecutor(1) as executor:
+        future = cache.get_async("u", executor)
+        assert backend.started.wait(5)
+        backend.record("u", "c2", True)
+        cache.invalidate("u")
+        backend.release.set()
+        assert future.result(5) == (["c1"], [])
+
+    assert len(cache) == 0
+    assert cache.get("u") == (["c1", "c2"], [])
+    assert backend.reads == 2
+
+
+def test_invalidate_other_user_keeps_fetch_cacheable():
+    backend = BlockingBackend()
+    cache = FeedbackCache(backend, clock=Clock())
+
+    with ThreadPoolExecutor(1) as executor:
+        future = cache.get_async("u", executor)
+        assert backend.started.wait(5)
+        cache.invalidate("v")
+        backend.release.set()
+        future.result(5)
+
+    cache.get("u")
+    assert backend.reads == 1
+
+
+def test_next_city_fetches_feedback_once(app_module, client, profile):
+    backend = app_module.feedback_backend
+    for user_id in ("once-1", "once-2", "once-3"):
+        before = backend.reads
+        response = client.post("/next_city", json=dict(profile, user_id=user_id, n=5))
+        assert response.status_code == 200
+        assert backend.reads == before + 1
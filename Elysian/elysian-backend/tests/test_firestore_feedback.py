@@ -0,0 +1,119 @@
+import threading
+
+import pytest
+
+from feedback import FeedbackCache, FirestoreFeedbackBackend
+from profile_cache import profile_key
+
+
+class Snapshot:
+    def __init__(self, reference, data):
+        self.reference = reference
+        self.exists = data is not None
+        self._data = data
+
+    def to_dict(self):
+        return dict(self._data)
+
+
+class Collection:
+    def __init__(self, name):
+        self.id = name
+
+    def document(self, document_id):
+        return Document(self, document_id)
+
+
+class Document:
+    def __init__(self, parent, document_id):
+        self.parent = parent
+        self.id = document_id
+
+
+class FakeDB:
+    """get_all answers in reverse order, as Firestore may; unknown documents come back missing."""
+
+    def __init__(self, documents):
+        self.documents = documents   # (collection, document id) -> fields; absent = missing document
+        self.error = None
+        self.on_get_all = None
+
+    def collection(self, name):
+        return Collection(name)
+
+    def get_all(self, refs):
+        if self.on_get_all is not None:
+            self.on_get_all()
+        if self.error is not None:
+            raise self.error
+        return [Snapshot(ref, self.documents.get((ref.parent.id, ref.id))) for ref in reversed(refs)]
+
+
+def test_fetch_matches_snapshots_by_collection():
+    db = FakeDB({
+        ("userFavorites", "u"): {"c1": {}, "c2": {}},
+        ("userDislikes", "u"): {"c3": {}},
+    })
+    assert FirestoreFeedbackBackend(db).fetch("u") == (["c1", "c2"], ["c3"])
+
+
+def test_fetch_with_missing_documents():
+    db = FakeDB({("userDislikes", "u"): {"c3": {}}})
+    backend = FirestoreFeedbackBackend(db)
+    assert backend.fetch("u") == ([], ["c3"])
+    assert backend.fetch("nobody") == ([], [])
+
+
+def test_fetch_error_is_raised():
+    db = FakeDB({})
+    db.error = RuntimeError("unavailable")
+    with pytest.raises(RuntimeError):
+        FirestoreFeedbackBackend(db).fetch("u")
+
+
+@pytest.fixture
+def firestore_cache(app_module, monkeypatch):
+    db = FakeDB({})
+    cache = FeedbackCache(FirestoreFeedbackBackend(db))
+    monkeypatch.setattr(app_module, "feedback_cache", cache)
+    return db
+
+
+def test_feedback_read_overlaps_encoder(app_module, firestore_cache, monkeypatch, profile):
+    state = app_module.current_state()
+    liked_id, disliked_id = state.cities.city_ids[:2].tolist()
+    firestore_cache.documents.update({
+        ("userFavorites", "overlap"): {liked_id: {}},
+        ("userDislikes", "overlap"): {disliked_id: {}},
+    })
+
+    # Each side waits for the other to start: only passes if they run concurrently
+    reading, encoding = threading.Event(), threading.Event()
+
+    def get_all_started():
+        reading.set()
+        assert encoding.wait(5)
+
+    embed_profile = app_module.embed_profile
+
+    def encode(*args):
+        encoding.set()
+        assert reading.wait(5)
+        return embed_profile(*args)
+
+    firestore_cache.on_get_all = get_all_started
+    monkeypatch.setattr(app_module, "embed_profile", encode)
+
+    key = (state.version, profile_key(profile))
+    user_state = app_module.build_user_state("overlap", profile, key, state)
+    assert user_state.seen[[0, 1]].all()
+    assert user_state.seen.sum() == 2
+    assert user_state.centroids()[0] is not None and user_state.centroids()[1] is not None
+
+
+def test_feedback_read_error_reaches_caller(app_module, client, firestore_cache, profile):
+    firestore_cache.error = RuntimeError("unavailable")
+    state = app_module.current_state()
+    with pytest.raises(RuntimeError):
+        app_module.build_user_state("broken", profile, (state.version, profile_key(profile)), state)
+    assert client.post("/next_city", json=dict(profile, user_id="broken")).status_code == 500
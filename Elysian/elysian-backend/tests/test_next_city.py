@@ -0,0 +1,14 @@
+import pytest
+
+
+@pytest.mark.parametrize("endpoint", ["/next_city", "/next_cities"])
+@pytest.mark.parametrize("n", [0, -3])
+def test_count_below_one_is_rejected(client, profile, endpoint, n):
+    response = client.post(endpoint, json=dict(profile, user_id="count", n=n))
+    assert response.status_code == 400
+
+
+def test_count_is_capped(app_module, client, profile):
+    response = client.post("/next_city", json=dict(profile, user_id="cap", n=10_000))
+    assert response.status_code == 200
+    assert len(response.get_json()["cities"]) == app_module.NEXT_CITY_MAX_N
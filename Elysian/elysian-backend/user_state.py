@@ -0,0 +1,262 @@
+"""
+Per-user swipe state for /next_city.
+
+Instead of re-reading the full liked/disliked maps and re-averaging their
+vectors on every request, each user keeps running sums of the swiped cities'
+vectors (raw and unit-normalized), the counts, and liked/disliked bitmaps over
+the catalog. A swipe folds in with O(embedding_dim) work, and /next_city
+derives everything it needs from the state without touching Firestore.
+
+A state belongs to one bundle version (bitmaps are over that bundle's city
+rows); a state from another version is rebuilt from the swipe history.
+"""
+import sqlite3
+import struct
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+
+
+class UserState:
+    def __init__(self, version, profile_key, base, liked, disliked,
+                 liked_sum, disliked_sum, liked_unit_sum, disliked_unit_sum,
+                 liked_count, disliked_count, synced_at):
+        self.version = version
+        self.profile_key = profile_key
+        self.base = base                  # encoder output for the questionnaire answers
+        self.liked = liked                # bool over catalog rows
+        self.disliked = disliked
+        self.liked_sum = liked_sum        # sum of raw city vectors (embedding adjustment)
+        self.disliked_sum = disliked_sum
+        self.liked_unit_sum = liked_unit_sum      # sum of unit vectors (group similarity)
+        self.disliked_unit_sum = disliked_unit_sum
+        self.liked_count = liked_count
+        self.disliked_count = disliked_count
+        self.synced_at = synced_at        # last full rebuild from the swipe history
+
+    @classmethod
+    def build(cls, version, profile_key, base, liked_idx, disliked_idx, city_vectors, unit_vectors):
+        """Full rebuild from swipe history (catalog indices)."""
+        n, dim = city_vectors.shape
+        liked = np.zeros(n, dtype=bool)
+        disliked = np.zeros(n, dtype=bool)
+        liked[liked_idx] = True
+        disliked[disliked_idx] = True
+
+        liked_rows = np.flatnonzero(liked)
+        disliked_rows = np.flatnonzero(disliked)
+        return cls(
+            version, profile_key, np.asarray(base, dtype=np.float32), liked, disliked,
+            city_vectors[liked_rows].sum(axis=0, dtype=np.float32),
+            city_vectors[disliked_rows].sum(axis=0, dtype=np.float32),
+            unit_vectors[liked_rows].sum(axis=0, dtype=np.float32),
+            unit_vectors[disliked_rows].sum(axis=0, dtype=np.float32),
+            len(liked_rows), len(disliked_rows), time.time(),
+        )
+
+    def record(self, idx, liked, city_vectors, unit_vectors):
+        """
+        Fold one swipe in. Like the app's Firestore writes, a swipe only adds
+        the city to its group: a repeat is a no-op, and swiping a city the
+        other way leaves it in both groups. Returns True if the state changed.
+        """
+        if liked:
+            if self.liked[idx]:
+                return False
+            self.liked[idx] = True
+            self.liked_sum += city_vectors[idx]
+            self.liked_unit_sum += unit_vectors[idx]
+            self.liked_count += 1
+        else:
+            if self.disliked[idx]:
+                return False
+            self.disliked[idx] = True
+            self.disliked_sum += city_vectors[idx]
+            self.disliked_unit_sum += unit_vectors[idx]
+            self.disliked_count += 1
+        return True
+
+    def absorb(self, other, city_vectors, unit_vectors):
+        """Fold in the swipes `other` (the same user's state, same version) has and this one lacks."""
+        for idx in np.flatnonzero(other.liked & ~self.liked):
+            self.record(idx, True, city_vectors, unit_vectors)
+        for idx in np.flatnonzero(other.disliked & ~self.disliked):
+            self.record(idx, False, city_vectors, unit_vectors)
+
+    @property
+    def seen(self):
+        return self.liked | self.disliked
+
+    def user_vector(self, lr=0.1):
+        """Base embedding nudged toward the liked mean and away from the disliked mean, normalized."""
+        user_vec = self.base.copy()
+        if self.liked_count:
+            user_vec += lr * (self.liked_sum / self.liked_count)
+        if self.disliked_count:
+            user_vec -= lr * (self.disliked_sum / self.disliked_count)
+        return user_vec / (np.linalg.norm(user_vec) + 1e-8)
+
+    def centroids(self):
+        """Mean unit vector of the liked and of the disliked cities (zeros for an empty group)."""
+        liked = self.liked_unit_sum / self.liked_count if self.liked_count else np.zeros_like(self.liked_unit_sum)
+        disliked = (self.disliked_unit_sum / self.disliked_count
+                    if self.disliked_count else np.zeros_like(self.disliked_unit_sum))
+        return liked, disliked
+
+    # -----------------------------------------------------
+    # Compact encoding: ~5 * dim float32 + 2 bits per city
+    # -----------------------------------------------------
+    _HEADER = struct.Struct("<IIIId")   # num_cities, dim, liked_count, disliked_count, synced_at
+
+    def to_bytes(self):
+        return b"".join([
+            self._HEADER.pack(len(self.liked), len(self.base), self.liked_count, self.disliked_count, self.synced_at),
+            np.concatenate([
+                self.base, self.liked_sum, self.disliked_sum, self.liked_unit_sum, self.disliked_unit_sum
+            ]).astype("<f4").tobytes(),
+            np.packbits(self.liked).tobytes(),
+            np.packbits(self.disliked).tobytes(),
+        ])
+
+    @classmethod
+    def from_bytes(cls, version, profile_key, blob):
+        n, dim, liked_count, disliked_count, synced_at = cls._HEADER.unpack_from(blob)
+        offset = cls._HEADER.size
+
+        vectors = np.frombuffer(blob, dtype="<f4", count=5 * dim, offset=offset).astype(np.float32).reshape(5, dim)
+        offset += 20 * dim
+
+        packed = (n + 7) // 8
+        bits = np.frombuffer(blob, dtype=np.uint8, count=2 * packed, offset=offset)
+        liked = np.unpackbits(bits[:packed], count=n).astype(bool)
+        disliked = np.unpackbits(bits[packed:], count=n).astype(bool)
+
+        return cls(version, profile_key, vectors[0], liked, disliked,
+                   vectors[1], vectors[2], vectors[3], vectors[4],
+                   liked_count, disliked_count, synced_at)
+
+
+# ---------------------------------------------------------
+# Where states live
+# ---------------------------------------------------------
+class UserStateStore:
+    """
+    In-process LRU of UserState by user id, or, with `path`, a SQLite file
+    shared by every worker on the host (states are read and written as
+    compact blobs, so all workers see each other's swipes).
+    lock(user_id) serializes one user's requests within this process;
+    update() is the read-modify-write, atomic across workers with SQLite.
+    """
+
+    def __init__(self, path=None, max_users=10000, num_locks=64):
+        self.path = path
+        self.max_users = max_users
+
+        self.hits = 0
+        self.misses = 0
+        self.rebuilds = 0
+        self.updates = 0
+
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._user_locks = [threading.Lock() for _ in range(num_locks)]
+        self._local = threading.local()
+
+        if path:
+            with self._conn() as conn:
+                conn.execute("PRAGMA journal_mode=WAL")
+                conn.execute(
+                    "CREATE TABLE IF NOT EXISTS user_state ("
+                    " user_id TEXT PRIMARY KEY, version TEXT NOT NULL,"
+                    " profile_key TEXT NOT NULL, state BLOB NOT NULL) WITHOUT ROWID"
+                )
+
+    def _conn(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5)
+            self._local.conn = conn
+        return conn
+
+    def lock(self, user_id):
+        return self._user_locks[hash(user_id) % len(self._user_locks)]
+
+    def _select(self, conn, user_id):
+        row = conn.execute(
+            "SELECT version, profile_key, state FROM user_state WHERE user_id = ?", (user_id,)
+        ).fetchone()
+        return UserState.from_bytes(*row) if row else None
+
+    def _insert(self, conn, user_id, user_state):
+        conn.execute(
+            "INSERT OR REPLACE INTO user_state VALUES (?, ?, ?, ?)",
+            (user_id, user_state.version, user_state.profile_key, user_state.to_bytes()),
+        )
+
+    def get(self, user_id):
+        if self.path:
+            user_state = self._select(self._conn(), user_id)
+        else:
+            with self._lock:
+                user_state = self._entries.get(user_id)
+                if user_state is not None:
+                    self._entries.move_to_end(user_id)
+
+        if user_state is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return user_state
+
+    def put(self, user_id, user_state):
+        if self.path:
+            with self._conn() as conn:
+                self._insert(conn, user_id, user_state)
+            return
+
+        with self._lock:
+            self._entries[user_id] = user_state
+            self._entries.move_to_end(user_id)
+            while len(self._entries) > self.max_users:
+                self._entries.popitem(last=False)
+
+    def update(self, user_id, apply):
+        """
+        Store apply(current state or None) unless it returns None. With SQLite
+        the read and the write share one BEGIN IMMEDIATE transaction, so a swipe
+        another worker records in between cannot be overwritten. In memory the
+        caller's lock(user_id) already makes this atomic.
+        """
+        if not self.path:
+            user_state = apply(self.get(user_id))
+            if user_state is not None:
+                self.put(user_id, user_state)
+            return user_state
+
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            user_state = apply(self._select(conn, user_id))
+            if user_state is not None:
+                self._insert(conn, user_id, user_state)
+            conn.commit()
+        except BaseException:
+            conn.rollback()
+            raise
+        return user_state
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        return {
+            "backend": "sqlite" if self.path else "memory",
+            "users": len(self._entries) if not self.path else None,
+            "hits": self.hits,
+            "misses": self.misses,
+            "rebuilds": self.rebuilds,
+            "updates": self.updates,
+        }
@@ -0,0 +1,292 @@
+"""
+Purpose: Offline ranking evaluation over the whole queries dataset. Every query
+is scored against every city in large batches (one matrix product per batch for
+a two-tower model, one chunked predict over all query x city pairs for the
+pointwise model) and the rank of the query's positive_city_id gives recall@k,
+NDCG@k and MRR:
+
+    python evaluate_ranking.py --two-tower two_tower                  # user_encoder.tflite x city_vectors.npy
+    python evaluate_ranking.py --two-tower two_tower --variant int8   # a quantized encoder, see tflite_export.py
+    python evaluate_ranking.py --model travel_recommender_model.h5    # final_elysian_model.py / train_streaming.py
+    python evaluate_ranking.py --model model_int8.tflite --split val
+
+Each run writes ranking_report.json, appends the same report to
+ranking_history.jsonl and prints the change against the last run on the same
+queries file and split, so model versions can be tracked over time.
+"""
+
+import argparse
+import datetime
+import hashlib
+import json
+import os
+import time
+
+import numpy as np
+import pandas as pd
+import tensorflow as tf
+from sklearn.model_selection import train_test_split
+
+from streaming_data import PairEncoder, split_mask
+from tflite_export import QUANTIZATIONS, variant_path
+from training_data import city_positions, merged_feature_columns
+
+KS = (1, 5, 10, 20)
+
+
+"""
+RANKS AND METRICS:
+Only the rank of the positive city matters, so a batch of scores is reduced to
+two counts per query: cities scoring higher, and other cities scoring exactly
+the same. Metrics are averaged over every way those ties could be broken, which
+keeps them deterministic when cities share a vector or a saturated score.
+"""
+def positive_ranks(scores, positive_idx):
+    """(cities scoring higher, other cities tying) with each row's positive city."""
+    positive = scores[np.arange(len(scores)), positive_idx][:, None]
+    higher = (scores > positive).sum(axis=1)
+    tied = (scores == positive).sum(axis=1) - 1
+    return higher, tied
+
+
+def expected_gain(higher, tied, k, gains):
+    """
+    Mean of gains[position] over positions < k, with the positive city equally
+    likely to land anywhere in [higher, higher + tied].
+    """
+    cumulative = np.concatenate([[0.0], np.cumsum(gains)])
+    start = np.minimum(higher, k)
+    stop = np.minimum(higher + tied + 1, k)
+    return (cumulative[stop] - cumulative[start]) / (tied + 1)
+
+
+def ranking_metrics(higher, tied, n_cities, ks=KS):
+    """
+    recall@k, NDCG@k, MRR and the 1-based mean/median rank. With one relevant
+    city per query the ideal DCG is 1, so NDCG@k is the discount of its position.
+    """
+    positions = np.arange(n_cities)
+    metrics = {}
+    for k in ks:
+        metrics[f'recall@{k}'] = float(expected_gain(higher, tied, k, np.ones(n_cities)).mean())
+    for k in ks:
+        metrics[f'ndcg@{k}'] = float(expected_gain(higher, tied, k, 1.0 / np.log2(positions + 2)).mean())
+    metrics['mrr'] = float(expected_gain(higher, tied, n_cities, 1.0 / (positions + 1)).mean())
+
+    rank = higher + tied / 2.0 + 1
+    metrics['mean_rank'] = float(rank.mean())
+    metrics['median_rank'] = float(np.median(rank))
+    return metrics
+
+
+def rank_positives(score_rows, positive_idx, batch_size=1024):
+    """
+    Runs score_rows(start, stop) -> (stop - start, n_cities) scores over all
+    queries in batches; only the rank counts are kept, never the full matrix.
+    """
+    higher, tied = [], []
+    for start in range(0, len(positive_idx), batch_size):
+        stop = min(start + batch_size, len(positive_idx))
+        batch_higher, batch_tied = positive_ranks(score_rows(start, stop), positive_idx[start:stop])
+        higher.append(batch_higher)
+        tied.append(batch_tied)
+    return np.concatenate(higher), np.concatenate(tied)
+
+
+"""
+SCORERS:
+score_rows(start, stop) for each model type.
+"""
+def embedding_scorer(embed_rows, city_vectors):
+    """Two-tower: user vectors of the batch times every city vector."""
+    city_vectors_t = np.ascontiguousarray(np.asarray(city_vectors, dtype=np.float32).T)
+    return lambda start, stop: embed_rows(start, stop) @ city_vectors_t
+
+
+def pair_scorer(predict, query_matrix, city_matrix):
+    """
+    Pointwise: every query of the batch paired with every city, laid out like
+    X_combined in final_elysian_model.py, in one predict call.
+    """
+    city_matrix = np.asarray(city_matrix, dtype=np.float32)
+    n_cities = len(city_matrix)
+
+    def score_rows(start, stop):
+        queries = np.asarray(query_matrix[start:stop], dtype=np.float32)
+        pairs = np.concatenate([np.repeat(queries, n_cities, axis=0), np.tile(city_matrix, (len(queries), 1))], axis=1)
+        return np.asarray(predict(pairs)).reshape(len(queries), n_cities)
+
+    return score_rows
+
+
+def run_tflite(interpreter, inputs):
+    """One invoke() on a whole batch; `inputs` in the model's input order."""
+    details = interpreter.get_input_details()
+    if any(tuple(d['shape']) != x.shape for d, x in zip(details, inputs)):
+        for d, x in zip(details, inputs):
+            interpreter.resize_tensor_input(d['index'], x.shape)
+        interpreter.allocate_tensors()
+    for d, x in zip(details, inputs):
+        interpreter.set_tensor(d['index'], np.ascontiguousarray(x, dtype=np.float32))
+    interpreter.invoke()
+    return interpreter.get_tensor(interpreter.get_output_details()[0]['index'])
+
+
+def load_tflite(path):
+    interpreter = tf.lite.Interpreter(model_path=path)
+    interpreter.allocate_tensors()
+    return interpreter
+
+
+def two_tower_scorer(out_dir, variant, queries_df):
+    """Scorer for a train_two_tower.py output directory, plus the model file used."""
+    import joblib
+    from train_two_tower import encode_users
+
+    le_origin = joblib.load(os.path.join(out_dir, 'le_origin.pkl'))
+    le_fav = joblib.load(os.path.join(out_dir, 'le_fav.pkl'))
+    mlbs = joblib.load(os.path.join(out_dir, 'mlbs.pkl'))
+    user_inputs = encode_users(queries_df, le_origin, le_fav, mlbs)   # [multi_hot, origin, fav], the encoder's order
+
+    path = variant_path(os.path.join(out_dir, 'user_encoder.tflite'), variant)
+    interpreter = load_tflite(path)
+    embed_rows = lambda start, stop: run_tflite(interpreter, [x[start:stop] for x in user_inputs])
+    city_vectors = np.load(os.path.join(out_dir, 'city_vectors.npy'))
+    return embedding_scorer(embed_rows, city_vectors), len(city_vectors), path
+
+
+def pointwise_scorer(model_path, queries_path, queries_df, cities_df):
+    """Scorer for a query-city model (.h5/.keras or .tflite) on the features it was trained on."""
+    from train_streaming import CITY_FEATURES, QUERY_FEATURES
+
+    # Same vocabularies and column selection as final_elysian_model.py (see PairEncoder)
+    query_columns = merged_feature_columns(QUERY_FEATURES, queries_df.columns, cities_df.columns)
+    city_columns = merged_feature_columns(CITY_FEATURES, cities_df.columns, queries_df.columns)
+    encoder = PairEncoder.fit([queries_path], cities_df, query_columns, city_columns)
+
+    if model_path.endswith('.tflite'):
+        interpreter = load_tflite(model_path)
+        predict = lambda pairs: run_tflite(interpreter, [pairs])
+    else:
+        model = tf.keras.models.load_model(model_path)
+        predict = lambda pairs: model.predict(pairs, batch_size=65536, verbose=0)
+    return pair_scorer(predict, encoder.encode_queries(queries_df), encoder.city_matrix), len(cities_df)
+
+
+"""
+SPLITS:
+'val' rebuilds the held-out queries of the training script: train_two_tower.py
+splits the queries with a known positive by train_test_split, train_streaming.py
+hashes query ids (final_elysian_model.py only holds out pairs, so use 'all').
+"""
+def validation_rows(queries_df, positive_idx, two_tower, seed=42, val_percent=20):
+    keep = positive_idx >= 0
+    if not two_tower:
+        return keep & split_mask(queries_df['query_id'], val_percent)
+    rows = np.flatnonzero(keep)
+    mask = np.zeros(len(queries_df), dtype=bool)
+    mask[train_test_split(rows, test_size=0.2, random_state=seed)[1]] = True
+    return mask
+
+
+"""
+REPORT:
+"""
+def file_sha256(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def previous_report(history_path, report):
+    """Last run in the history on the same queries file and split."""
+    if not os.path.exists(history_path):
+        return None
+    previous = None
+    with open(history_path) as f:
+        for line in f:
+            if not line.strip():
+                continue
+            entry = json.loads(line)
+            if entry['queries_sha256'] == report['queries_sha256'] and entry['split'] == report['split']:
+                previous = entry
+    return previous
+
+
+def print_report(report, previous):
+    print(f"\n{report['model']} on {report['n_queries']} queries x {report['n_cities']} cities "
+          f"({report['split']}, {report['n_skipped']} without a known positive) in {report['seconds']:.1f}s")
+    if previous is not None:
+        print(f"Change against {previous['model']} ({previous['created_at']})")
+    for name, value in report['metrics'].items():
+        change = ''
+        if previous is not None and name in previous['metrics']:
+            change = f"{value - previous['metrics'][name]:+.4f}"
+        print(f"{name:>12} {value:>9.4f} {change:>9}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    model = parser.add_mutually_exclusive_group(required=True)
+    model.add_argument('--two-tower', help='train_two_tower.py output directory')
+    model.add_argument('--model', help='query-city model, .h5/.keras or .tflite')
+    parser.add_argument('--variant', default='float32', choices=QUANTIZATIONS, help='two-tower user encoder variant')
+    parser.add_argument('--queries', default='queries.csv')
+    parser.add_argument('--cities', default='cities.csv')
+    parser.add_argument('--split', choices=['all', 'val'], default='all')
+    parser.add_argument('--seed', type=int, default=42, help='seed of the training split for --split val')
+    parser.add_argument('--batch-size', type=int, default=1024, help='queries scored per batch')
+    parser.add_argument('--report', default='ranking_report.json')
+    parser.add_argument('--history', default='ranking_history.jsonl')
+    args = parser.parse_args()
+
+    queries_df = pd.read_csv(args.queries)
+    cities_df = pd.read_csv(args.cities)
+    positive_idx = city_positions(cities_df['city_id'], queries_df['positive_city_id'])
+    if args.split == 'val':
+        rows = validation_rows(queries_df, positive_idx, bool(args.two_tower), seed=args.seed)
+    else:
+        rows = positive_idx >= 0
+    n_skipped = int((positive_idx < 0).sum())
+    queries_df = queries_df[rows].reset_index(drop=True)
+    positive_idx = positive_idx[rows]
+
+    start = time.perf_counter()
+    if args.two_tower:
+        score_rows, n_cities, model_path = two_tower_scorer(args.two_tower, args.variant, queries_df)
+    else:
+        score_rows, n_cities = pointwise_scorer(args.model, args.queries, queries_df, cities_df)
+        model_path = args.model
+    if n_cities != len(cities_df):
+        raise ValueError(f"Model scores {n_cities} cities, {args.cities} has {len(cities_df)}")
+
+    higher, tied = rank_positives(score_rows, positive_idx, args.batch_size)
+    seconds = time.perf_counter() - start
+
+    report = {
+        'model': model_path,
+        'kind': 'two_tower' if args.two_tower else 'pointwise',
+        'model_sha256': file_sha256(model_path) if os.path.isfile(model_path) else None,
+        'queries': args.queries,
+        'queries_sha256': file_sha256(args.queries),
+        'split': args.split,
+        'n_queries': len(positive_idx),
+        'n_skipped': n_skipped,
+        'n_cities': n_cities,
+        'metrics': ranking_metrics(higher, tied, n_cities),
+        'seconds': seconds,
+        'created_at': datetime.datetime.now(datetime.timezone.utc).isoformat(timespec='seconds'),
+    }
+
+    print_report(report, previous_report(args.history, report))
+    with open(args.report, 'w') as f:
+        json.dump(report, f, indent=2)
+    with open(args.history, 'a') as f:
+        f.write(json.dumps(report) + '\n')
+    print(f"\nWrote {args.report}, appended to {args.history}")
+
+
+if __name__ == '__main__':
+    main()
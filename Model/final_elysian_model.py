@@ -14,6 +14,13 @@ from sklearn.preprocessing import LabelEncoder
 from sklearn.model_selection import train_test_split
 import matplotlib.pyplot as plt
 
+from evaluate_ranking import pair_scorer, rank_positives, ranking_metrics
+from recommender_model import build_recommender_model
+from tflite_export import QUANTIZATIONS, convert, variant_path
+from training_data import (
+    build_pairs, city_positions, collect_multi_labels, encode_multi_hot, merged_feature_columns
+)
+
 # Set random seeds for reproducibility
 np.random.seed(42)
 tf.random.set_seed(42)
@@ -93,42 +100,19 @@ This section converts them into a binary vector representation.
 print("\nProcessing multi-label features...")
 
 
-# Get all unique vacation types from both datasets
-all_vacation_types = set()
-# Iterate through both datasets (queries and cities)
-for dataset in [queries_df, cities_df]:
-  # Only proceed if the dataset contains a 'vacation_types' column
-    if 'vacation_types' in dataset.columns:
-      # Loop through each entry in the column
-        for types in dataset['vacation_types']:
-            if pd.notna(types):
-              # Split multiple vacation types separated by '|'
-              # and add them to the set (automatically removes duplicates)
-                all_vacation_types.update(str(types).split('|'))
-
-all_vacation_types = sorted(list(all_vacation_types)) # Convert the set to a sorted list for consistent indexing
+# Get all unique vacation types from both datasets (split on '|', sorted for consistent indexing)
+vacation_sources = [df['vacation_types'] for df in [queries_df, cities_df] if 'vacation_types' in df.columns]
+all_vacation_types = collect_multi_labels(*vacation_sources)
 print(f"Found {len(all_vacation_types)} vacation types: {all_vacation_types}") # Display the number of unique vacation types found and list them
 
-"""
-Convert a list of vacation types into a binary vector representation. Each column represents a vacation type.
-"""
-def encode_vacation_types(types_series, all_types):
-    encoded = np.zeros((len(types_series), len(all_types)))
-    for i, types_str in enumerate(types_series):
-        if pd.notna(types_str):
-            for vacation_type in str(types_str).split('|'):
-                if vacation_type in all_types:
-                    encoded[i, all_types.index(vacation_type)] = 1
-    return encoded
-
 # Encode vacation types for both queries and cities
 if 'vacation_types' in queries_df.columns:
-    vacation_types_encoded_queries = encode_vacation_types(queries_df['vacation_types'], all_vacation_types)
+    vacation_types_encoded_queries = encode_multi_hot(queries_df['vacation_types'], all_vacation_types)
 else:
     vacation_types_encoded_queries = np.zeros((len(queries_df), len(all_vacation_types)))
 
 if 'vacation_types' in cities_df.columns:
-    vacation_types_encoded_cities = encode_vacation_types(cities_df['vacation_types'], all_vacation_types)
+    vacation_types_encoded_cities = encode_multi_hot(cities_df['vacation_types'], all_vacation_types)
 else:
     vacation_types_encoded_cities = np.zeros((len(cities_df), len(all_vacation_types)))
 
@@ -142,54 +126,17 @@ We create:
 # Prepare training data
 print("\n=== Preparing Training Data ===")
 
-# Create query-city pairs with positive examples (from your data)
-positive_pairs = []
-for _, query in queries_df.iterrows():
-    if 'positive_city_id' in query:
-        city_id = query['positive_city_id']
-        city_data = cities_df[cities_df['city_id'] == city_id]
-        if not city_data.empty:
-            positive_pairs.append({
-                'query_id': query['query_id'],
-                'city_id': city_id,
-                'label': 1  # Positive interaction
-            })
-
-positive_pairs_df = pd.DataFrame(positive_pairs)
-print(f"Positive pairs: {len(positive_pairs_df)}")
-
-# Create negative examples (random city not in positive pairs)
-negative_pairs = []
-for _, query in queries_df.iterrows():
-    if 'positive_city_id' in query:
-        positive_city = query['positive_city_id']
-        # Get random cities that are not the positive one
-        available_cities = cities_df[cities_df['city_id'] != positive_city]
-        if len(available_cities) > 0:
-            n_negative = min(2, len(available_cities))
-            negative_cities = available_cities.sample(n=n_negative)['city_id'].tolist()
-            for city_id in negative_cities:
-                negative_pairs.append({
-                    'query_id': query['query_id'],
-                    'city_id': city_id,
-                    'label': 0  # Negative interaction
-                })
-
-negative_pairs_df = pd.DataFrame(negative_pairs)
-print(f"Negative pairs: {len(negative_pairs_df)}")
-
-# Combine positive and negative pairs
-all_pairs_df = pd.concat([positive_pairs_df, negative_pairs_df], ignore_index=True)
-print(f"Total pairs: {len(all_pairs_df)}")
-
-# Merge with query and city features
-training_data = all_pairs_df.merge(
-    queries_df, on='query_id', how='left'
-).merge(
-    cities_df, left_on='city_id', right_on='city_id', how='left', suffixes=('_query', '_city')
-)
+# Every pair is a (query row, city row) index, so no per-query filtering of cities_df.
+# Queries whose positive city is missing from cities.csv get no positive pair.
+positive_city_idx = city_positions(cities_df['city_id'], queries_df['positive_city_id'])
+
+# Negatives: 2 random cities per query, never the positive one (sampled for all queries at once)
+query_rows, city_rows, labels = build_pairs(positive_city_idx, len(cities_df), n_negative=2, seed=42)
 
-print(f"Final training data shape: {training_data.shape}")
+n_positive = int(labels.sum())
+print(f"Positive pairs: {n_positive}")
+print(f"Negative pairs: {len(labels) - n_positive}")
+print(f"Total pairs: {len(labels)}")
 
 
 """
@@ -203,18 +150,18 @@ This is to ensure only available columns are used.
 print("\n=== Preparing Model Inputs ===")
 
 # Define query features (only use ones that exist)
-query_features = []
-for feature in ['origin_country_encoded', 'seasons_encoded', 'budget_encoded',
-                'favorite_country_visited_encoded', 'place_type_encoded']:
-    if feature in training_data.columns:
-        query_features.append(feature)
+query_features = merged_feature_columns(
+    ['origin_country_encoded', 'seasons_encoded', 'budget_encoded',
+     'favorite_country_visited_encoded', 'place_type_encoded'],
+    queries_df.columns, cities_df.columns
+)
 
 # City features (only use ones that exist)
-city_features = []
-for feature in ['country_encoded', 'continent_encoded', 'seasons_encoded',
-                'budget_encoded', 'vibe_encoded']:
-    if feature in training_data.columns:
-        city_features.append(feature)
+city_features = merged_feature_columns(
+    ['country_encoded', 'continent_encoded', 'seasons_encoded',
+     'budget_encoded', 'vibe_encoded'],
+    cities_df.columns, queries_df.columns
+)
 
 print(f"Using query features: {query_features}")
 print(f"Using city features: {city_features}")
@@ -224,19 +171,15 @@ if len(query_features) == 0 or len(city_features) == 0:
     print("Error: No features available for training!")
 else:
     """Convert encoded categorical and vaction features into numpy arrays to serve as neural network input"""
-    X_query_categorical = training_data[query_features].values
-    X_city_categorical = training_data[city_features].values
+    # Gather each pair's rows by index instead of merging/looking up per row
+    X_query_categorical = queries_df[query_features].to_numpy()[query_rows]
+    X_city_categorical = cities_df[city_features].to_numpy()[city_rows]
 
     # Get vacation types encodings for the training pairs
-    X_query_vacation = np.array([vacation_types_encoded_queries[
-        queries_df[queries_df['query_id'] == qid].index[0]
-    ] for qid in training_data['query_id']])
+    X_query_vacation = vacation_types_encoded_queries[query_rows]
+    X_city_vacation = vacation_types_encoded_cities[city_rows]
 
-    X_city_vacation = np.array([vacation_types_encoded_cities[
-        cities_df[cities_df['city_id'] == cid].index[0]
-    ] for cid in training_data['city_id']])
-
-    y = training_data['label'].values
+    y = labels
 
     print(f"Query categorical features shape: {X_query_categorical.shape}")
     print(f"City categorical features shape: {X_city_categorical.shape}")
@@ -250,20 +193,7 @@ else:
     """
     print("\n=== Building Model ===")
 
-    def build_recommender_model(total_input_dim):
-      """Creates a fully-connected neural network for binary classification"""
-      input_layer = layers.Input(shape=(total_input_dim,), name='combined_input')
-
-      x = layers.Dense(64, activation='relu')(input_layer)
-      x = layers.Dense(32, activation='relu')(x)
-      x = layers.Dropout(0.3)(x)
-      x = layers.Dense(16, activation='relu')(x)
-      x = layers.Dropout(0.2)(x)
-      output = layers.Dense(1, activation='sigmoid', name='prediction')(x)
-
-      model = keras.Model(inputs=input_layer, outputs=output)
-      return model
-
+    # build_recommender_model lives in recommender_model.py so train_streaming.py can share it
 
     # Combine query + city + vacation features into one vector
     X_combined = np.concatenate([
@@ -312,6 +242,13 @@ else:
     """
     print("\n=== Recommendation System ===")
 
+    # City half of every query-city input; the same for all queries, so built and saved once
+    city_cat_all = cities_df[city_features].values
+    city_vacation_all = vacation_types_encoded_cities
+    city_feature_matrix = np.concatenate([city_cat_all, city_vacation_all], axis=1)
+    np.save('city_feature_matrix.npy', city_feature_matrix)
+    cities_df.to_csv('cities_encoded1.csv', index=False)
+
     def recommend_cities(query_id, top_k=5):
       """Recommend top K cities for a given query"""
       # Get query data
@@ -321,13 +258,6 @@ else:
       query_cat = np.array([query_data[feature] for feature in query_features])
       query_vacation = vacation_types_encoded_queries[queries_df[queries_df['query_id'] == query_id].index[0]]
 
-      # Prepare all cities for prediction
-      city_cat_all = cities_df[city_features].values
-      city_vacation_all = vacation_types_encoded_cities
-      city_feature_matrix = np.concatenate([city_cat_all, city_vacation_all], axis=1)
-      np.save('city_feature_matrix.npy', city_feature_matrix)
-      cities_df.to_csv('cities_encoded1.csv', index=False)
-
       # Repeat query features for all cities
       query_cat_repeated = np.tile(query_cat, (len(cities_df), 1))
       query_vacation_repeated = np.tile(query_vacation, (len(cities_df), 1))
@@ -375,14 +305,20 @@ else:
     """
     MODEL SAVING AND EXPORT:
     Save model for reuse and convert to TensorFlow Lite for mobile deployment.
+    Besides the float32 model.tflite this writes the post-training quantized
+    variants from tflite_export.py (model_dynamic/_float16/_int8.tflite); int8
+    is calibrated on training pairs built from queries.csv, and a sample of them
+    is kept so convert_model.py can redo the conversion from the .h5 later.
     """
     model.save('travel_recommender_model.h5')
 
-    converter = tf.lite.TFLiteConverter.from_keras_model(model)
-    tflite_model = converter.convert()
+    for quantization in QUANTIZATIONS:
+        converter = tf.lite.TFLiteConverter.from_keras_model(model)
+        with open(variant_path('model.tflite', quantization), 'wb') as f:
+            f.write(convert(converter, quantization, [X_train]))
 
-    with open('model.tflite', 'wb') as f:
-        f.write(tflite_model)
+    sample = np.random.default_rng(42).choice(len(X_train), size=min(500, len(X_train)), replace=False)
+    np.save('representative_inputs.npy', X_train[sample].astype(np.float32))
 
     print(f"\nModel saved as 'travel_recommender_model.h5'")
 
@@ -390,7 +326,7 @@ else:
     MODEL EVALUATION: Evaluate on validation data and show accuracy, precision, and recall.
     """
     print("\n=== Model Evaluation ===")
-    val_predictions = model.predict(val_data, verbose=0)
+    val_predictions = model.predict(X_val, verbose=0)
     val_pred_binary = (val_predictions > 0.5).astype(int).flatten()
 
     from sklearn.metrics import classification_report, confusion_matrix
@@ -398,4 +334,18 @@ else:
     print(classification_report(y_val, val_pred_binary))
 
     print("\nConfusion Matrix:")
-    print(confusion_matrix(y_val, val_pred_binary))
\ No newline at end of file
+    print(confusion_matrix(y_val, val_pred_binary))
+
+    """
+    RANKING EVALUATION: Score every query against every city in batches (see
+    evaluate_ranking.py) and report how high each query's positive city ranks.
+    Run evaluate_ranking.py on the saved model to track this across versions.
+    """
+    print("\n=== Ranking Evaluation ===")
+    has_positive = positive_city_idx >= 0
+    query_matrix = np.concatenate([queries_df[query_features].to_numpy(), vacation_types_encoded_queries], axis=1)
+    score_rows = pair_scorer(lambda pairs: model.predict(pairs, batch_size=65536, verbose=0),
+                             query_matrix[has_positive], city_feature_matrix)
+    higher, tied = rank_positives(score_rows, positive_city_idx[has_positive])
+    for name, value in ranking_metrics(higher, tied, len(cities_df)).items():
+        print(f"{name:>12} {value:.4f}")
\ No newline at end of file
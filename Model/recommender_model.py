@@ -0,0 +1,22 @@
+"""
+Purpose: The query-city matching network, shared by final_elysian_model.py
+(in-memory training) and train_streaming.py (out-of-core training).
+"""
+
+from tensorflow import keras
+from tensorflow.keras import layers
+
+
+def build_recommender_model(total_input_dim):
+  """Creates a fully-connected neural network for binary classification"""
+  input_layer = layers.Input(shape=(total_input_dim,), name='combined_input')
+
+  x = layers.Dense(64, activation='relu')(input_layer)
+  x = layers.Dense(32, activation='relu')(x)
+  x = layers.Dropout(0.3)(x)
+  x = layers.Dense(16, activation='relu')(x)
+  x = layers.Dropout(0.2)(x)
+  output = layers.Dense(1, activation='sigmoid', name='prediction')(x)
+
+  model = keras.Model(inputs=input_layer, outputs=output)
+  return model
@@ -0,0 +1,281 @@
+"""
+Purpose: Out-of-core input pipeline for the query-city model. Queries are read
+from CSV shards in fixed-size chunks; every chunk is encoded and paired with
+freshly sampled negatives inside a parallel tf.data map, so memory depends on
+the chunk size and shuffle buffer rather than on the number of queries.
+Encoded pairs can optionally be cached as .npy shards and replayed on later
+epochs/runs without touching the CSVs again.
+"""
+
+import glob
+import itertools
+import json
+import os
+import time
+
+import numpy as np
+import pandas as pd
+import tensorflow as tf
+from tensorflow import keras
+
+from training_data import build_pairs, city_positions, collect_multi_labels, encode_multi_hot
+
+
+def query_files(pattern):
+    """Sorted list of query CSV shards matching a path or glob pattern."""
+    paths = sorted(glob.glob(pattern))
+    if not paths:
+        raise FileNotFoundError(f"No query files match {pattern}")
+    return paths
+
+
+def iter_query_chunks(paths, chunksize, usecols=None):
+    for path in paths:
+        for chunk in pd.read_csv(path, chunksize=chunksize, usecols=usecols):
+            yield chunk
+
+
+def as_text(values):
+    # Like astype(str) on older pandas: missing values become the label 'nan'
+    return values.fillna('nan').astype(str)
+
+
+def encode_labels(values, classes):
+    """Same codes as a LabelEncoder fitted on `classes` (values compared as text)."""
+    codes = pd.Index(classes).get_indexer(as_text(values))
+    if (codes < 0).any():
+        raise ValueError("y contains previously unseen labels")
+    return codes
+
+
+def split_mask(query_ids, val_percent):
+    """True for queries in the validation split. Stable across runs and chunk sizes."""
+    bucket = pd.util.hash_pandas_object(query_ids, index=False).to_numpy() % 100
+    return bucket < val_percent
+
+
+"""
+PAIR ENCODER:
+Holds everything needed to turn a chunk of raw query rows into model inputs:
+the label vocabularies (fitted with one streaming pass), the vacation types,
+and the pre-encoded city feature matrix.
+"""
+class PairEncoder:
+    def __init__(self, query_columns, vocabularies, vacation_types, city_ids, city_matrix,
+                 n_negative=2, seed=42, val_percent=20):
+        self.query_columns = query_columns
+        self.vocabularies = vocabularies
+        self.vacation_types = vacation_types
+        self.city_ids = np.asarray(city_ids)
+        self.city_matrix = np.asarray(city_matrix, dtype=np.float32)
+        self.n_negative = n_negative
+        self.seed = seed
+        self.val_percent = val_percent
+
+    @classmethod
+    def fit(cls, paths, cities_df, query_columns, city_columns, chunksize=100_000, **kwargs):
+        """One pass over the query shards to collect label vocabularies; cities.csv is small and read whole."""
+        seen = {column: set() for column in query_columns}
+        combos = set()
+        for chunk in iter_query_chunks(paths, chunksize, usecols=query_columns + ['vacation_types']):
+            for column in query_columns:
+                seen[column].update(as_text(chunk[column]).unique())
+            combos.update(chunk['vacation_types'].dropna().astype(str).unique())
+
+        vocabularies = {column: sorted(values) for column, values in seen.items()}
+        vacation_types = collect_multi_labels(pd.Series(sorted(combos)), cities_df['vacation_types'])
+
+        city_categorical = np.stack([
+            encode_labels(cities_df[column], sorted(as_text(cities_df[column]).unique()))
+            for column in city_columns
+        ], axis=1)
+        city_matrix = np.concatenate([
+            city_categorical, encode_multi_hot(cities_df['vacation_types'], vacation_types)
+        ], axis=1)
+
+        return cls(query_columns, vocabularies, vacation_types, cities_df['city_id'], city_matrix, **kwargs)
+
+    @property
+    def usecols(self):
+        return ['query_id'] + self.query_columns + ['vacation_types', 'positive_city_id']
+
+    @property
+    def feature_dim(self):
+        return len(self.query_columns) + len(self.vacation_types) + self.city_matrix.shape[1]
+
+    def config(self):
+        return {
+            'query_columns': self.query_columns,
+            'vocabularies': self.vocabularies,
+            'vacation_types': self.vacation_types,
+            'n_negative': self.n_negative,
+            'seed': self.seed,
+            'val_percent': self.val_percent,
+        }
+
+    def save(self, path):
+        with open(path, 'w') as f:
+            json.dump(self.config(), f, indent=2)
+
+    def encode_queries(self, chunk):
+        """Query half of the model input for each row of `chunk` (categorical codes, then vacation types)."""
+        query_categorical = np.stack(
+            [encode_labels(chunk[column], self.vocabularies[column]) for column in self.query_columns], axis=1
+        ).reshape(len(chunk), len(self.query_columns))
+        return np.concatenate([
+            query_categorical, encode_multi_hot(chunk['vacation_types'], self.vacation_types)
+        ], axis=1)
+
+    def encode(self, chunk, split='train', seed=()):
+        """
+        (X, y) for one chunk of raw query rows: the query features followed by
+        the city features, exactly like X_combined in final_elysian_model.py.
+        `seed` is mixed into the negative sampling seed so each chunk (and
+        epoch) draws different negatives, reproducibly.
+        """
+        is_val = split_mask(chunk['query_id'], self.val_percent)
+        chunk = chunk[is_val if split == 'val' else ~is_val]
+
+        query_matrix = self.encode_queries(chunk)
+        positive_idx = city_positions(self.city_ids, chunk['positive_city_id'])
+        query_rows, city_rows, labels = build_pairs(
+            positive_idx, len(self.city_ids), self.n_negative, seed=[self.seed, *seed]
+        )
+
+        X = np.concatenate([query_matrix[query_rows], self.city_matrix[city_rows]], axis=1)
+        return X.astype(np.float32), labels.astype(np.float32)
+
+
+"""
+TF.DATA PIPELINES:
+Raw chunks come out of a Python generator as string columns, get encoded in a
+parallel map, and are then split into examples, shuffled through a bounded
+buffer, batched and prefetched.
+"""
+def _encoded_chunks(encoder, paths, chunksize, split):
+    columns = encoder.usecols
+    epochs = itertools.count()
+
+    def raw_chunks():
+        epoch = next(epochs)
+        for chunk_no, chunk in enumerate(iter_query_chunks(paths, chunksize, usecols=columns)):
+            yield (epoch, chunk_no) + tuple(as_text(chunk[column]).to_numpy() for column in columns)
+
+    signature = (tf.TensorSpec((), tf.int64), tf.TensorSpec((), tf.int64)) + tuple(
+        tf.TensorSpec((None,), tf.string) for _ in columns
+    )
+
+    def encode(epoch, chunk_no, *values):
+        chunk = pd.DataFrame({
+            column: pd.Series(v).str.decode('utf-8') for column, v in zip(columns, values)
+        })
+        # Missing values travel as 'nan'; restore real NaNs for the multi-hot encoder
+        chunk['vacation_types'] = chunk['vacation_types'].replace('nan', np.nan)
+        return encoder.encode(chunk, split=split, seed=(int(epoch), int(chunk_no)))
+
+    def tf_encode(epoch, chunk_no, *values):
+        X, y = tf.numpy_function(encode, (epoch, chunk_no) + values, (tf.float32, tf.float32))
+        X.set_shape((None, encoder.feature_dim))
+        y.set_shape((None,))
+        return X, y
+
+    dataset = tf.data.Dataset.from_generator(raw_chunks, output_signature=signature)
+    return dataset.map(tf_encode, num_parallel_calls=tf.data.AUTOTUNE, deterministic=True)
+
+
+def _examples_to_batches(dataset, batch_size, shuffle_buffer):
+    dataset = dataset.unbatch()
+    if shuffle_buffer:
+        dataset = dataset.shuffle(shuffle_buffer)
+    return dataset.batch(batch_size).prefetch(tf.data.AUTOTUNE)
+
+
+def stream_dataset(encoder, paths, chunksize, batch_size, split='train', shuffle_buffer=100_000):
+    """Re-reads and re-encodes the CSVs every epoch, with new negatives each time."""
+    return _examples_to_batches(_encoded_chunks(encoder, paths, chunksize, split), batch_size, shuffle_buffer)
+
+
+def _cache_key(encoder, paths, chunksize, split):
+    sources = [[os.path.abspath(p), os.path.getsize(p), int(os.path.getmtime(p))] for p in paths]
+    return {'sources': sources, 'chunksize': chunksize, 'split': split, 'encoder': encoder.config()}
+
+
+def write_shards(encoder, paths, chunksize, cache_dir, split='train'):
+    """
+    Encode every chunk once and save it as <split>-NNNNN.X.npy / .y.npy.
+    <split>-meta.json is written last, so a partial cache is never reused.
+    """
+    os.makedirs(cache_dir, exist_ok=True)
+    meta_path = os.path.join(cache_dir, f'{split}-meta.json')
+    key = _cache_key(encoder, paths, chunksize, split)
+
+    if os.path.exists(meta_path):
+        with open(meta_path) as f:
+            meta = json.load(f)
+        if meta['key'] == key:
+            return meta
+        os.remove(meta_path)
+
+    shards = []
+    examples = 0
+    for shard_no, (X, y) in enumerate(_encoded_chunks(encoder, paths, chunksize, split).as_numpy_iterator()):
+        name = f'{split}-{shard_no:05d}'
+        np.save(os.path.join(cache_dir, name + '.X.npy'), X)
+        np.save(os.path.join(cache_dir, name + '.y.npy'), y)
+        shards.append(name)
+        examples += len(y)
+
+    meta = {'key': key, 'shards': shards, 'examples': examples}
+    with open(meta_path, 'w') as f:
+        json.dump(meta, f)
+    return meta
+
+
+def cached_dataset(encoder, paths, chunksize, batch_size, cache_dir, split='train', shuffle_buffer=100_000):
+    """Like stream_dataset, but replays the .npy shards (negatives are fixed when the cache is built)."""
+    meta = write_shards(encoder, paths, chunksize, cache_dir, split)
+    prefixes = [os.path.join(cache_dir, name) for name in meta['shards']]
+
+    def load(prefix):
+        prefix = prefix.decode('utf-8')
+        return np.load(prefix + '.X.npy'), np.load(prefix + '.y.npy')
+
+    def tf_load(prefix):
+        X, y = tf.numpy_function(load, (prefix,), (tf.float32, tf.float32))
+        X.set_shape((None, encoder.feature_dim))
+        y.set_shape((None,))
+        return X, y
+
+    dataset = tf.data.Dataset.from_tensor_slices(prefixes)
+    if shuffle_buffer:
+        dataset = dataset.shuffle(len(prefixes))
+    dataset = dataset.map(tf_load, num_parallel_calls=tf.data.AUTOTUNE)
+    return _examples_to_batches(dataset, batch_size, shuffle_buffer)
+
+
+"""
+THROUGHPUT LOGGING:
+"""
+class ThroughputLogger(keras.callbacks.Callback):
+    """Prints training examples/sec every `every` batches and at the end of each epoch."""
+
+    def __init__(self, batch_size, every=500):
+        super().__init__()
+        self.batch_size = batch_size
+        self.every = every
+
+    def on_epoch_begin(self, epoch, logs=None):
+        self.epoch = epoch
+        self.batches = 0
+        self.start = time.perf_counter()
+
+    def on_train_batch_end(self, batch, logs=None):
+        self.batches += 1
+        if self.every and self.batches % self.every == 0:
+            print(f"\n[epoch {self.epoch + 1}] {self._rate():,.0f} examples/sec")
+
+    def on_epoch_end(self, epoch, logs=None):
+        print(f"\n[epoch {epoch + 1}] {self.batches * self.batch_size:,} examples, {self._rate():,.0f} examples/sec")
+
+    def _rate(self):
+        return self.batches * self.batch_size / max(time.perf_counter() - self.start, 1e-9)
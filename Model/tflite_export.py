@@ -0,0 +1,61 @@
+"""
+Purpose: TFLite conversion settings shared by the training scripts, so every
+exported model can also ship post-training quantized variants:
+
+    float32   default converter settings (what the backend has always loaded)
+    dynamic   int8 weights, float activations; no calibration data needed
+    float16   float16 weights, computed in float32 on CPU
+    int8      int8 weights and activations, calibrated on a representative
+              sample of real inputs; inputs and outputs stay float32 so the
+              backend feeds it exactly like the float32 model
+
+Variants are written next to the float32 file as <name>_<variant>.tflite.
+"""
+
+import os
+
+import numpy as np
+import tensorflow as tf
+
+QUANTIZATIONS = ['float32', 'dynamic', 'float16', 'int8']
+
+
+def variant_path(path, quantization):
+    """model.tflite -> model_int8.tflite (float32 keeps the original name)."""
+    if quantization == 'float32':
+        return path
+    root, ext = os.path.splitext(path)
+    return f'{root}_{quantization}{ext}'
+
+
+def representative_dataset(inputs, samples=500, seed=42):
+    """
+    Calibration generator for int8: `samples` random rows of the model inputs
+    (a list of arrays in model input order), one row per step.
+    """
+    n = len(inputs[0])
+    rows = np.random.default_rng(seed).choice(n, size=min(samples, n), replace=False)
+
+    def generate():
+        for i in rows:
+            yield [np.asarray(x[i:i + 1], dtype=np.float32) for x in inputs]
+
+    return generate
+
+
+def convert(converter, quantization='float32', representative_inputs=None):
+    """Configure `converter` for one of QUANTIZATIONS and return the model bytes."""
+    if quantization not in QUANTIZATIONS:
+        raise ValueError(f"Unknown quantization {quantization!r}; expected one of {QUANTIZATIONS}")
+
+    if quantization != 'float32':
+        converter.optimizations = [tf.lite.Optimize.DEFAULT]
+    if quantization == 'float16':
+        converter.target_spec.supported_types = [tf.float16]
+    if quantization == 'int8':
+        if representative_inputs is None:
+            raise ValueError("int8 quantization needs representative inputs")
+        converter.representative_dataset = representative_dataset(representative_inputs)
+        converter.target_spec.supported_ops = [tf.lite.OpsSet.TFLITE_BUILTINS_INT8]
+
+    return converter.convert()
@@ -0,0 +1,102 @@
+"""
+Purpose: Train the query-city model from query CSV shards that do not fit in
+memory, using the streaming tf.data pipeline in streaming_data.py. It trains
+the same network on the same features as final_elysian_model.py.
+
+    python train_streaming.py --queries 'shards/queries-*.csv' --cities cities.csv
+    python train_streaming.py --queries queries.csv --cache-dir pair_cache --epochs 5
+    python train_streaming.py --quantize dynamic float16 int8   # + quantized .tflite variants
+
+int8 is calibrated on training pairs from the first chunk of the queries;
+they are also saved as <out>_representative_inputs.npy for convert_model.py.
+"""
+
+import argparse
+
+import numpy as np
+import pandas as pd
+import tensorflow as tf
+
+from recommender_model import build_recommender_model
+from streaming_data import PairEncoder, ThroughputLogger, cached_dataset, iter_query_chunks, query_files, stream_dataset
+from tflite_export import QUANTIZATIONS, convert, variant_path
+from training_data import merged_feature_columns
+
+QUERY_FEATURES = ['origin_country', 'seasons', 'budget', 'favorite_country_visited', 'place_type']
+CITY_FEATURES = ['country', 'continent', 'seasons', 'budget', 'vibe']
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--queries', default='queries.csv', help='CSV file or glob of CSV shards')
+    parser.add_argument('--cities', default='cities.csv')
+    parser.add_argument('--chunksize', type=int, default=100_000, help='query rows per chunk')
+    parser.add_argument('--batch-size', type=int, default=256)
+    parser.add_argument('--epochs', type=int, default=10)
+    parser.add_argument('--shuffle-buffer', type=int, default=100_000, help='examples held for shuffling')
+    parser.add_argument('--negatives', type=int, default=2, help='negative cities per query')
+    parser.add_argument('--val-percent', type=int, default=20)
+    parser.add_argument('--cache-dir', default=None, help='cache encoded pairs as .npy shards here')
+    parser.add_argument('--log-every', type=int, default=500, help='batches between throughput logs')
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--out', default='travel_recommender_model')
+    parser.add_argument('--quantize', nargs='*', default=[], choices=QUANTIZATIONS[1:],
+                        help='also write quantized models, e.g. --quantize dynamic float16 int8')
+    args = parser.parse_args()
+
+    tf.random.set_seed(args.seed)
+    paths = query_files(args.queries)
+    cities_df = pd.read_csv(args.cities)
+    header = pd.read_csv(paths[0], nrows=0).columns
+
+    # Same feature selection as final_elysian_model.py
+    query_columns = merged_feature_columns(QUERY_FEATURES, header, cities_df.columns)
+    city_columns = merged_feature_columns(CITY_FEATURES, cities_df.columns, header)
+    print(f"Using query features: {query_columns}")
+    print(f"Using city features: {city_columns}")
+
+    print("\n=== Fitting vocabularies ===")
+    encoder = PairEncoder.fit(
+        paths, cities_df, query_columns, city_columns, chunksize=args.chunksize,
+        n_negative=args.negatives, seed=args.seed, val_percent=args.val_percent,
+    )
+    encoder.save(f'{args.out}_features.json')
+    print(f"Feature dim: {encoder.feature_dim}")
+
+    def dataset(split, shuffle_buffer):
+        if args.cache_dir:
+            return cached_dataset(encoder, paths, args.chunksize, args.batch_size, args.cache_dir,
+                                  split=split, shuffle_buffer=shuffle_buffer)
+        return stream_dataset(encoder, paths, args.chunksize, args.batch_size,
+                              split=split, shuffle_buffer=shuffle_buffer)
+
+    train_ds = dataset('train', args.shuffle_buffer)
+    val_ds = dataset('val', 0) if args.val_percent else None
+
+    print("\n=== Training ===")
+    model = build_recommender_model(total_input_dim=encoder.feature_dim)
+    model.compile(optimizer='adam', loss='binary_crossentropy', metrics=['accuracy'])
+    model.fit(train_ds, validation_data=val_ds, epochs=args.epochs,
+              callbacks=[ThroughputLogger(args.batch_size, every=args.log_every)], verbose=2)
+
+    model.save(f'{args.out}.h5')
+
+    representative = None
+    if 'int8' in args.quantize:
+        first_chunk = next(iter_query_chunks(paths, args.chunksize, usecols=encoder.usecols))
+        X_sample = encoder.encode(first_chunk, split='train')[0]
+        sample = np.random.default_rng(args.seed).choice(len(X_sample), size=min(500, len(X_sample)), replace=False)
+        representative = [X_sample[sample]]
+        np.save(f'{args.out}_representative_inputs.npy', representative[0])
+
+    for quantization in ['float32'] + args.quantize:
+        converter = tf.lite.TFLiteConverter.from_keras_model(model)
+        path = variant_path(f'{args.out}.tflite', quantization)
+        with open(path, 'wb') as f:
+            f.write(convert(converter, quantization, representative))
+        print(f"Wrote {path}")
+    print(f"\nModel saved as '{args.out}.h5'")
+
+
+if __name__ == '__main__':
+    main()
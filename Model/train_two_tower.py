@@ -0,0 +1,260 @@
+"""
+Purpose: Two-tower version of the recommender. A user tower maps a query
+(origin, favorite country, multi-hot preferences) to a vector, a city tower
+maps each city to a vector in the same space, and the score is their dot
+product. Training is a softmax over the whole city catalog with the query's
+positive city as the label.
+
+Unlike final_elysian_model.py this writes exactly the files the backend serves
+from, so retrieval stays one matrix-vector product:
+
+    user_encoder.tflite   user tower, inputs [multi_hot, origin, fav]
+                          (+ user_encoder_<variant>.tflite with --quantize, see tflite_export.py)
+    city_vectors.npy      city tower output for every row of cities.csv
+    le_origin.pkl, le_fav.pkl, mlbs.pkl, label_mappings.json, vacation_types.json
+
+    python train_two_tower.py --queries queries.csv --cities cities.csv --out-dir two_tower
+    cd ../Elysian/elysian-backend && python build_bundle.py --source ../../Model/two_tower --activate
+"""
+
+import argparse
+import json
+import os
+import tempfile
+
+import joblib
+import numpy as np
+import pandas as pd
+import tensorflow as tf
+from tensorflow import keras
+from tensorflow.keras import layers
+from sklearn.model_selection import train_test_split
+from sklearn.preprocessing import LabelEncoder, MultiLabelBinarizer
+
+from tflite_export import QUANTIZATIONS, convert, variant_path
+from training_data import city_positions
+
+# Multi-hot blocks in the order the backend feeds them (encoding.MULTI_HOT_FEATURES)
+USER_MULTI_HOT = ['vacation_types', 'seasons', 'budget', 'place_type']
+CITY_MULTI_HOT = ['vacation_types', 'seasons', 'budget', 'vibe']
+
+# Which files each binarizer is fitted on
+MULTI_HOT_SOURCES = {
+    'vacation_types': ['queries', 'cities'],
+    'seasons': ['queries', 'cities'],
+    'budget': ['queries', 'cities'],
+    'place_type': ['queries'],
+    'vibe': ['cities'],
+}
+
+
+def split_labels(series):
+    return [str(v).split('|') if pd.notna(v) else [] for v in series]
+
+
+"""
+ENCODERS:
+Fitted the same way as the pickles the backend already loads: the label
+encoders see the raw columns (so a missing favorite country is its own NaN
+class) and the binarizers see the '|'-split labels.
+"""
+def fit_encoders(queries_df, cities_df):
+    frames = {'queries': queries_df, 'cities': cities_df}
+    le_origin = LabelEncoder().fit(queries_df['origin_country'])
+    le_fav = LabelEncoder().fit(queries_df['favorite_country_visited'])
+
+    mlbs = {}
+    for feature, sources in MULTI_HOT_SOURCES.items():
+        rows = [labels for source in sources for labels in split_labels(frames[source][feature])]
+        mlbs[feature] = MultiLabelBinarizer().fit(rows)
+
+    return le_origin, le_fav, mlbs
+
+
+def encode_users(queries_df, le_origin, le_fav, mlbs):
+    """Same arrays the backend builds in encoding.encode_user_inputs_batch."""
+    origin = le_origin.transform(queries_df['origin_country']).astype(np.float32).reshape(-1, 1)
+    fav = le_fav.transform(queries_df['favorite_country_visited']).astype(np.float32).reshape(-1, 1)
+    multi_hot = np.concatenate([
+        mlbs[feature].transform(split_labels(queries_df[feature])) for feature in USER_MULTI_HOT
+    ], axis=1).astype(np.float32)
+    return multi_hot, origin, fav
+
+
+def encode_cities(cities_df, mlbs):
+    country = LabelEncoder().fit_transform(cities_df['country']).astype(np.float32).reshape(-1, 1)
+    continent = LabelEncoder().fit_transform(cities_df['continent']).astype(np.float32).reshape(-1, 1)
+    multi_hot = np.concatenate([
+        mlbs[feature].transform(split_labels(cities_df[feature])) for feature in CITY_MULTI_HOT
+    ], axis=1).astype(np.float32)
+    return multi_hot, country, continent
+
+
+def label_mappings(queries_df, le_origin, le_fav):
+    """label_mappings.json as read by the backend's SERVING_MODE=lite."""
+    def combos(column):
+        return sorted(queries_df[column].dropna().astype(str).unique().tolist())
+
+    mappings = {
+        'origin_country': [str(c) for c in le_origin.classes_],
+        'seasons': combos('seasons'),
+        'budget': combos('budget'),
+        'favorite_country_visited': [str(c) for c in le_fav.classes_],
+        'place_type': combos('place_type'),
+    }
+    if 'travel_distance' in queries_df.columns:
+        mappings['travel_distance'] = combos('travel_distance')
+    return mappings
+
+
+"""
+TOWERS:
+"""
+def build_tower(name, multi_dim, vocab_a, vocab_b, dim, embed_dim=8):
+    """
+    Inputs [multi_hot, a, b]: a multi-hot block plus two categorical indices
+    (fed as float32, like the existing user encoder).
+    """
+    multi_hot = layers.Input(shape=(multi_dim,), name=f'{name}_multi_hot')
+    a = layers.Input(shape=(1,), name=f'{name}_a')
+    b = layers.Input(shape=(1,), name=f'{name}_b')
+
+    a_vec = layers.Flatten()(layers.Embedding(vocab_a, embed_dim)(a))
+    b_vec = layers.Flatten()(layers.Embedding(vocab_b, embed_dim)(b))
+
+    x = layers.Concatenate()([multi_hot, a_vec, b_vec])
+    x = layers.Dense(64, activation='relu')(x)
+    x = layers.Dense(64, activation='relu')(x)
+    output = layers.Dense(dim, name=f'{name}_embedding')(x)
+
+    return keras.Model(inputs=[multi_hot, a, b], outputs=output, name=f'{name}_tower')
+
+
+class CatalogScores(layers.Layer):
+    """Dot product of each user vector with every city vector (city tower run on the full catalog)."""
+
+    def __init__(self, city_tower, city_inputs, **kwargs):
+        super().__init__(**kwargs)
+        self.city_tower = city_tower
+        self.city_inputs = [tf.constant(x) for x in city_inputs]
+
+    def call(self, user_vectors):
+        city_vectors = self.city_tower(self.city_inputs)
+        return tf.matmul(user_vectors, city_vectors, transpose_b=True)
+
+
+def export_user_encoder(user_tower, path, quantizations=('float32',), representative_inputs=None):
+    """
+    The backend addresses the encoder inputs by position (U_MULTI_IDX=0,
+    U_ORIGIN_IDX=1, U_FAV_IDX=2). from_keras_model does not keep the Keras input
+    order, so export a SavedModel endpoint with an explicit signature and convert that.
+    Each entry of `quantizations` is written to tflite_export.variant_path(path, ...).
+    """
+    multi_dim = user_tower.inputs[0].shape[1]
+    names = ['multi_hot', 'origin', 'fav']
+
+    archive = keras.export.ExportArchive()
+    archive.track(user_tower)
+    archive.add_endpoint(
+        'serve',
+        lambda multi_hot, origin, fav: user_tower([multi_hot, origin, fav]),
+        input_signature=[
+            tf.TensorSpec([None, multi_dim], tf.float32, name='multi_hot'),
+            tf.TensorSpec([None, 1], tf.float32, name='origin'),
+            tf.TensorSpec([None, 1], tf.float32, name='fav'),
+        ],
+    )
+
+    models = {}
+    with tempfile.TemporaryDirectory() as saved_model_dir:
+        archive.write_out(saved_model_dir)
+        for quantization in quantizations:
+            converter = tf.lite.TFLiteConverter.from_saved_model(saved_model_dir, signature_keys=['serve'])
+            models[quantization] = convert(converter, quantization, representative_inputs)
+
+    for quantization, tflite_model in models.items():
+        interpreter = tf.lite.Interpreter(model_content=tflite_model)
+        found = [d['name'] for d in interpreter.get_input_details()]
+        if [name for name, d in zip(names, found) if name not in d] or len(found) != len(names):
+            raise RuntimeError(f"Unexpected {quantization} user encoder inputs {found}; expected {names}")
+
+        with open(variant_path(path, quantization), 'wb') as f:
+            f.write(tflite_model)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--queries', default='queries.csv')
+    parser.add_argument('--cities', default='cities.csv')
+    parser.add_argument('--out-dir', default='two_tower')
+    parser.add_argument('--dim', type=int, default=32, help='embedding size')
+    parser.add_argument('--epochs', type=int, default=20)
+    parser.add_argument('--batch-size', type=int, default=256)
+    parser.add_argument('--temperature', type=float, default=1.0)
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--quantize', nargs='*', default=[], choices=QUANTIZATIONS[1:],
+                        help='also write quantized user encoders, e.g. --quantize dynamic float16 int8')
+    args = parser.parse_args()
+
+    # Same seed -> same weights -> byte-identical artifacts
+    keras.utils.set_random_seed(args.seed)
+    tf.config.experimental.enable_op_determinism()
+
+    queries_df = pd.read_csv(args.queries)
+    cities_df = pd.read_csv(args.cities)
+
+    print("\n=== Encoding ===")
+    le_origin, le_fav, mlbs = fit_encoders(queries_df, cities_df)
+    user_inputs = encode_users(queries_df, le_origin, le_fav, mlbs)
+    city_inputs = encode_cities(cities_df, mlbs)
+
+    # Label = row of the positive city in cities.csv; queries pointing at unknown cities are dropped
+    labels = city_positions(cities_df['city_id'], queries_df['positive_city_id'])
+    keep = labels >= 0
+    user_inputs = [x[keep] for x in user_inputs]
+    labels = labels[keep]
+    print(f"Training queries: {len(labels)}, cities: {len(cities_df)}")
+
+    split = train_test_split(*user_inputs, labels, test_size=0.2, random_state=args.seed)
+    train_x, val_x = split[0:6:2], split[1:6:2]
+    train_y, val_y = split[6], split[7]
+
+    print("\n=== Training ===")
+    user_tower = build_tower('user', user_inputs[0].shape[1], len(le_origin.classes_), len(le_fav.classes_), args.dim)
+    city_tower = build_tower(
+        'city', city_inputs[0].shape[1],
+        int(city_inputs[1].max()) + 1, int(city_inputs[2].max()) + 1, args.dim,
+    )
+
+    user_vectors = user_tower(user_tower.inputs)
+    logits = CatalogScores(city_tower, city_inputs)(user_vectors) / args.temperature
+    model = keras.Model(inputs=user_tower.inputs, outputs=logits)
+    model.compile(
+        optimizer='adam',
+        loss=keras.losses.SparseCategoricalCrossentropy(from_logits=True),
+        metrics=[keras.metrics.SparseTopKCategoricalAccuracy(k=10, name='recall_at_10')],
+    )
+    model.fit(train_x, train_y, validation_data=(val_x, val_y),
+              epochs=args.epochs, batch_size=args.batch_size, verbose=2)
+
+    print("\n=== Exporting ===")
+    os.makedirs(args.out_dir, exist_ok=True)
+    city_vectors = city_tower.predict(list(city_inputs), verbose=0).astype(np.float32)
+    np.save(os.path.join(args.out_dir, 'city_vectors.npy'), city_vectors)
+    # int8 is calibrated on training queries, i.e. real rows of queries.csv
+    export_user_encoder(user_tower, os.path.join(args.out_dir, 'user_encoder.tflite'),
+                        quantizations=['float32'] + args.quantize, representative_inputs=train_x)
+
+    joblib.dump(le_origin, os.path.join(args.out_dir, 'le_origin.pkl'))
+    joblib.dump(le_fav, os.path.join(args.out_dir, 'le_fav.pkl'))
+    joblib.dump(mlbs, os.path.join(args.out_dir, 'mlbs.pkl'))
+    with open(os.path.join(args.out_dir, 'label_mappings.json'), 'w') as f:
+        json.dump(label_mappings(queries_df, le_origin, le_fav), f, indent=2)
+    with open(os.path.join(args.out_dir, 'vacation_types.json'), 'w') as f:
+        json.dump(list(mlbs['vacation_types'].classes_), f, indent=2)
+
+    print(f"Wrote serving artifacts to {args.out_dir}/ (city_vectors {city_vectors.shape})")
+
+
+if __name__ == '__main__':
+    main()
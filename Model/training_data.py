@@ -0,0 +1,111 @@
+"""
+Purpose: Vectorized helpers for building the query-city training pairs used by
+final_elysian_model.py. Everything works on integer index arrays instead of
+iterrows()/boolean-mask lookups, so building the data is linear in the number
+of queries and stays practical for millions of rows.
+"""
+
+import numpy as np
+import pandas as pd
+
+
+"""
+MULTI-LABEL ENCODING:
+Columns like "vacation_types" hold '|'-separated values ("Beach|Nature").
+"""
+def collect_multi_labels(*series_list, sep='|'):
+    """Sorted list of every label that appears in any of the given columns."""
+    labels = set()
+    for series in series_list:
+        for combo in series.dropna().astype(str).unique():
+            labels.update(combo.split(sep))
+    return sorted(labels)
+
+
+def encode_multi_hot(series, classes, sep='|'):
+    """
+    Binary matrix (len(series), len(classes)) with one column per class.
+    Only the distinct combos are run through str.get_dummies and the rows are
+    then gathered by combo code, so the cost barely grows with the row count.
+    Missing values and labels outside `classes` encode as zeros.
+    """
+    codes, combos = pd.factorize(series)
+    dummies = pd.Series(combos.astype(str)).str.get_dummies(sep=sep)
+    combo_matrix = dummies.reindex(columns=classes, fill_value=0).to_numpy(dtype=np.float64)
+
+    # Append an all-zero row for missing values (factorize gives them code -1)
+    combo_matrix = np.vstack([combo_matrix, np.zeros((1, len(classes)))])
+    return combo_matrix[codes]
+
+
+"""
+TRAINING PAIRS:
+Positives are (query, the city it liked); negatives are random cities other
+than the positive one, drawn for every query in one batch.
+"""
+def city_positions(city_ids, lookup_ids):
+    """Row index in `city_ids` for each of `lookup_ids`, or -1 when unknown."""
+    return pd.Index(city_ids).get_indexer(lookup_ids)
+
+
+def sample_negatives(positive_idx, n_cities, n_negative, rng):
+    """
+    (n_queries, n_negative) city indices, distinct within a row and never the
+    row's positive city (queries with an unknown positive, -1, can draw any city).
+
+    Each draw samples from the cities still available and shifts the value past
+    every already-excluded index in ascending order, which is an exact uniform
+    draw without replacement and needs no rejection loop.
+    """
+    positive_idx = np.asarray(positive_idx, dtype=np.int64)
+    n = len(positive_idx)
+    has_positive = positive_idx >= 0
+    n_available = n_cities - has_positive.astype(np.int64)
+    n_negative = int(min(n_negative, n_available.min())) if n else n_negative
+
+    # Unknown positives get a sentinel that never shifts anything
+    excluded = np.where(has_positive, positive_idx, n_cities)[:, None]
+    negatives = np.empty((n, n_negative), dtype=np.int64)
+
+    for j in range(n_negative):
+        draw = rng.integers(0, n_available - j)
+        for column in np.sort(excluded, axis=1).T:
+            draw += draw >= column
+        negatives[:, j] = draw
+        excluded = np.concatenate([excluded, draw[:, None]], axis=1)
+
+    return negatives
+
+
+def build_pairs(positive_idx, n_cities, n_negative=2, seed=42):
+    """
+    Returns (query_rows, city_rows, labels) as aligned arrays, laid out like the
+    original loops: every positive pair in query order, then each query's
+    negatives in query order.
+    """
+    positive_idx = np.asarray(positive_idx, dtype=np.int64)
+    rng = np.random.default_rng(seed)
+
+    pos_queries = np.flatnonzero(positive_idx >= 0)
+    pos_cities = positive_idx[pos_queries]
+
+    negatives = sample_negatives(positive_idx, n_cities, n_negative, rng)
+    neg_queries = np.repeat(np.arange(len(positive_idx)), negatives.shape[1])
+    neg_cities = negatives.ravel()
+
+    query_rows = np.concatenate([pos_queries, neg_queries])
+    city_rows = np.concatenate([pos_cities, neg_cities])
+    labels = np.concatenate([
+        np.ones(len(pos_queries), dtype=np.int64),
+        np.zeros(len(neg_queries), dtype=np.int64),
+    ])
+    return query_rows, city_rows, labels
+
+
+def merged_feature_columns(candidates, own_columns, other_columns):
+    """
+    The model was trained on the columns of queries.merge(cities) that kept
+    their plain name; a column present in both frames gets suffixed by the
+    merge and was never used. Keep that selection so the features don't change.
+    """
+    return [c for c in candidates if c in own_columns and c not in other_columns]